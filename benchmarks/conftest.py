@@ -0,0 +1,42 @@
+# standard libraries
+import json
+
+# third party libraries
+import pytest
+
+# local libraries
+from fake_api import FakeAPI
+
+
+
+@pytest.fixture
+def api(tmp_path):
+    """ a FakeAPI whose config folder holds a superstem_customisation.json pointing into tmp_path """
+    configuration_location = tmp_path / "config"
+    configuration_location.mkdir()
+    settings = {"data_base_directory": str(tmp_path / "data"),
+                "export_base_directory": str(tmp_path / "export"),
+                "default_project": str(tmp_path / "data" / "Default_Raw" / "Default.nsproj"),
+                "superstem_site": "SuperSTEM",
+                "superstem_instrument": "sstem3",
+                "disk_monitor": False}
+    with open(configuration_location / "superstem_customisation.json", "w") as f:
+        json.dump(settings, f, indent=4)
+    api = FakeAPI(configuration_location)
+    api.library.set_library_value("stem.session.microscopist", "dmh")
+    api.library.set_library_value("stem.session.sample", "1234")
+    api.library.set_library_value("stem.session.sample_area", "area1")
+    api.library.set_library_value("stem.session.task", "")
+    return api
+
+
+@pytest.fixture
+def panel(api):
+    """ a PanelSuperSTEMDelegate with its widget created, after Swift would have finished starting """
+    from nionswift_plugin.superstem import SuperSTEM
+    delegate = SuperSTEM.PanelSuperSTEMDelegate(api)
+    delegate.column = delegate.create_panel_widget(api.ui, api.document_controller)
+    api.run_pending_tasks()
+    yield delegate
+    delegate.close()
+    api.run_pending_tasks()
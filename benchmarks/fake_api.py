@@ -0,0 +1,235 @@
+"""
+Headless stand-in for the parts of the Swift API that PanelSuperSTEMDelegate uses, so the panel's
+callbacks can be driven and timed without the Swift GUI: library values, document controllers with
+persistent strings and a selected display item, queue_task and the UI widget factories.
+"""
+
+# standard libraries
+import contextlib
+import pathlib
+import threading
+
+# third party libraries
+import numpy
+
+
+class FakeWidgetBehavior:
+    """ the _widget of a facade widget: properties set via set_property, enabled, placeholder_text """
+
+    def __init__(self):
+        self.properties = dict()
+        self.enabled = True
+        self.placeholder_text = ""
+
+    def set_property(self, key, value):
+        self.properties[key] = value
+
+
+class FakeWidget:
+
+    def __init__(self):
+        self._widget = FakeWidgetBehavior()
+
+
+class FakeBoxWidget(FakeWidget):
+    """ row and column widgets, children holds the widgets and ("spacing", n) / ("stretch",) entries """
+
+    def __init__(self):
+        super().__init__()
+        self.children = list()
+
+    def add(self, widget):
+        self.children.append(widget)
+
+    def add_spacing(self, spacing):
+        self.children.append(("spacing", spacing))
+
+    def add_stretch(self):
+        self.children.append(("stretch",))
+
+
+class FakeLabelWidget(FakeWidget):
+
+    def __init__(self, text=None, properties=None):
+        super().__init__()
+        self.text = text or ""
+        self._widget.properties.update(properties or dict())
+
+
+class FakePushButtonWidget(FakeWidget):
+
+    def __init__(self, text=None):
+        super().__init__()
+        self.text = text or ""
+        self.on_clicked = None
+
+    def click(self):
+        if self._widget.enabled and self.on_clicked:
+            self.on_clicked()
+
+
+class FakeLineEditWidget(FakeWidget):
+
+    def __init__(self, text=None):
+        super().__init__()
+        self.text = text or ""
+        self.on_editing_finished = None
+
+    def edit(self, text):
+        """ types text and hits return """
+        self.text = text
+        if self.on_editing_finished:
+            self.on_editing_finished(text)
+
+    def request_refocus(self):
+        pass
+
+
+class FakeCheckBoxWidget(FakeWidget):
+
+    def __init__(self, text=None):
+        super().__init__()
+        self.text = text or ""
+        self.checked = False
+        self.on_checked_changed = None
+
+    def toggle(self):
+        self.checked = not self.checked
+        if self.on_checked_changed:
+            self.on_checked_changed(self.checked)
+
+
+class FakeUserInterface:
+    """ the widget factories of the facade ui and the persistent strings of the Swift ui, which count their writes """
+
+    def __init__(self):
+        self.persistent_strings = dict()
+        self.persistent_write_count = 0
+
+    def create_column_widget(self, properties=None):
+        return FakeBoxWidget()
+
+    def create_row_widget(self, properties=None):
+        return FakeBoxWidget()
+
+    def create_label_widget(self, text=None, properties=None):
+        return FakeLabelWidget(text, properties)
+
+    def create_push_button_widget(self, text=None):
+        return FakePushButtonWidget(text)
+
+    def create_line_edit_widget(self, text=None):
+        return FakeLineEditWidget(text)
+
+    def create_check_box_widget(self, text=None):
+        return FakeCheckBoxWidget(text)
+
+    def get_persistent_string(self, key, default_value=None):
+        return self.persistent_strings.get(key, default_value if default_value is not None else "")
+
+    def set_persistent_string(self, key, value):
+        self.persistent_strings[key] = value
+        self.persistent_write_count += 1
+
+
+class FakeDataItem:
+
+    def __init__(self, xdata):
+        self.xdata = xdata
+
+
+class FakeDisplayItem:
+    """ an in-memory display item with NumPy data """
+
+    def __init__(self, data: numpy.ndarray, title=""):
+        from nion.data import DataAndMetadata
+        self.title = title
+        self.data_item = FakeDataItem(DataAndMetadata.new_data_and_metadata(data))
+
+
+class FakeDocumentController:
+    """ the _document_controller behind api.application.document_controllers[0] """
+
+    def __init__(self, ui: FakeUserInterface):
+        self.ui = ui
+        self.selected_display_item = None
+
+
+class FakeFacadeDocumentController:
+
+    def __init__(self, ui: FakeUserInterface):
+        self._document_controller = FakeDocumentController(ui)
+
+
+class FakeApplicationBehavior:
+    """ the _application used by the dialogs """
+
+    @contextlib.contextmanager
+    def prevent_close(self):
+        yield
+
+
+class FakeApplication:
+
+    def __init__(self, configuration_location: pathlib.Path, ui: FakeUserInterface):
+        self.configuration_location = pathlib.Path(configuration_location)
+        self.document_controllers = [FakeFacadeDocumentController(ui)]
+        self._application = FakeApplicationBehavior()
+
+
+class FakeLibrary:
+
+    def __init__(self):
+        self.library_values = dict()
+
+    def get_library_value(self, key):
+        return self.library_values.get(key, "")
+
+    def set_library_value(self, key, value):
+        self.library_values[key] = value
+
+
+class FakePanelReference:
+
+    def __init__(self, delegate):
+        self.delegate = delegate
+
+    def close(self):
+        self.delegate.close()
+
+
+class FakeAPI:
+    """
+    api as passed to PanelSuperSTEMDelegate. Tasks passed to queue_task, from any thread, run on
+    the next run_pending_tasks(), the stand-in for Swift's UI event loop.
+    """
+
+    def __init__(self, configuration_location):
+        self.ui = FakeUserInterface()
+        self.application = FakeApplication(configuration_location, self.ui)
+        self.library = FakeLibrary()
+        self.__tasks = list()
+        self.__tasks_lock = threading.Lock()
+
+    @property
+    def document_controller(self) -> FakeDocumentController:
+        return self.application.document_controllers[0]._document_controller
+
+    def queue_task(self, fn):
+        with self.__tasks_lock:
+            self.__tasks.append(fn)
+
+    def run_pending_tasks(self):
+        """ runs the queued tasks, including those they queue, returns their number """
+        task_count = 0
+        while True:
+            with self.__tasks_lock:
+                tasks, self.__tasks = self.__tasks, list()
+            if not tasks:
+                return task_count
+            for task in tasks:
+                task()
+            task_count += len(tasks)
+
+    def create_panel(self, delegate):
+        return FakePanelReference(delegate)
@@ -0,0 +1,107 @@
+"""
+Latency of the panel's callbacks, driven headless through fake_api.FakeAPI.
+Run from the repository root with
+    python -m pytest benchmarks --benchmark-autosave
+and compare with earlier runs with --benchmark-compare.
+"""
+
+# standard libraries
+import itertools
+import pathlib
+
+# third party libraries
+import numpy
+import pytest
+
+# local libraries
+from fake_api import FakeDisplayItem
+
+
+# skipped here rather than in conftest.py, where a skip would stop the collection of benchmarks/
+pytest.importorskip("nion.swift", reason="the panel needs nionswift and nionui")
+pytest.importorskip("pytest_benchmark", reason="the benchmarks need pytest-benchmark")
+
+
+def fill_fields(panel, no="1"):
+    panel.fields_no_edit.edit(no)
+    panel.fields_fov_edit.edit("20")
+    panel.fields_descr_edit.edit("test")
+
+
+def test_create_panel_widget(benchmark, api):
+    from nionswift_plugin.superstem import SuperSTEM
+
+    def create_panel():
+        delegate = SuperSTEM.PanelSuperSTEMDelegate(api)
+        delegate.create_panel_widget(api.ui, api.document_controller)
+        api.run_pending_tasks()
+        delegate.close()
+
+    benchmark(create_panel)
+
+
+def test_field_edits(benchmark, api, panel):
+    no_counter = itertools.count(1)
+
+    def edit_fields():
+        fill_fields(panel, str(next(no_counter)))
+        api.run_pending_tasks()
+
+    benchmark(edit_fields)
+
+
+def test_set_export_folder(benchmark, api, panel):
+    def set_export_folder():
+        panel.update_expdir_button.click()
+        api.run_pending_tasks()
+
+    benchmark(set_export_folder)
+    panel.persistent_strings.flush()
+    assert api.ui.get_persistent_string("export_directory").endswith("_DMH_S1234_area1")
+    # export_directory and export_filter, however often the button was clicked
+    assert api.ui.persistent_write_count <= 2
+
+
+def test_rename_only(benchmark, api, panel):
+    api.document_controller.selected_display_item = FakeDisplayItem(numpy.zeros((16, 16), numpy.float32))
+    panel.quickexport_rename_check.toggle()
+    fill_fields(panel)
+    api.run_pending_tasks()
+    button = panel.button_widgets_list[0]
+    assert button._widget.enabled
+
+    benchmark(button.click)
+    # renamed to the file name the export would have
+    assert api.document_controller.selected_display_item.title == "001_HAADF_20nm_test.dm3"
+
+
+@pytest.mark.parametrize("shape", [(512, 512), (2048, 2048)])
+def test_quick_export(benchmark, api, panel, shape):
+    from nionswift_plugin.superstem import export
+    from nionswift_plugin.superstem import manifest
+    if export.get_dm_save_image() is None:
+        pytest.skip("the quick export needs the DM plugin of nionswift-io")
+    display_item = FakeDisplayItem(numpy.random.default_rng(0).random(shape, numpy.float32))
+    api.document_controller.selected_display_item = display_item
+    panel.update_expdir_button.click()
+    api.run_pending_tasks()
+    button = panel.button_widgets_list[0]
+    no_counter = itertools.count(1)
+
+    def quick_export():
+        # a new No every round, an existing file would open the warning dialog
+        fill_fields(panel, str(next(no_counter)))
+        api.run_pending_tasks()
+        button.click()
+        api.run_pending_tasks()
+
+    benchmark(quick_export)
+    # the time until the files are written, for the throughput
+    panel.export_queue.close()
+    # every export was hashed while it was written, the hashes stage does not read it again
+    export_dir = pathlib.Path(panel.persistent_strings.get("export_directory"))
+    export_manifest = manifest.read_export_manifest(export_dir)
+    export_paths = list(export_dir.glob("*.dm3"))
+    assert export_paths and len(export_manifest) == len(export_paths)
+    assert export_manifest[export_paths[0].name][0] == manifest.hash_file(export_paths[0])
+    benchmark.extra_info["MB per export"] = display_item.data_item.xdata.data.nbytes / 2**20
@@ -12,7 +12,9 @@
         self.ui.set_persistent_string("sstem_last_project_dir",sstem_last_project_dir)
         #logging.info("switch proj ref last %s", sstem_last_project_dir)
         ## re-set current project dir (project_reference is pushed onto sstem_current_project_dir)
-        sstem_current_project_dir = str(project_reference.project_path).rsplit("/",1)[0]
+        # this is the full path of the .nsproj file; str() gives the native separators,
+        # the SuperSTEM plugin accepts either "\\" or "/"
+        sstem_current_project_dir = str(project_reference.project_path)
         # writing the current project to persistent config
         self.ui.set_persistent_string("sstem_current_project_dir",sstem_current_project_dir)
         #logging.info("switch proj ref current %s", sstem_current_project_dir)
@@ -1,4 +1,6 @@
 # standard libraries
+import time
+_import_start = time.perf_counter()
 import gettext
 import logging
 import datetime
@@ -6,20 +8,28 @@ import os
 import pathlib
 import functools
 import typing
-import json
-import subprocess
+import threading
 
 # local libraries
+# ImportExportManager (export buttons) and Cache (new library) are imported where they are used,
+# json only when the config file is read or written. Of the plugin's own modules only the light ones
+# needed to build the panel are imported here; archive, codec, diskmonitor, export, preview, reduction,
+# spool, staging and watcher (numpy, threads) are imported by the handlers and services that use them.
 from nion.ui import Dialog, UserInterface
-from nion.swift.model import ImportExportManager
-from nion.swift.model import Cache
-from nion.swift.model import Profile
-from nion.swift import DocumentController
 
+from . import diagnostics
+from . import persistent
+from . import session
+from . import shard
+
+_import_seconds = time.perf_counter() - _import_start
 
 
 _ = gettext.gettext
 
+# config file path -> ((st_mtime_ns, st_size), settings), so the getters only stat the file
+_superstem_settings_cache = dict()
+
 
 # global flag to indicate whether "Set Export Folder" has been run at least once
 flag_set_exp_dir = 0
@@ -51,16 +61,23 @@ def get_postfix_string(sub_field_string, fov_field_string, descr_field_string):
 
 def get_superstem_settings(superstem_config_file: pathlib.Path):
     """
-    Reads superstem config file and returns availabe settings dictionary
+    Reads superstem config file and returns availabe settings dictionary.
+    The file is only parsed again when its mtime or size changed.
     """
     conf_file = superstem_config_file
     superstem_settings = {}
     #logging.info("Reading SuperSTEM config file %s", conf_file)
 
     try:  # do nothing unless config file exists and is not empty
-        if conf_file.is_file() and conf_file.stat().st_size != 0:
+        stat = conf_file.stat() if conf_file.is_file() else None
+        if stat is not None and stat.st_size != 0:
+            signature, cached_settings = _superstem_settings_cache.get(str(conf_file), (None, None))
+            if signature == (stat.st_mtime_ns, stat.st_size):
+                return dict(cached_settings)
+            import json
             with open(conf_file, "r") as f:
                 superstem_settings = json.load(f)
+                _superstem_settings_cache[str(conf_file)] = ((stat.st_mtime_ns, stat.st_size), dict(superstem_settings))
                 if superstem_settings == {}:
                     logging.info("WARNING - SuperSTEM config file %s empty", conf_file)
                     logging.info("        - Please edit and enter key/value pair for export_base_directory")
@@ -125,13 +142,139 @@ def get_default_project(superstem_config_file):
         logging.info("YOU NEED TO SET A DEFAULT PROJECT IN SUPERSTEM CUSTON JSON FILE!")
     return str(default_project)
 
-def get_compress_program(superstem_config_file):
-    compress_program = get_superstem_settings(superstem_config_file).get('compress_program')
-    return str(compress_program)
-    
-def get_hashes_program(superstem_config_file):
-    hashes_program = get_superstem_settings(superstem_config_file).get('hashes_program')
-    return str(hashes_program)
+def get_instrument(superstem_config_file):
+    """ reads instrument name (used in the hashes file name) from superstem config file, default sstem3 """
+    instrument = get_superstem_settings(superstem_config_file).get('superstem_instrument')
+    return str(instrument or "sstem3")
+
+def get_export_memory_ceiling(superstem_config_file):
+    """ reads the memory ceiling of the export queue in MB from superstem config file, default 2048 MB, returns bytes """
+    export_memory_ceiling_mb = get_superstem_settings(superstem_config_file).get('export_memory_ceiling_mb')
+    return int(export_memory_ceiling_mb or 2048) * 1024 * 1024
+
+def get_export_scratch_dir(superstem_config_file):
+    """ reads the local scratch directory for spilled export snapshots from superstem config file, default None """
+    return get_superstem_settings(superstem_config_file).get('export_scratch_directory')
+
+def get_export_spool_dir(superstem_config_file):
+    """ reads the local spool directory that exports are written to first from superstem config file, default None """
+    return get_superstem_settings(superstem_config_file).get('export_spool_directory')
+
+def get_export_preview_format(superstem_config_file):
+    """ reads the format of the preview written next to each quick export ("png" or "jpeg") from superstem config file, default None (no preview) """
+    return get_superstem_settings(superstem_config_file).get('export_preview')
+
+def get_export_preview_size(superstem_config_file):
+    """ reads the longest side of the export previews in pixels from superstem config file, default 256 """
+    from . import preview
+    return int(get_superstem_settings(superstem_config_file).get('export_preview_size') or preview.PREVIEW_SIZE)
+
+def get_export_reduction_profile(superstem_config_file, button_label):
+    """
+    reads the reduction profile of an export button (e.g. "SI-EELS") from export_reduction_profiles
+    in superstem config file, e.g. {"SI-EELS": {"bin_energy": 2, "dtype": "float32"}}, default None (no reduction).
+    dtype is "float32" or, opt-in, "float16"; a profile with another dtype is rejected.
+    """
+    profile = (get_superstem_settings(superstem_config_file).get('export_reduction_profiles') or dict()).get(button_label)
+    if not profile:
+        return None
+    from . import reduction
+    if not set(profile) <= set(reduction.PROFILE_KEYS):
+        logging.info("WARNING - Unknown keys in reduction profile %s: %s", button_label, sorted(set(profile) - set(reduction.PROFILE_KEYS)))
+    if profile.get("dtype") is not None and profile["dtype"] not in reduction.DOWNCAST_DTYPES:
+        logging.info("WARNING - Reduction profile %s ignored, dtype %s is not one of %s", button_label, profile["dtype"], ", ".join(reduction.DOWNCAST_DTYPES))
+        return None
+    return profile
+
+def get_incremental_archiving(superstem_config_file):
+    """ reads from superstem config file whether to stage the active project for archiving during the session """
+    return bool(get_superstem_settings(superstem_config_file).get('incremental_archiving', False))
+
+def get_archive_staging_dir(superstem_config_file):
+    """
+    reads location of the archive staging directory from superstem config file,
+    if there is no entry it falls back to _sstem_staging in the data base directory
+    """
+    staging_dir = get_superstem_settings(superstem_config_file).get('archive_staging_directory')
+    if staging_dir is None:
+        return str(pathlib.Path(get_data_base_dir(superstem_config_file)).joinpath("_sstem_staging"))
+    return str(pathlib.Path(staging_dir))
+
+def get_archive_compression(superstem_config_file):
+    """
+    reads archive compression from superstem config file: "adaptive" (default) chooses store, deflate or lzma
+    per file within archive_time_budget_s seconds; "store", "deflate" or "lzma" use that for every file
+    """
+    from . import codec
+    settings = get_superstem_settings(superstem_config_file)
+    return codec.get_compression(settings.get('archive_compression', codec.ADAPTIVE), settings.get('archive_time_budget_s'))
+
+def get_archive_workers(superstem_config_file):
+    """ reads number of worker threads for archive jobs from superstem config file, default 4 """
+    return int(get_superstem_settings(superstem_config_file).get('archive_workers') or 4)
+
+def get_manifest_watcher(superstem_config_file):
+    """ reads from superstem config file whether to hash new files in New_Data as they arrive, default False """
+    return bool(get_superstem_settings(superstem_config_file).get('manifest_watcher', False))
+
+def get_manifest_watcher_stable_seconds(superstem_config_file):
+    """ reads how long a file must be unchanged before the manifest watcher hashes it, default 30 s """
+    return float(get_superstem_settings(superstem_config_file).get('manifest_watcher_stable_s') or 30)
+
+def get_disk_monitor(superstem_config_file):
+    """ reads from superstem config file whether to show free space of the data and export volumes, default True """
+    return bool(get_superstem_settings(superstem_config_file).get('disk_monitor', True))
+
+def get_disk_monitor_interval(superstem_config_file):
+    """ reads the seconds between free space samples from superstem config file, default 30 s """
+    return float(get_superstem_settings(superstem_config_file).get('disk_monitor_interval_s') or 30)
+
+def get_disk_warning_free_bytes(superstem_config_file):
+    """ reads the free space in GB below which the disk monitor warns from superstem config file, default 100 GB, returns bytes """
+    from . import diskmonitor
+    return float(get_superstem_settings(superstem_config_file).get('disk_warning_free_gb') or 100) * diskmonitor.GB
+
+def get_disk_warning_seconds(superstem_config_file):
+    """ reads the projected hours to full below which the disk monitor warns from superstem config file, default 12 h, returns s """
+    return float(get_superstem_settings(superstem_config_file).get('disk_warning_hours') or 12) * 3600
+
+def get_profiling(superstem_config_file):
+    """ reads from superstem config file whether to profile export clicks, new library, load default project and compress, default False """
+    return bool(get_superstem_settings(superstem_config_file).get('profiling', False))
+
+def get_profiling_dir(superstem_config_file):
+    """
+    reads the directory the profiles are written to from superstem config file,
+    if there is no entry it falls back to superstem_diagnostics next to the config file
+    """
+    profiling_dir = get_superstem_settings(superstem_config_file).get('profiling_directory')
+    if profiling_dir is None:
+        return pathlib.Path(superstem_config_file).parent.joinpath("superstem_diagnostics")
+    return pathlib.Path(profiling_dir)
+
+def get_profiling_top_n(superstem_config_file):
+    """ reads the number of functions and allocation sites logged per profile from superstem config file, default 15 """
+    return int(get_superstem_settings(superstem_config_file).get('profiling_top_n') or diagnostics.PROFILE_TOP_N)
+
+def get_export_shard_by(superstem_config_file):
+    """ reads whether large export directories are split into subfolders by "detector" or "no" from superstem config file, default None """
+    shard_by = get_superstem_settings(superstem_config_file).get('export_shard_by')
+    if shard_by and shard_by not in shard.SHARD_BY:
+        logging.info("WARNING - Unknown export_shard_by %s, exports are not split into subfolders", shard_by)
+        return None
+    return shard_by or None
+
+def get_export_shard_threshold(superstem_config_file):
+    """ reads the number of DM files in an export directory before exports go into subfolders from superstem config file, default 1000 """
+    return int(get_superstem_settings(superstem_config_file).get('export_shard_threshold') or shard.SHARD_THRESHOLD)
+
+def get_export_shard_no_range(superstem_config_file):
+    """ reads the number of Nos per subfolder when sharding by No from superstem config file, default 100 """
+    return int(get_superstem_settings(superstem_config_file).get('export_shard_no_range') or shard.NO_RANGE)
+
+def get_transfer_destination_dir(superstem_config_file):
+    """ reads the directory New_Data is copied to after "Compress Last Proj" from superstem config file, default None """
+    return get_superstem_settings(superstem_config_file).get('transfer_destination_directory')
 
 def write_superstem_config_file(superstem_config_file: pathlib.Path, superstem_settings):
     """ writes the current superstem settings to the superstem config file """
@@ -139,6 +282,7 @@ def write_superstem_config_file(superstem_config_file: pathlib.Path, superstem_s
 
     try:
         if conf_file.is_file():
+            import json
             with open(conf_file, "w") as f:
                 logging.info("UPDATING SuperSTEM config file %s", conf_file)
                 json.dump(superstem_settings, f, indent=4)
@@ -163,6 +307,13 @@ class PanelSuperSTEMDelegate:
     date in the Export Dir field.
     ==========================================================================
     Revisions:
+     20261019; DMH:
+        "Compress Last Proj" runs archive.py instead of compress.bat and hashesNew.bat (compress_program and
+        hashes_program are no longer used); the same jobs and more run outside Swift as superstem-archive (see README).
+        Quick exports are written in the background from snapshots, optionally via a local spool, with previews,
+        reduction profiles and subfolders for large export directories. New settings in superstem_customisation.json
+        enable incremental archiving, the manifest watcher, the disk row, transfers and profiling.
+        The panel starts faster and the export folder follows the Session panel. Details are in the commit history.
      20240402; DMH:
         Added a new checkbox RenameOnly that allows to rename any selected data item using the fields from the
         quick export, but without actually exporting to New_Data. When done with the session one can then manually
@@ -252,18 +403,52 @@ class PanelSuperSTEMDelegate:
         
         # we only export to DM
         self.io_handler_id = "dm-io-handler"
+        # background export queue, created on first export
+        self.export_queue = None
+        # subfolders of large export directories, created on first export
+        self.export_layout = None
+        # local spool that exports are written to before they are moved to the export directory
+        self.export_spool = None
+        # writes the previews of quick exports, created on first export if export_preview is set
+        self.preview_writer = None
+        # background staging of the current project for "Compress Last Proj"
+        self.session_archiver = None
+        # background hashing of new files in New_Data
+        self.manifest_watcher = None
+        # background sampling of free space on the data and export volumes
+        self.disk_monitor = None
+        # session fields the export directory is made of, created with the panel
+        self.session_observer = None
+        # panels open, one per document window; they share the background services, which are stopped with the last
+        self.__panel_count = 0
+        # the panel's persistent strings, written to Swift's app-data file in coalesced batches
+        self.persistent_strings = persistent.PersistentStrings(
+            lambda: self.__api.application.document_controllers[0]._document_controller.ui, self.__api.queue_task)
 
         # SuperSTEM config file
         self.superstem_config_file = api.application.configuration_location / pathlib.Path("superstem_customisation.json")
  
         
 
+    def profiled(self, name, fn):
+        """ returns fn, profiled under name while profiling is set in superstem_customisation.json """
+        @functools.wraps(fn)
+        def profiled_fn(*args, **kwargs):
+            if not get_profiling(self.superstem_config_file):
+                return fn(*args, **kwargs)
+            with diagnostics.profile(name, get_profiling_dir(self.superstem_config_file),
+                                     get_profiling_top_n(self.superstem_config_file)):
+                return fn(*args, **kwargs)
+        return profiled_fn
+
 #####
     def show_loaddefproj_dialog(self, title_string, have_ok=True, have_cancel=True):
 
         api = self.api
         myapi = self.__api
         superstem_config_file = self.superstem_config_file
+        persistent_strings = self.persistent_strings
+        profiled = self.profiled
         #proref = myapi.application._application.profile.get_project_reference(profile.last_project_reference)
         #proref = myapi.application.__application.profile()
         #proref = myapi.application.__application.project_refence.title
@@ -344,6 +529,8 @@ class PanelSuperSTEMDelegate:
                                 #logging.info("last_project_dir %s", last_project_dir)
                                 # get project_reference for default project
                                 #myapi.application._application.create_project_reference(pathlib.Path(defproj_name))
+                                # write pending persistent strings first, switch_project_reference updates the project ones
+                                persistent_strings.flush()
                                 project_reference =  myapi.application._application.profile.open_project(pathlib.Path((defproj_name)))
                                 #logging.info("project_reference in loaddefpro: %s %s", project_reference, project_reference.title)
                                 #  close and load def project
@@ -358,7 +545,7 @@ class PanelSuperSTEMDelegate:
                 if include_ok:
                     # clicking on this button loads default project
                     # logging.info("clicked on LoadDefProj button")
-                    self.add_button(_("Yes"), handle_loaddefproj)      
+                    self.add_button(_("Yes"), profiled("load default project", handle_loaddefproj))      
                     
 
 
@@ -397,6 +584,7 @@ class PanelSuperSTEMDelegate:
         api = self.api
         myapi = self.__api
         superstem_config_file = self.superstem_config_file
+        profiled = self.profiled
         # this puts function in the scope of the class LibraryDialog;  - not necessary
         #get_data_base_dir_with_year_fn = get_data_base_dir_with_year(superstem_config_file)
 
@@ -619,6 +807,7 @@ class PanelSuperSTEMDelegate:
                             
                             # no top directory, library and nsproj files all in a flat directory:
                             # workspace_dir = self.data_base_dir_with_year
+                            from nion.swift.model import Cache
                             Cache.db_make_directory_if_needed(workspace_dir)
                             # Nionswift no longer uses *.nslib -> *.nsproj, disable this:
                             #path = os.path.join(workspace_dir, "Nion Swift Workspace.nslib")
@@ -657,7 +846,7 @@ class PanelSuperSTEMDelegate:
 
                 if include_ok:
                     # clicking on this button loads new library
-                    self.add_button(_("Create New Library and Session"), handle_new)
+                    self.add_button(_("Create New Library and Session"), profiled("new library", handle_new))
 
 
                 # ==== Adding rows to main column ====
@@ -784,12 +973,45 @@ class PanelSuperSTEMDelegate:
             WarningDialog(dc.ui, on_accept=report_dialog_closed, on_reject=report_dialog_closed).show()
 
     def close(self):
+        # Swift calls close for each panel closed, the other windows' panels still use the services
+        self.__panel_count = max(0, self.__panel_count - 1)
+        if self.__panel_count > 0:
+            self.persistent_strings.flush()
+            return
+        if self.session_archiver:
+            self.session_archiver.stop()
+            self.session_archiver = None
+        if self.manifest_watcher:
+            self.manifest_watcher.stop()
+            self.manifest_watcher = None
+        if self.disk_monitor:
+            self.disk_monitor.stop()
+            self.disk_monitor = None
+        if self.export_queue:
+            # writes any pending exports
+            self.export_queue.close()
+            self.export_queue = None
+        if self.preview_writer:
+            self.preview_writer.close()
+            self.preview_writer = None
+        if self.export_spool:
+            # files not yet moved stay in the spool and are moved after the next start
+            self.export_spool.close()
+            self.export_spool = None
+        if self.session_observer:
+            self.session_observer.close()
+            self.session_observer = None
+        # writes persistent strings not yet written
+        self.persistent_strings.close()
         self.button_widgets_list = []
         self.quickexport_dmver_toggle_button_state = "3"
 
     def create_panel_widget(self, ui, document_controller):
+        startup_timer = diagnostics.PhaseTimer("SuperSTEM startup")
+        startup_timer.add("import", _import_seconds)
         self.ui = ui
         self.document_controller = document_controller
+        self.__panel_count += 1
 
         # list of export buttons (will be ordered in rows of 4 buttons)
         button_list = [
@@ -802,6 +1024,13 @@ class PanelSuperSTEMDelegate:
         self.expdir_string = ""
         self.lastdir_string = ""
 
+        # session fields, updated from the Session panel; an observer updating the panel of another window is replaced
+        if self.session_observer:
+            self.session_observer.close()
+        self.session_observer = session.SessionMetadataObserver(self.__api.library.get_library_value)
+        # export directory last set from the session data, followed while the field is not edited
+        self.session_expdir_string = ""
+
         # function to construct the export directory string
         def get_export_dir_string():
             """ Reads the persistent date base directory from config file,
@@ -810,24 +1039,9 @@ class PanelSuperSTEMDelegate:
                 microscopist, sampleID, sample description (i.e. sample_area).
                 Returns the export directory path as string.
             """
-            export_base_dir_with_year = get_export_base_dir_with_year(self.superstem_config_file)
-            export_base_dir_with_year_path =  pathlib.Path(export_base_dir_with_year)
-            date_string = datetime.datetime.now().strftime("%Y_%m_%d")
-            #enforce empty string if field has no entry
-            microscopist = str(self.__api.library.get_library_value("stem.session.microscopist")).upper() or ""
-            sample = "S" + str(self.__api.library.get_library_value("stem.session.sample")) or ""
-            sample_area =  str(self.__api.library.get_library_value("stem.session.sample_area")) or ""
-            task =  str(self.__api.library.get_library_value("stem.session.task")) or ""
-            # have decided not to include task=project number in folder name
-            #if task != "":
-            #    prefix_task = "p" + task
-            #    session_string = "_".join([ microscopist, sample, sample_area, prefix_task ])
-            #else:
-            session_string = "_".join([ microscopist, sample, sample_area ])
-            ## pathlib "/" method to ;contruct export dir path:
-    
-            expdir_path = export_base_dir_with_year_path.joinpath(
-                    date_string + "_" + session_string)
+            # microscopist, sample and sample_area come from the session observer's snapshot,
+            # the task (project number) is not included in the folder name
+            expdir_path = self.session_observer.get_export_dir_path(get_export_base_dir_with_year(self.superstem_config_file))
             logging.info("- Exporting to: %s",expdir_path)
             return str(expdir_path)
 
@@ -838,8 +1052,8 @@ class PanelSuperSTEMDelegate:
             #current_superstem_settings = get_superstem_settings(self.superstem_config_file)
             #we haven't changed superstem_settings, no need to write them to file
             #write_superstem_config_file(self.superstem_config_file, current_superstem_settings)
-            self.__api.application.document_controllers[0]._document_controller.ui.set_persistent_string('export_directory', self.expdir_string)
-            self.__api.application.document_controllers[0]._document_controller.ui.set_persistent_string('export_filter', 'DigitalMicrograph Files files (*.dm3 *.dm4)')
+            self.persistent_strings.set('export_directory', self.expdir_string)
+            self.persistent_strings.set('export_filter', 'DigitalMicrograph Files files (*.dm3 *.dm4)')
 
         # === create main column widget
         column = ui.create_column_widget()
@@ -883,12 +1097,26 @@ class PanelSuperSTEMDelegate:
                 # logging.info("flag is %s", flag_set_exp_dir)
                 flag_set_exp_dir = 1
             self.expdir_field_edit.text = expdir_string
-            self.__api.application.document_controllers[0]._document_controller.ui.set_persistent_string('export_directory', expdir_string)
-            self.__api.application.document_controllers[0]._document_controller.ui.set_persistent_string('export_filter', 'DigitalMicrograph Files files (*.dm3 *.dm4)')
+            self.session_expdir_string = expdir_string
+            self.persistent_strings.set('export_directory', expdir_string)
+            self.persistent_strings.set('export_filter', 'DigitalMicrograph Files files (*.dm3 *.dm4)')
            
 
         self.update_expdir_button.on_clicked = update_expdir_button_clicked
 
+        def handle_session_changed(session_observer):
+            """ Follows changes in the Session panel once the export folder was set from the session data,
+                unless the export dir field was edited since.
+            """
+            def update():
+                if flag_set_exp_dir and self.session_expdir_string and self.expdir_field_edit.text == self.session_expdir_string:
+                    update_expdir_button_clicked()
+
+            self.__api.queue_task(update)
+
+        self.session_observer.on_changed = handle_session_changed
+        self.session_observer.start()
+
         # == create editable export dir field row widget
         expdir_row = ui.create_row_widget()
         expdir_row.add_spacing(3)
@@ -1073,6 +1301,8 @@ class PanelSuperSTEMDelegate:
         fields_row.add_spacing(2)
         #fields_row.add_stretch()
 
+        startup_timer.mark("top sections")
+
         # == create export button rows (contained in a column widget)
         self.button_column = ui.create_column_widget()
         # add button rows with 4 buttons each, taking buttons from button_list
@@ -1082,94 +1312,129 @@ class PanelSuperSTEMDelegate:
                                                  no_buttons_per_row)
             self.button_column.add(button_row)
 
-        # == create finish and reload button row widget
-        finish_reload_row = ui.create_row_widget()
-        finish_reload_row.add_spacing(3)
-        self.finish_reload_button = ui.create_push_button_widget(_("Finish && Load Default Proj"))
-        self.finish_reload_button._widget.set_property("width", 180)
-        self.finish_reload_compress_button = ui.create_push_button_widget(_("Compress Last Proj"))
-        self.finish_reload_compress_button._widget.set_property("width", 150)
-        finish_reload_row.add_stretch()
-        finish_reload_row.add(self.finish_reload_button)
-        finish_reload_row.add_spacing(2)
-        finish_reload_row.add(self.finish_reload_compress_button)
-        
-        def finish_reload_button_clicked():
-            #logging.info("have clicked on main load def proj button")
-            self.show_loaddefproj_dialog("Finish && Load Default Project", True, True)         
-
-        self.finish_reload_button.on_clicked = finish_reload_button_clicked
-
-        def finish_reload_compress_button_clicked():
-            compress_program = get_compress_program(self.superstem_config_file)
-            # compress_program = r"F:\StaffData\dmuecke\Nionswift-Development\Saved_Data\compress.bat"
-            hashes_program = get_hashes_program(self.superstem_config_file)
-            #hashes_program = r"F:\StaffData\dmuecke\Nionswift-Development\Saved_Data\hashesNew.bat"
-            logging.info("hp %s", hashes_program)
-            last_proj_dir_string = self.__api.application.document_controllers[0]._document_controller.ui.get_persistent_string('sstem_last_project_dir')
-            last_proj_dir_path, last_proj_name = last_proj_dir_string.rsplit("\\",1)
-            # project name without ".nsproj":
-            last_proj_dir_name = last_proj_name.rsplit(".nsproj",1)[0]
-
-            #logging.info("lpds, lpn %s %s", last_proj_dir_name, last_proj_name)
-            export_base_directory = get_export_base_dir(self.superstem_config_file)
-            output_dir = export_base_directory + "\\" + last_proj_dir_name
-            output_archive_file = output_dir + "\\" + last_proj_dir_name + "_Raw.zip"
-            # MAKE OUTPUT DIR IF NOT EXISTS
-            os.makedirs(output_dir, exist_ok=True)
-  
-
-            #logging.info("of %s", output_file)
-            # enclosing command line parameters with quotes
-            # compress bat file, compressed archive name, last project, hashes bat file, export base dir
-            compress_command = " \"" + compress_program + "\" \"" + output_archive_file  + "\"  \"" + last_proj_dir_path + "\"  \"" + hashes_program + "\" \"" + export_base_directory + "\" && echo DONE || echo ERROR Something is wrong"
-
-            logging.info("- Running now: %s", compress_program)
-            p = subprocess.Popen(compress_command,shell=True)
-            # ... do other stuff while subprocess is running
-            #p.terminate()
-            
-        self.finish_reload_compress_button.on_clicked = finish_reload_compress_button_clicked
-        
-        # == create last project row widget
-        lastproj_row = ui.create_row_widget()
-        lastproj_row.add_spacing(3)
-        lastproj_row_label = ui.create_label_widget("<b>Last Proj:</b>")
-        lastproj_row.add(lastproj_row_label)
-        lastproj_row.add_stretch()
-                
-        lastproj_dir_string = self.__api.application.document_controllers[0]._document_controller.ui.get_persistent_string('sstem_last_project_dir')
-        logging.info("- Last Project: %s", lastproj_dir_string)
-        currentproj_dir_string = self.__api.application.document_controllers[0]._document_controller.ui.get_persistent_string('sstem_current_project_dir')
-        logging.info("- Current Project: %s", currentproj_dir_string)
+        # == the lower sections and background services are created once Swift has finished starting,
+        # the rows are added to lower_column, which keeps their place in the panel
+        self.lower_column = ui.create_column_widget()
+
+        def create_lower_sections():
+            startup_timer.skip()
+            # == create finish and reload button row widget
+            finish_reload_row = ui.create_row_widget()
+            finish_reload_row.add_spacing(3)
+            self.finish_reload_button = ui.create_push_button_widget(_("Finish && Load Default Proj"))
+            self.finish_reload_button._widget.set_property("width", 180)
+            self.finish_reload_compress_button = ui.create_push_button_widget(_("Compress Last Proj"))
+            self.finish_reload_compress_button._widget.set_property("width", 150)
+            finish_reload_row.add_stretch()
+            finish_reload_row.add(self.finish_reload_button)
+            finish_reload_row.add_spacing(2)
+            finish_reload_row.add(self.finish_reload_compress_button)
+
+            def finish_reload_button_clicked():
+                #logging.info("have clicked on main load def proj button")
+                self.show_loaddefproj_dialog("Finish && Load Default Project", True, True)         
+
+            self.finish_reload_button.on_clicked = finish_reload_button_clicked
+
+            def finish_reload_compress_button_clicked():
+                """ Compresses the last project to New_Data, tests the archive and
+                    writes the hashes file of New_Data, in a background thread.
+                """
+                last_proj_dir_string = self.persistent_strings.get('sstem_last_project_dir')
+                if not last_proj_dir_string:
+                    logging.info("- Error!  Last project variable empty!")
+                    return
+                from . import archive
+                from . import staging
+                # the last project string can be the .nsproj file or its folder, with either separator
+                compression = get_archive_compression(self.superstem_config_file)
+                job = archive.ArchiveJob.from_project_string(last_proj_dir_string,
+                                                             get_export_base_dir(self.superstem_config_file),
+                                                             get_instrument(self.superstem_config_file),
+                                                             workers=get_archive_workers(self.superstem_config_file),
+                                                             compression=compression,
+                                                             transfer_destination=get_transfer_destination_dir(self.superstem_config_file))
+                # finalises the archive if the project was staged during the session
+                if get_incremental_archiving(self.superstem_config_file):
+                    staging_area = staging.get_staging_area(job.project_dir, job.project_name,
+                                                            get_archive_staging_dir(self.superstem_config_file),
+                                                            compression=compression)
+                    if staging_area.has_staged_files():
+                        job.staging_area = staging_area
+                logging.info("- Running now: compress %s to %s", job.project_dir, job.archive_path)
+                # the session archiver must not stage the project any more once it is being finalised
+                session_archiver = self.session_archiver
+                if session_archiver and job.staging_area and session_archiver.staging_area.staging_dir == job.staging_area.staging_dir:
+                    self.session_archiver = None
+                else:
+                    session_archiver = None
 
-        self.lastproj_field_edit = ui.create_line_edit_widget("h")
-        self.lastproj_field_edit._widget.set_property("stylesheet", "background-color: white")
-        self.lastproj_field_edit._widget.set_property("width", 277)
+                def run_job():
+                    if session_archiver:
+                        session_archiver.stop()
+                    if job.run() == 0:
+                        logging.info("- DONE compressing %s", job.project_name)
+                    else:
+                        logging.info("- ERROR Something is wrong compressing %s", job.project_name)
+
+                # daemon thread: an unfinished job only leaves *.part files behind if Swift is closed
+                threading.Thread(target=run_job, daemon=True).start()
+
+            # only the start of the job is profiled, it runs in its own thread
+            self.finish_reload_compress_button.on_clicked = self.profiled("compress", finish_reload_compress_button_clicked)
+
+            # == create last project row widget
+            lastproj_row = ui.create_row_widget()
+            lastproj_row.add_spacing(3)
+            lastproj_row_label = ui.create_label_widget("<b>Last Proj:</b>")
+            lastproj_row.add(lastproj_row_label)
+            lastproj_row.add_stretch()
+
+            lastproj_dir_string = self.persistent_strings.get('sstem_last_project_dir')
+            logging.info("- Last Project: %s", lastproj_dir_string)
+            currentproj_dir_string = self.persistent_strings.get('sstem_current_project_dir')
+            logging.info("- Current Project: %s", currentproj_dir_string)
+
+            self.lastproj_field_edit = ui.create_line_edit_widget("h")
+            self.lastproj_field_edit._widget.set_property("stylesheet", "background-color: white")
+            self.lastproj_field_edit._widget.set_property("width", 277)
+
+            def write_persistent_lastproj_vars(self):
+                """ Writes export base directory path, export directory path and
+                    chosen export format to config files (superstem and Nion persistent data).
+                """
+                self.persistent_strings.set('sstem_last_project_dir', self.lastproj_string)
+
+            def handle_lastproj_field_changed(text):
+                """ Handles manual edits to the lastproj field
+                    and writes any manual changes to persistent nion and superstem config
+                """
+                self.lastproj_string = text
+                write_persistent_lastproj_vars(self)
+                logging.info("- Last Project is now : %s", self.lastproj_string)
+                self.exp_all_good = False
+                flag_set_exp_dir = 0
+                self.lastproj_field_edit.request_refocus()  # not sure what this does
+
+            self.lastproj_field_edit.on_editing_finished = handle_lastproj_field_changed
+            self.lastproj_field_edit.text = lastproj_dir_string
+            lastproj_row.add(self.lastproj_field_edit)
+            lastproj_row.add_spacing(2)
+            lastproj_row.add_stretch()
+
+            self.lower_column.add(lastproj_row)
+            self.lower_column.add_spacing(3)
+            self.lower_column.add(finish_reload_row)
+            self.lower_column.add_spacing(2)
+            if get_disk_monitor(self.superstem_config_file):
+                self.lower_column.add(self.create_disk_row(ui))
+                self.lower_column.add_spacing(2)
+            startup_timer.mark("lower sections")
+
+            self.start_background_services(currentproj_dir_string)
+            startup_timer.mark("background services")
+            startup_timer.log()
 
-        def write_persistent_lastproj_vars(self):
-            """ Writes export base directory path, export directory path and
-                chosen export format to config files (superstem and Nion persistent data).
-            """
-            self.__api.application.document_controllers[0]._document_controller.ui.set_persistent_string('sstem_last_project_dir', self.lastproj_string)
-            
-        def handle_lastproj_field_changed(text):
-            """ Handles manual edits to the lastproj field
-                and writes any manual changes to persistent nion and superstem config
-            """
-            self.lastproj_string = text
-            write_persistent_lastproj_vars(self)
-            logging.info("- Last Project is now : %s", self.lastproj_string)
-            self.exp_all_good = False
-            flag_set_exp_dir = 0
-            self.lastproj_field_edit.request_refocus()  # not sure what this does
-
-        self.lastproj_field_edit.on_editing_finished = handle_lastproj_field_changed
-        self.lastproj_field_edit.text = lastproj_dir_string
-        lastproj_row.add(self.lastproj_field_edit)
-        lastproj_row.add_spacing(2)
-        lastproj_row.add_stretch()
-            
         # == add the row widgets to the column widget
         column.add_spacing(8)
         column.add(new_library_button_row)
@@ -1185,18 +1450,89 @@ class PanelSuperSTEMDelegate:
         column.add_spacing(3)
         column.add(self.button_column)
         column.add_spacing(5)
-        column.add(lastproj_row)
-        column.add_spacing(3)
-        column.add(finish_reload_row)
-        column.add_spacing(2)
-        
+        column.add(self.lower_column)
+
         # default state of export buttons:
         for button in self.button_widgets_list:
             # button._widget.enabled = False
             self.update_button_state(button)
+        startup_timer.mark("export buttons")
 
+        self.__api.queue_task(create_lower_sections)
         return column
 
+    def start_background_services(self, currentproj_dir_string):
+        """ Starts the session archiver, export spool and manifest watcher, as far as they are configured.
+            The panels of all windows share them, those already running for another window are kept.
+        """
+        if currentproj_dir_string and get_incremental_archiving(self.superstem_config_file):
+            self.start_session_archiver(currentproj_dir_string)
+        export_spool_dir = get_export_spool_dir(self.superstem_config_file)
+        if export_spool_dir and not self.export_spool:
+            from . import spool
+            # started right away, so exports left in the spool by the last session are moved now
+            self.export_spool = spool.ExportSpool(export_spool_dir)
+        if get_manifest_watcher(self.superstem_config_file) and not self.manifest_watcher:
+            from . import watcher
+            self.manifest_watcher = watcher.ManifestWatcher(get_export_base_dir(self.superstem_config_file),
+                                                            get_manifest_watcher_stable_seconds(self.superstem_config_file))
+            self.manifest_watcher.start()
+
+    def create_disk_row(self, ui):
+        """ Creates the row showing free space and projected time to full of the data and
+            export volumes, updated by a background disk monitor.
+        """
+        disk_row = ui.create_row_widget()
+        disk_row.add_spacing(3)
+        disk_label = ui.create_label_widget("")
+        disk_label._widget.set_property("stylesheet", "font: italic; color: gray")
+        disk_row.add(disk_label)
+        disk_row.add_stretch()
+
+        def update_disk_label(statuses):
+            """ called from the monitor thread, the label is updated on the UI thread """
+            text = "\n".join(status.format() for status in statuses)
+            warning = any(status.warning for status in statuses)
+
+            def update():
+                disk_label.text = text
+                disk_label._widget.set_property("stylesheet", "font: bold; color: red" if warning else "font: italic; color: gray")
+
+            self.__api.queue_task(update)
+
+        from . import diskmonitor
+        # a monitor updating the panel of another window is replaced
+        if self.disk_monitor:
+            self.disk_monitor.stop()
+        self.disk_monitor = diskmonitor.DiskMonitor({"Data": get_data_base_dir(self.superstem_config_file),
+                                                     "Export": get_export_base_dir(self.superstem_config_file)},
+                                                    get_disk_monitor_interval(self.superstem_config_file),
+                                                    warning_free_bytes=get_disk_warning_free_bytes(self.superstem_config_file),
+                                                    warning_seconds=get_disk_warning_seconds(self.superstem_config_file),
+                                                    on_update=update_disk_label)
+        self.disk_monitor.start()
+        return disk_row
+
+    def start_session_archiver(self, project_string):
+        """ stages the files of the current project for archiving while the session runs,
+            unless it is the default project; an archiver of another project is stopped first
+        """
+        from . import archive
+        from . import staging
+        project_dir, project_name = archive.get_project_dir_and_name(project_string)
+        default_project_dir = archive.get_project_dir_and_name(get_default_project(self.superstem_config_file))[0]
+        if project_dir == default_project_dir or not project_dir.is_dir():
+            return
+        staging_area = staging.get_staging_area(project_dir, project_name,
+                                                get_archive_staging_dir(self.superstem_config_file),
+                                                compression=get_archive_compression(self.superstem_config_file))
+        if self.session_archiver:
+            if self.session_archiver.staging_area.staging_dir == staging_area.staging_dir:
+                return
+            self.session_archiver.stop()
+        self.session_archiver = staging.SessionArchiver(staging_area)
+        self.session_archiver.start()
+
     def update_button_state(self, button, **kwargs):
         """ This gets called for each editable field. It updates the relevant
             status boolean based on text in the field, and then the overall
@@ -1271,6 +1607,9 @@ class PanelSuperSTEMDelegate:
                 Parameters: button_list_index = selected export button string
             """
 
+            from nion.swift.model import ImportExportManager
+            from . import export
+            from . import preview
             writer = ImportExportManager.ImportExportManager().get_writer_by_id(self.io_handler_id)
             prefix = get_prefix_string(self.fields_no_edit.text)
             postfix = get_postfix_string(self.fields_sub_edit.text,
@@ -1280,7 +1619,7 @@ class PanelSuperSTEMDelegate:
             item.title = (prefix + str(button_list[button_list_index])
                           + postfix)
             # get latest export directory from persistent config
-            directory_string = self.__api.application.document_controllers[0]._document_controller.ui.get_persistent_string('export_directory')
+            directory_string = self.persistent_strings.get('export_directory')
             if len(directory_string) == 0:
                 logging.info("- Error!  Export directory variable empty!")
             else:
@@ -1302,7 +1641,15 @@ class PanelSuperSTEMDelegate:
                 self.quickexport_dmver_edit.text = "3"
                 
             filename = "{0}.{1}".format(item.title, dmextension)
-            export_path = pathlib.Path(directory_string).joinpath(filename)
+            if not self.export_layout:
+                self.export_layout = shard.ExportLayout(get_export_shard_by(self.superstem_config_file),
+                                                        get_export_shard_threshold(self.superstem_config_file),
+                                                        get_export_shard_no_range(self.superstem_config_file))
+            # the export directory itself, or its subfolder once it holds export_shard_threshold DM files
+            export_path = self.export_layout.get_export_path(directory_string, filename,
+                                                             button_list[button_list_index], self.fields_no_edit.text)
+            candidate_paths = self.export_layout.get_candidate_paths(directory_string, filename,
+                                                                     button_list[button_list_index], self.fields_no_edit.text)
 
             if not pathlib.Path.is_dir(export_path.parent):
                 #logging.info("- Creating Export Dir")
@@ -1311,20 +1658,76 @@ class PanelSuperSTEMDelegate:
                 #logging.info("- Export Directory exists")
                 pass
 
-            if not pathlib.Path.is_file(export_path):
+            def is_taken(path):
+                return (pathlib.Path.is_file(path)
+                        or (self.export_queue and self.export_queue.is_pending(path))
+                        or (self.export_spool and self.export_spool.is_pending(path)))
+
+            if not any(is_taken(path) for path in candidate_paths):
                 if self.renameonly:
                    mydata_item = item    
                    #logging.info(" data item %s", mydata_item.title) 
                    mydata_item.title = filename
                    logging.info("- Renamed data item to %s", mydata_item.title) 
                 else:
-                   ImportExportManager.ImportExportManager().write_display_item_with_writer(writer, item, export_path)
-                   logging.info("- Exported to %s", export_path.name)
+                   preview_format = get_export_preview_format(self.superstem_config_file)
+                   if preview_format and not self.preview_writer:
+                       self.preview_writer = preview.PreviewWriter(preview_format,
+                                                                   get_export_preview_size(self.superstem_config_file))
+                   if item.data_item is not None and item.data_item.xdata is not None and export.get_dm_save_image():
+                       # write from a snapshot in the background, limited by the export queue's memory ceiling;
+                       # the file is hashed while writing and added to the export dir's running manifest
+                       if not self.export_queue:
+                           def report_export_failed(failed_path, error):
+                               # called in the queue's thread, the dialog is opened in the UI thread
+                               self.__api.queue_task(functools.partial(self.show_warning_dialog,
+                                                                       "Export of {0} failed - {1}".format(failed_path.name, error),
+                                                                       True, False))
+                           self.export_queue = export.ExportQueue(get_export_memory_ceiling(self.superstem_config_file),
+                                                                  get_export_scratch_dir(self.superstem_config_file),
+                                                                  self.export_spool,
+                                                                  on_export_failed=report_export_failed)
+                       # the queue writes the preview from its snapshot
+                       self.export_queue.preview_writer = self.preview_writer
+                       self.export_queue.submit(item, export_path, reduce_export_data(item, button_list[button_list_index]))
+                       self.export_layout.add(export_path)
+                       logging.info("- Queued export to %s", export_path.name)
+                   else:
+                       if get_export_reduction_profile(self.superstem_config_file, str(button_list[button_list_index])):
+                           logging.info("- Reduction profile not applied, it needs the DM plugin of nionswift-io")
+                       write_fn = functools.partial(ImportExportManager.ImportExportManager().write_display_item_with_writer,
+                                                    writer, item)
+                       export.export_display_item(item, export_path, write_fn, self.export_spool)
+                       self.export_layout.add(export_path)
+                       logging.info("- Exported to %s", export_path.name)
+                       if self.preview_writer and item.data_item is not None and item.data_item.xdata is not None:
+                           self.preview_writer.submit(item.data_item.xdata, export_path)
             else:
                 # launch popup dialog if filename already exists
                 logging.info("----- COULD NOT EXPORT - FILE EXISTS !!! -----")
                 self.show_warning_dialog("Could not export - file exists", True, False)
 
+        def reduce_export_data(item, button_label):
+            """ Applies the reduction profile of the export button, if there is one.
+                Returns the reduced data, or None to export the full data.
+            """
+            profile = get_export_reduction_profile(self.superstem_config_file, str(button_label))
+            if not profile:
+                return None
+            from . import reduction
+            try:
+                xdata, description = reduction.reduce_xdata(item.data_item.xdata, profile,
+                                                            reduction.get_roi_bounds(item), str(button_label))
+            except Exception as e:
+                logging.info("----- REDUCTION FAILED, exporting full data: %s -----", e)
+                return None
+            if description:
+                logging.info("- Reduced %s to %s %s", description["original_shape"], list(xdata.data.shape), xdata.data.dtype)
+                return xdata
+            return None
+
+        profiled_export_button_clicked = self.profiled("export", export_button_clicked)
+
         # == make specific export buttons
         # don't know how many buttons there are, so it's possible to have
         # not enough to fill a row of 4
@@ -1333,7 +1736,7 @@ class PanelSuperSTEMDelegate:
             row.add(self.button1)
             row.add_spacing(1)
             self.button_widgets_list.append(self.button1)
-            self.button1.on_clicked = functools.partial(export_button_clicked, (no_buttons_per_row*index))
+            self.button1.on_clicked = functools.partial(profiled_export_button_clicked, (no_buttons_per_row*index))
         except IndexError:
             # logging.info("export_button_clicked: IndexError at Button1, row %s", index)
             pass
@@ -1342,7 +1745,7 @@ class PanelSuperSTEMDelegate:
             row.add(self.button2)
             row.add_spacing(1)
             self.button_widgets_list.append(self.button2)
-            self.button2.on_clicked = functools.partial(export_button_clicked, (no_buttons_per_row*index)+1)
+            self.button2.on_clicked = functools.partial(profiled_export_button_clicked, (no_buttons_per_row*index)+1)
         except IndexError:
             # logging.info("export_button_clicked: IndexError at  Button2, row %s", index)
             pass
@@ -1351,7 +1754,7 @@ class PanelSuperSTEMDelegate:
             row.add(self.button3)
             row.add_spacing(1)
             self.button_widgets_list.append(self.button3)
-            self.button3.on_clicked = functools.partial(export_button_clicked, (no_buttons_per_row*index)+2)
+            self.button3.on_clicked = functools.partial(profiled_export_button_clicked, (no_buttons_per_row*index)+2)
         except IndexError:
             # logging.info("export_button_clicked: IndexError at Button3, row %s", index)
             pass
@@ -1360,7 +1763,7 @@ class PanelSuperSTEMDelegate:
             row.add(self.button4)
             row.add_spacing(2)
             self.button_widgets_list.append(self.button4)
-            self.button4.on_clicked = functools.partial(export_button_clicked, (no_buttons_per_row*index)+3)
+            self.button4.on_clicked = functools.partial(profiled_export_button_clicked, (no_buttons_per_row*index)+3)
         except IndexError:
             # logging.info("export_button_clicked: IndexError at Button4, row %s ", index)
             pass
@@ -1,3 +1,8 @@
-from . import SuperSTEM 
+import sys
+
+# the panel is only loaded inside Swift, which has imported nion.swift before it loads plug-ins;
+# the archive modules and superstem-archive (cli.py) run without Swift, e.g. on a post-processing server
+if "nion.swift" in sys.modules:
+    from . import SuperSTEM
 #from . import MenuDMH
 #from . import DialogDMH
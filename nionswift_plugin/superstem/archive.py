@@ -0,0 +1,374 @@
+# standard libraries
+import concurrent.futures
+import copy
+import functools
+import hashlib
+import heapq
+import logging
+import lzma
+import os
+import pathlib
+import shutil
+import struct
+import zipfile
+import zlib
+
+# local libraries
+from . import archive_index
+from . import codec
+from . import manifest
+from . import transfer
+from .throttle import Throttle
+
+
+# a Swift project "<name>.nsproj" lives in its own library folder "<name>_Raw"
+PROJECT_SUFFIX = ".nsproj"
+RAW_SUFFIX = "_Raw"
+ARCHIVE_SUFFIX = RAW_SUFFIX + ".zip"
+
+# zip format constants for copying compressed members between archives
+LOCAL_HEADER_SIZE = 30
+DATA_DESCRIPTOR_FLAG = 0x08
+# extra field holding the SHA-256 of the uncompressed member, ignored by other zip tools
+SHA256_EXTRA_ID = 0x5353
+SHA256_EXTRA_PLACEHOLDER = struct.pack("<HH", SHA256_EXTRA_ID, 32) + bytes(32)
+
+
+def get_project_path(project_string) -> pathlib.Path:
+    """
+    Turns a persistent project string into a path. The string may have been written
+    on Windows or Linux, so both "\\" and "/" are accepted as separators.
+    """
+    return pathlib.Path(str(project_string).strip().replace("\\", "/"))
+
+
+def get_project_dir_and_name(project_string):
+    """
+    Returns the project directory path and the project name (without ".nsproj")
+    for a persistent project string, which is either the path of the .nsproj file
+    or the path of the library folder containing it.
+    """
+    project_path = get_project_path(project_string)
+    if project_path.suffix == PROJECT_SUFFIX:
+        return project_path.parent, project_path.stem
+    project_name = project_path.name
+    if project_name.endswith(RAW_SUFFIX):
+        project_name = project_name[:-len(RAW_SUFFIX)]
+    return project_path, project_name
+
+
+def compress_directory(folder_path, archive_path, compression=zipfile.ZIP_LZMA, throttle=None):
+    """
+    Compresses folder_path into the zip archive archive_path.
+    compression is a zipfile compression type or a codec.CompressionPolicy choosing it per file.
+    Member names start with the folder name, as with "7z a archive.zip folder".
+    The archive is written under a temporary name and only renamed when complete.
+    """
+    folder_path = pathlib.Path(folder_path)
+    archive_path = pathlib.Path(archive_path)
+    partial_path = archive_path.with_name(archive_path.name + ".part")
+
+    with zipfile.ZipFile(partial_path, "w", allowZip64=True) as zf:
+        for dir_path, dir_names, file_names in os.walk(folder_path):
+            dir_names.sort()
+            dir_path = pathlib.Path(dir_path)
+            zf.write(dir_path, dir_path.relative_to(folder_path.parent).as_posix())
+            for file_name in sorted(file_names):
+                file_path = dir_path / file_name
+                write_member(zf, file_path, file_path.relative_to(folder_path.parent).as_posix(),
+                             codec.get_compress_type(compression, file_path), throttle)
+    partial_path.replace(archive_path)
+
+
+def get_shards(file_sizes, shard_count):
+    """
+    Splits (file path, size) pairs into up to shard_count shards of about equal total size,
+    largest files first, so that no worker is left with all the big files.
+    """
+    shards = [list() for i in range(max(1, min(shard_count, len(file_sizes))))]
+    heap = [(0, i) for i in range(len(shards))]
+    for file_path, file_size in sorted(file_sizes, key=lambda file_size: file_size[1], reverse=True):
+        shard_size, i = heapq.heappop(heap)
+        shards[i].append(file_path)
+        heapq.heappush(heap, (shard_size + file_size, i))
+    return [shard for shard in shards if shard]
+
+
+def compress_shard(folder_path, file_paths, shard_path, compression, max_bytes_per_second=None):
+    """ compresses one shard of the files of folder_path into its own zip, run by a worker thread or process """
+    folder_path = pathlib.Path(folder_path)
+    shard_throttle = Throttle(max_bytes_per_second)
+    with zipfile.ZipFile(shard_path, "w", allowZip64=True) as zf:
+        for file_path in file_paths:
+            file_path = pathlib.Path(file_path)
+            write_member(zf, file_path, file_path.relative_to(folder_path.parent).as_posix(),
+                         codec.get_compress_type(compression, file_path), shard_throttle)
+    return shard_path
+
+
+def compress_directory_parallel(folder_path, archive_path, compression=zipfile.ZIP_LZMA, workers=1, throttle=None,
+                                processes=False):
+    """
+    Compresses folder_path into archive_path like compress_directory, but splits the files into
+    shards balanced by size, compresses the shards in parallel and then merges them into one
+    zip by copying the compressed members, in the same member order as compress_directory.
+    Workers are threads by default, which scale because zlib and lzma release the GIL while
+    compressing; processes=True uses a process pool instead (for the command line, not inside Swift).
+    throttle limits the total read rate, split evenly between the workers.
+    """
+    folder_path = pathlib.Path(folder_path)
+    archive_path = pathlib.Path(archive_path)
+    if workers <= 1:
+        compress_directory(folder_path, archive_path, compression, throttle)
+        return
+
+    file_sizes = list()
+    for dir_path, dir_names, file_names in os.walk(folder_path):
+        for file_name in file_names:
+            file_path = pathlib.Path(dir_path) / file_name
+            file_sizes.append((str(file_path), file_path.stat().st_size))
+    shards = get_shards(file_sizes, workers * 2)
+    shards_dir = archive_path.with_name(archive_path.name + ".shards")
+    shards_dir.mkdir(parents=True, exist_ok=True)
+    max_bytes_per_second = throttle.max_bytes_per_second // workers if throttle and throttle.max_bytes_per_second else None
+    logging.info("- Compressing %d files in %d shards with %d workers", len(file_sizes), len(shards), workers)
+
+    executor_class = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+    shard_compressions = [compression] * len(shards)
+    if processes and isinstance(compression, codec.CompressionPolicy):
+        # each process gets its own copy of the policy, with its share of the time budget
+        file_size_by_path = dict(file_sizes)
+        shard_compressions = compression.split([sum(file_size_by_path[file_path] for file_path in shard) for shard in shards])
+    try:
+        with executor_class(max_workers=workers) as executor:
+            futures = [executor.submit(compress_shard, str(folder_path), shard, str(shards_dir / "shard{0:04d}.zip".format(i)),
+                                       shard_compressions[i], max_bytes_per_second) for i, shard in enumerate(shards)]
+            shard_paths = [future.result() for future in futures]
+
+        partial_path = archive_path.with_name(archive_path.name + ".part")
+        shard_zfs = [zipfile.ZipFile(shard_path, "r") for shard_path in shard_paths]
+        try:
+            members = {zinfo.filename: (shard_zf, zinfo) for shard_zf in shard_zfs for zinfo in shard_zf.infolist()}
+            with zipfile.ZipFile(partial_path, "w", allowZip64=True) as zf:
+                for dir_path, dir_names, file_names in os.walk(folder_path):
+                    dir_names.sort()
+                    dir_path = pathlib.Path(dir_path)
+                    zf.write(dir_path, dir_path.relative_to(folder_path.parent).as_posix())
+                    for file_name in sorted(file_names):
+                        member_name = (dir_path / file_name).relative_to(folder_path.parent).as_posix()
+                        if member_name in members:
+                            copy_member_raw(*members[member_name], zf)
+                        else:
+                            # appeared while the shards were compressed
+                            write_member(zf, dir_path / file_name, member_name,
+                                         codec.get_compress_type(compression, dir_path / file_name), throttle)
+        finally:
+            for shard_zf in shard_zfs:
+                shard_zf.close()
+        partial_path.replace(archive_path)
+    finally:
+        shutil.rmtree(shards_dir, ignore_errors=True)
+
+
+def write_member(zf: zipfile.ZipFile, file_path, member_name, compression, throttle=None):
+    """
+    Streams one file into the open archive in chunks, so that the read rate can be throttled.
+    The SHA-256 of the file is calculated on the way and stored in an extra field of the member,
+    which survives copy_member_raw, so the archive index gets it without reading the data again.
+    Returns the SHA-256 hex digest.
+    """
+    zinfo = zipfile.ZipInfo.from_file(file_path, member_name)
+    zinfo.compress_type = compression
+    # the local header is written before the data and rewritten on close, so the extra field
+    # is reserved with the same length now and filled in once the hash is known
+    zinfo.extra = SHA256_EXTRA_PLACEHOLDER
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as src, zf.open(zinfo, "w", force_zip64=zinfo.file_size > zipfile.ZIP64_LIMIT) as dst:
+        for chunk in iter(functools.partial(src.read, manifest.CHUNK_SIZE), b""):
+            dst.write(chunk)
+            sha256.update(chunk)
+            if throttle:
+                throttle.consume(len(chunk))
+        zinfo.extra = struct.pack("<HH", SHA256_EXTRA_ID, 32) + sha256.digest()
+    return sha256.hexdigest()
+
+
+def get_member_sha256(zinfo: zipfile.ZipInfo):
+    """ returns the SHA-256 hex digest stored by write_member in the extra field, or None """
+    extra = zinfo.extra
+    i = 0
+    while i + 4 <= len(extra):
+        field_id, field_length = struct.unpack("<HH", extra[i:i + 4])
+        if field_id == SHA256_EXTRA_ID and field_length == 32:
+            return extra[i + 4:i + 36].hex()
+        i += 4 + field_length
+    return None
+
+
+def strip_zip64_extra(extra):
+    """ removes the zip64 extra field (id 1), which FileHeader adds again if needed """
+    stripped = b""
+    i = 0
+    while i + 4 <= len(extra):
+        field_id, field_length = struct.unpack("<HH", extra[i:i + 4])
+        if field_id != 1:
+            stripped += extra[i:i + 4 + field_length]
+        i += 4 + field_length
+    return stripped
+
+
+def copy_member_raw(source: zipfile.ZipFile, zinfo: zipfile.ZipInfo, target: zipfile.ZipFile):
+    """
+    Copies one member with its already compressed data from source into target, which
+    must be open for writing, without decompressing and recompressing it.
+    This is how separately compressed parts are assembled into one archive.
+    """
+    source.fp.seek(zinfo.header_offset)
+    header = source.fp.read(LOCAL_HEADER_SIZE)
+    if header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile("Bad local header for member {0}".format(zinfo.filename))
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    source.fp.seek(zinfo.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length)
+
+    target_zinfo = copy.copy(zinfo)
+    # sizes and CRC are known, so they go into the local header instead of a data descriptor
+    target_zinfo.flag_bits &= ~DATA_DESCRIPTOR_FLAG
+    target_zinfo.extra = strip_zip64_extra(zinfo.extra)
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+    target_zinfo.header_offset = target.fp.tell()
+    target.fp.write(target_zinfo.FileHeader(zip64))
+    remaining = zinfo.compress_size
+    while remaining > 0:
+        chunk = source.fp.read(min(remaining, manifest.CHUNK_SIZE))
+        if not chunk:
+            raise zipfile.BadZipFile("Truncated data for member {0}".format(zinfo.filename))
+        target.fp.write(chunk)
+        remaining -= len(chunk)
+    target.filelist.append(target_zinfo)
+    target.NameToInfo[target_zinfo.filename] = target_zinfo
+    # the central directory is written from start_dir when target is closed
+    target.start_dir = target.fp.tell()
+
+
+def verify_archive(archive_path, workers=1, throttle=None):
+    """
+    Reads back every member of the archive and checks its CRC, returns True if all are good.
+    Members are split between up to workers threads, each with its own handle on the archive.
+    """
+    def check_members(member_names):
+        with zipfile.ZipFile(archive_path, "r") as zf:
+            for member_name in member_names:
+                with zf.open(member_name, "r") as f:
+                    # reading to the end raises BadZipFile on a CRC mismatch
+                    for chunk in iter(functools.partial(f.read, manifest.CHUNK_SIZE), b""):
+                        if throttle:
+                            throttle.consume(len(chunk))
+
+    try:
+        with zipfile.ZipFile(archive_path, "r") as zf:
+            member_names = [zinfo.filename for zinfo in zf.infolist() if not zinfo.is_dir()]
+        workers = max(1, min(workers, len(member_names)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(check_members, member_names[i::workers]) for i in range(workers)]:
+                future.result()
+    except (OSError, EOFError, zipfile.BadZipFile, lzma.LZMAError, zlib.error) as e:
+        logging.info("- Archive %s is corrupt: %s", archive_path, e)
+        return False
+    return True
+
+
+class ArchiveJob:
+    """
+    Compress -> verify -> hash job for one raw Swift project, replacing compress.bat
+    and newHashes.bat:
+    - compresses the project library folder to <export_base_dir>/<name>/<name>_Raw.zip,
+      or finalises the archive from the files staged during the session
+    - if OK, then tests the archive and writes its side-index for restoring single data items
+    - if OK, then writes a hashes file for all of export_base_dir (New_Data),
+      ready to be uploaded via GoodSync
+    - if a transfer_destination is given, copies New_Data there, checked against the hashes file
+    """
+
+    def __init__(self, project_dir, project_name, export_base_dir, instrument="sstem3", workers=1, throttle=None,
+                 update_hashes=False, staging_area=None, compression=None, processes=False, transfer_destination=None):
+        self.project_dir = pathlib.Path(project_dir)
+        self.project_name = project_name
+        self.export_base_dir = pathlib.Path(export_base_dir)
+        self.instrument = instrument
+        self.workers = workers
+        self.throttle = throttle
+        # when True the hashes stage re-uses unchanged entries of the latest hashes file
+        self.update_hashes = update_hashes
+        # staging.StagingArea of the project; if it holds staged files the archive is only finalised
+        self.staging_area = staging_area
+        # zipfile compression type or codec.CompressionPolicy, by default adaptive per file
+        self.compression = compression if compression is not None else codec.CompressionPolicy()
+        # compress shards in worker processes instead of threads
+        self.processes = processes
+        # upload area or mirror that New_Data is copied to after hashing, None for no transfer
+        self.transfer_destination = transfer_destination
+
+    @classmethod
+    def from_project_string(cls, project_string, export_base_dir, instrument="sstem3", **kwargs):
+        """ creates the job from a persistent project string such as sstem_last_project_dir """
+        project_dir, project_name = get_project_dir_and_name(project_string)
+        return cls(project_dir, project_name, export_base_dir, instrument, **kwargs)
+
+    @property
+    def output_dir(self) -> pathlib.Path:
+        return self.export_base_dir / self.project_name
+
+    @property
+    def archive_path(self) -> pathlib.Path:
+        return self.output_dir / (self.project_name + ARCHIVE_SUFFIX)
+
+    def run(self):
+        """ runs all stages in turn, returns 0 on success and 1 on the first failing stage """
+        if not self.project_dir.is_dir():
+            logging.info("- Project folder %s not found", self.project_dir)
+            return 1
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        logging.info("--- Compressing %s to %s", self.project_dir, self.archive_path)
+        try:
+            if self.staging_area is not None and self.staging_area.has_staged_files():
+                self.staging_area.finalize(self.archive_path)
+            else:
+                compress_directory_parallel(self.project_dir, self.archive_path, self.compression, self.workers,
+                                            self.throttle, self.processes)
+        except Exception as e:
+            logging.info("- Compression failed: %s", e)
+            return 1
+
+        logging.info("--- Testing the archive...")
+        if not verify_archive(self.archive_path, self.workers, self.throttle):
+            logging.info("- Archive test failed.")
+            return 1
+        if self.staging_area is not None:
+            self.staging_area.remove()
+        codec.write_compression_report(self.archive_path)
+        try:
+            archive_index.write_index(self.archive_path, self.project_dir)
+        except Exception as e:
+            # the archive is good, it can still be indexed later with "superstem-archive index"
+            logging.info("- Writing the archive index failed: %s", e)
+        logging.info("--- Success: The folder was compressed and verified successfully.")
+
+        logging.info("--- Calculating hashes of New_Data ...")
+        try:
+            previous_hashes_file = manifest.find_latest_hashes_file(self.export_base_dir) if self.update_hashes else None
+            hashes_file = manifest.write_hashes_file(self.export_base_dir, self.instrument, self.workers, self.throttle,
+                                                     previous_hashes_file)
+        except Exception as e:
+            logging.info("- Calculating hashes failed: %s", e)
+            return 1
+
+        if self.transfer_destination:
+            logging.info("--- Transferring New_Data to %s ...", self.transfer_destination)
+            report = transfer.transfer_directory(self.export_base_dir, self.transfer_destination, hashes_file,
+                                                 self.workers, throttle=self.throttle)
+            report.log_summary()
+            if not report.ok:
+                return 1
+        return 0
+
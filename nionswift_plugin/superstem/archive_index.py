@@ -0,0 +1,248 @@
+# standard libraries
+import hashlib
+import json
+import logging
+import lzma
+import os
+import pathlib
+import struct
+import zipfile
+import zlib
+
+# local libraries
+from . import archive
+from . import manifest
+
+
+# the index of <name>_Raw.zip is <name>_Raw.zip.index.json
+INDEX_SUFFIX = ".index.json"
+INDEX_VERSION = 1
+# Swift data item files, whose properties hold the data item uuid and title
+DATA_ITEM_SUFFIXES = {".ndata", ".h5"}
+
+
+def get_index_path(archive_path) -> pathlib.Path:
+    archive_path = pathlib.Path(archive_path)
+    return archive_path.with_name(archive_path.name + INDEX_SUFFIX)
+
+
+def read_data_item_properties(f, suffix):
+    """
+    Returns the properties of a Swift data item file (opened binary and seekable), or an empty dict.
+    .ndata files are zips with a metadata.json member; .h5 files keep them in the "properties"
+    attribute of the data set and need h5py, which is optional.
+    """
+    try:
+        if suffix == ".ndata":
+            with zipfile.ZipFile(f, "r") as zf:
+                return json.loads(zf.read("metadata.json").decode("utf-8"))
+        if suffix == ".h5":
+            try:
+                import h5py
+            except ImportError:
+                return dict()
+            with h5py.File(f, "r") as hf:
+                return json.loads(hf["data"].attrs["properties"])
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        logging.info("- Could not read data item properties: %s", e)
+    return dict()
+
+
+def read_project_titles(f):
+    """ returns data item uuid -> title from a .nsproj file, whose titles are newer than those in the data files """
+    try:
+        project_properties = json.load(f)
+    except ValueError:
+        return dict()
+    return {data_item.get("uuid"): data_item.get("title") for data_item in project_properties.get("data_items", list())
+            if data_item.get("uuid")}
+
+
+def get_data_offset(f, header_offset):
+    """ reads the local header of a member and returns the offset of its compressed data """
+    f.seek(header_offset)
+    header = f.read(archive.LOCAL_HEADER_SIZE)
+    if header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile("Bad local header at offset {0}".format(header_offset))
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    return header_offset + archive.LOCAL_HEADER_SIZE + name_length + extra_length
+
+
+def write_index(archive_path, project_dir=None):
+    """
+    Writes the side-index <archive>.index.json of a zip archive, so single data items can be
+    restored from it without opening the zip or reading its central directory.
+    For every file member it records the offset and size of the compressed data, compression type,
+    CRC and SHA-256, and for Swift data items also their uuid and title.
+    The properties are read from the project folder if it is still there (project_dir being the
+    <name>_Raw library folder the archive was made from), else from the archive itself.
+    Members written before the SHA-256 was stored in the archive are hashed while indexing.
+    The index is written under a temporary name and only renamed when complete.
+    Returns the path of the index.
+    """
+    archive_path = pathlib.Path(archive_path)
+    source_root = pathlib.Path(project_dir).parent if project_dir else None
+    stat = archive_path.stat()
+    members = list()
+    titles = dict()
+    with zipfile.ZipFile(archive_path, "r") as zf, open(archive_path, "rb") as f:
+        for zinfo in zf.infolist():
+            if zinfo.is_dir():
+                continue
+            member_path = pathlib.PurePosixPath(zinfo.filename)
+            source_path = source_root / member_path if source_root else None
+            if source_path is not None and not source_path.is_file():
+                source_path = None
+            entry = {"name": zinfo.filename,
+                     "data_offset": get_data_offset(f, zinfo.header_offset),
+                     "compress_size": zinfo.compress_size,
+                     "file_size": zinfo.file_size,
+                     "compress_type": zinfo.compress_type,
+                     "crc": zinfo.CRC,
+                     "sha256": archive.get_member_sha256(zinfo)}
+            if entry["sha256"] is None:
+                sha256 = hashlib.sha256()
+                with zf.open(zinfo, "r") as member_file:
+                    for chunk in iter(lambda: member_file.read(manifest.CHUNK_SIZE), b""):
+                        sha256.update(chunk)
+                entry["sha256"] = sha256.hexdigest()
+            suffix = member_path.suffix.lower()
+            if suffix in DATA_ITEM_SUFFIXES:
+                with (open(source_path, "rb") if source_path else zf.open(zinfo, "r")) as item_file:
+                    properties = read_data_item_properties(item_file, suffix)
+                entry["uuid"] = properties.get("uuid")
+                entry["title"] = properties.get("title")
+            elif suffix == archive.PROJECT_SUFFIX:
+                with (open(source_path, "rb") if source_path else zf.open(zinfo, "r")) as project_file:
+                    titles.update(read_project_titles(project_file))
+            members.append(entry)
+    for entry in members:
+        if entry.get("uuid") in titles:
+            entry["title"] = titles[entry["uuid"]]
+
+    index = {"version": INDEX_VERSION,
+             "archive": archive_path.name,
+             "archive_size": stat.st_size,
+             "members": members}
+    index_path = get_index_path(archive_path)
+    partial_path = index_path.with_name(index_path.name + ".part")
+    with open(partial_path, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    partial_path.replace(index_path)
+    logging.info("- Index of %d members written to %s", len(members), index_path)
+    return index_path
+
+
+def read_index(archive_path):
+    """ reads the side-index of an archive, raises OSError or ValueError if it is missing or stale """
+    archive_path = pathlib.Path(archive_path)
+    with open(get_index_path(archive_path), "r") as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION:
+        raise ValueError("Unknown index version {0}".format(index.get("version")))
+    if index["archive_size"] != archive_path.stat().st_size:
+        raise ValueError("Index of {0} does not match the archive".format(archive_path))
+    return index
+
+
+def find_members(index, uuid=None, title=None, member_name=None):
+    """ returns the index entries matching a data item uuid, title or member name (relative original path) """
+    if member_name is not None:
+        member_name = manifest.get_manifest_key(member_name)
+    entries = list()
+    for entry in index["members"]:
+        if uuid is not None and (entry.get("uuid") or "").lower() == uuid.lower():
+            entries.append(entry)
+        elif title is not None and entry.get("title") == title:
+            entries.append(entry)
+        elif member_name is not None and (entry["name"] == member_name or entry["name"].endswith("/" + member_name)):
+            entries.append(entry)
+    return entries
+
+
+class MemberDecompressor:
+    """ decompresses the raw data of one zip member, as read from the archive in chunks """
+
+    def __init__(self, compress_type):
+        self.compress_type = compress_type
+        self.__decompressor = None
+        self.__header = b""
+        if compress_type == zipfile.ZIP_DEFLATED:
+            self.__decompressor = zlib.decompressobj(-15)
+        elif compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_LZMA):
+            raise NotImplementedError("Compression type {0} not supported".format(compress_type))
+
+    def decompress(self, data):
+        if self.compress_type == zipfile.ZIP_STORED:
+            return data
+        if self.__decompressor is None:
+            # zip LZMA data starts with version (2 bytes), size of the properties (2 bytes) and
+            # the LZMA1 properties, followed by the raw stream
+            self.__header += data
+            if len(self.__header) < 4:
+                return b""
+            properties_size = struct.unpack("<H", self.__header[2:4])[0]
+            if len(self.__header) < 4 + properties_size:
+                return b""
+            properties = self.__header[4:4 + properties_size]
+            lclppb = properties[0]
+            lzma1_filter = {"id": lzma.FILTER_LZMA1, "lc": lclppb % 9, "lp": lclppb // 9 % 5, "pb": lclppb // 45,
+                            "dict_size": struct.unpack("<I", properties[1:5])[0]}
+            self.__decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[lzma1_filter])
+            data = self.__header[4 + properties_size:]
+        return self.__decompressor.decompress(data)
+
+
+def iter_member_data(archive_path, entry, throttle=None):
+    """
+    Yields the decompressed data of one member in chunks, reading only its compressed data from
+    the archive: a seek to the offset recorded in the index and one sequential read, so the time
+    does not depend on the size of the archive. Raises BadZipFile after the last chunk if size,
+    CRC or SHA-256 do not match the index.
+    """
+    decompressor = MemberDecompressor(entry["compress_type"])
+    crc = 0
+    sha256 = hashlib.sha256()
+    read_size = 0
+    with open(archive_path, "rb") as f:
+        f.seek(entry["data_offset"])
+        remaining = entry["compress_size"]
+        while remaining > 0:
+            chunk = f.read(min(remaining, manifest.CHUNK_SIZE))
+            if not chunk:
+                raise EOFError("Truncated data for member {0}".format(entry["name"]))
+            remaining -= len(chunk)
+            if throttle:
+                throttle.consume(len(chunk))
+            data = decompressor.decompress(chunk)[:entry["file_size"] - read_size]
+            crc = zlib.crc32(data, crc)
+            sha256.update(data)
+            read_size += len(data)
+            yield data
+    if read_size != entry["file_size"] or crc != entry["crc"] or (entry.get("sha256") and sha256.hexdigest() != entry["sha256"]):
+        raise zipfile.BadZipFile("Member {0} does not match the index".format(entry["name"]))
+
+
+def verify_member(archive_path, entry, throttle=None):
+    """ reads back one member and checks it against the index, raises BadZipFile if it does not match """
+    for data in iter_member_data(archive_path, entry, throttle):
+        pass
+
+
+def restore_member(archive_path, entry, output_path, throttle=None):
+    """
+    Restores one member to output_path, reading only its data from the archive (see iter_member_data).
+    The file is written under a temporary name and only renamed when it matches the index.
+    """
+    output_path = pathlib.Path(output_path)
+    partial_path = output_path.with_name(output_path.name + ".part")
+    try:
+        with open(partial_path, "wb") as dst:
+            for data in iter_member_data(archive_path, entry, throttle):
+                dst.write(data)
+    except Exception:
+        os.remove(partial_path)
+        raise
+    partial_path.replace(output_path)
+    logging.info("- Restored %s to %s", entry["name"], output_path)
+    return output_path
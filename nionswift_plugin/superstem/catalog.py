@@ -0,0 +1,273 @@
+# standard libraries
+import json
+import logging
+import os
+import pathlib
+import re
+import sqlite3
+import zipfile
+
+# third party libraries
+import numpy
+
+# local libraries
+from . import archive
+from . import manifest
+
+
+# Swift data item files and DM files written by the export buttons
+DATA_ITEM_SUFFIXES = {".ndata", ".h5"}
+EXPORT_SUFFIXES = {".dm3", ".dm4"}
+# fields of the session metadata, stored by Swift as library values stem.session.<field>
+SESSION_FIELDS = ("site", "instrument", "task", "microscopist", "sample", "sample_area")
+# titles given by the export buttons: NNN_Detector[_Sub]_FOVnm_Descr
+TITLE_PATTERN = re.compile(r"^(?P<no>\d+)_(?P<detector>[^_]+)(?:_(?P<sub>[^_]+?))?_(?P<fov>\d+(?:\.\d+)?)nm_(?P<descr>.*)$")
+# library and export folders are named YYYY_MM_DD_<MICROSCOPIST>_S<sample>_<sample area>
+SESSION_NAME_PATTERN = re.compile(r"^(?P<date>\d{4}_\d{2}_\d{2})_(?P<microscopist>[^_]*)_S(?P<sample>[^_]*)_(?P<sample_area>.*?)(?: \d+)?$")
+# changes are committed every so many files, so an interrupted update keeps most of its work
+COMMIT_INTERVAL = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, kind TEXT, size INTEGER, mtime_ns INTEGER);
+CREATE TABLE IF NOT EXISTS items (path TEXT, kind TEXT, session TEXT, uuid TEXT, title TEXT, no INTEGER,
+                                  detector TEXT, sub TEXT, fov_nm REAL, descr TEXT, shape TEXT, dtype TEXT,
+                                  created TEXT);
+CREATE TABLE IF NOT EXISTS project_items (uuid TEXT PRIMARY KEY, path TEXT, title TEXT, created TEXT);
+CREATE TABLE IF NOT EXISTS sessions (session TEXT PRIMARY KEY, date TEXT, site TEXT, instrument TEXT, task TEXT,
+                                     microscopist TEXT, sample TEXT, sample_area TEXT);
+CREATE INDEX IF NOT EXISTS items_path ON items (path);
+CREATE INDEX IF NOT EXISTS items_uuid ON items (uuid);
+CREATE INDEX IF NOT EXISTS items_title ON items (title);
+CREATE INDEX IF NOT EXISTS items_detector ON items (detector COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS items_session ON items (session);
+CREATE INDEX IF NOT EXISTS project_items_path ON project_items (path);
+CREATE INDEX IF NOT EXISTS sessions_sample ON sessions (sample COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS sessions_microscopist ON sessions (microscopist COLLATE NOCASE);
+"""
+
+
+def parse_title(title):
+    """ splits a title NNN_Detector[_Sub]_FOVnm_Descr into its fields, all None if it is not named that way """
+    match = TITLE_PATTERN.match(title or "")
+    if not match:
+        return {"no": None, "detector": None, "sub": None, "fov_nm": None, "descr": None}
+    return {"no": int(match.group("no")), "detector": match.group("detector"), "sub": match.group("sub"),
+            "fov_nm": float(match.group("fov")), "descr": match.group("descr")}
+
+
+def parse_session_name(session):
+    """ returns the session fields encoded in a library or export folder name, or an empty dict """
+    match = SESSION_NAME_PATTERN.match(session or "")
+    return match.groupdict() if match else dict()
+
+
+def get_session(relative_path: pathlib.PurePath):
+    """ the session of a file is its top level folder below the base directory, without _Raw """
+    session = relative_path.parts[0] if len(relative_path.parts) > 1 else ""
+    return session[:-len(archive.RAW_SUFFIX)] if session.endswith(archive.RAW_SUFFIX) else session
+
+
+def read_data_item_file(file_path):
+    """
+    Returns the properties, shape and dtype of a Swift data item file without reading its data:
+    .ndata files are zips with metadata.json and an uncompressed data.npy, of which only the header
+    is read; .h5 files need h5py, which is optional.
+    """
+    suffix = file_path.suffix.lower()
+    if suffix == ".ndata":
+        with zipfile.ZipFile(file_path, "r") as zf:
+            properties = json.loads(zf.read("metadata.json").decode("utf-8"))
+            shape = dtype = None
+            if "data.npy" in zf.namelist():
+                with zf.open("data.npy", "r") as f:
+                    version = numpy.lib.format.read_magic(f)
+                    if version == (1, 0):
+                        shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(f)
+                    else:
+                        shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(f)
+            return properties, shape, dtype
+    try:
+        import h5py
+    except ImportError:
+        return dict(), None, None
+    with h5py.File(file_path, "r") as hf:
+        dataset = hf["data"]
+        return json.loads(dataset.attrs["properties"]), dataset.shape, dataset.dtype
+
+
+class Catalog:
+    """
+    Offline catalog of Swift projects and exports in a local SQLite database, so sessions,
+    samples and detector images can be found without opening the projects in Swift.
+    update() walks data_base_directory and export_base_directory and only reads files that
+    are new or changed (by size and mtime) since the last update; deleted files are dropped.
+    Only the project files, the metadata of the data item files and the file names of the
+    exports are read, never the data itself.
+    """
+
+    def __init__(self, database_path):
+        self.database_path = pathlib.Path(database_path)
+        self.database_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.database_path))
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def update(self, data_base_dir=None, export_base_dir=None):
+        """ brings the catalog up to date with the given directories, returns the number of files read """
+        read_count = 0
+        if data_base_dir:
+            read_count += self.__update_root(pathlib.Path(data_base_dir), "project")
+        if export_base_dir:
+            read_count += self.__update_root(pathlib.Path(export_base_dir), "export")
+        logging.info("- Catalog %s updated, %d files read", self.database_path, read_count)
+        return read_count
+
+    def __update_root(self, root_path, kind):
+        suffixes = DATA_ITEM_SUFFIXES | {archive.PROJECT_SUFFIX} if kind == "project" else EXPORT_SUFFIXES
+        root_prefix = os.path.join(str(root_path), "")
+        known = {row["path"]: (row["size"], row["mtime_ns"]) for row in
+                 self.connection.execute("SELECT path, size, mtime_ns FROM files WHERE kind = ?", (kind,))
+                 if row["path"].startswith(root_prefix)}
+        seen = set()
+        changed_projects = list()
+        read_count = 0
+        for dir_path, dir_names, file_names in os.walk(root_path):
+            dir_names[:] = [dir_name for dir_name in dir_names if manifest.SKIP_MARKER not in dir_name]
+            for file_name in file_names:
+                file_path = pathlib.Path(dir_path) / file_name
+                if file_path.suffix.lower() not in suffixes:
+                    continue
+                try:
+                    stat = file_path.stat()
+                except OSError:
+                    continue
+                path = str(file_path)
+                seen.add(path)
+                if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                if file_path.suffix == archive.PROJECT_SUFFIX:
+                    # projects last, their titles override those in the data item files
+                    changed_projects.append((file_path, stat))
+                    continue
+                self.__read_file(file_path, root_path, kind, stat)
+                read_count += 1
+                if read_count % COMMIT_INTERVAL == 0:
+                    self.connection.commit()
+        for file_path, stat in changed_projects:
+            self.__read_file(file_path, root_path, kind, stat)
+            read_count += 1
+        for path in set(known) - seen:
+            self.__remove_file(path)
+        self.connection.commit()
+        return read_count
+
+    def __remove_file(self, path):
+        self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+        self.connection.execute("DELETE FROM items WHERE path = ?", (path,))
+        self.connection.execute("DELETE FROM project_items WHERE path = ?", (path,))
+
+    def __read_file(self, file_path, root_path, kind, stat):
+        path = str(file_path)
+        self.__remove_file(path)
+        self.connection.execute("INSERT INTO files (path, kind, size, mtime_ns) VALUES (?, ?, ?, ?)",
+                                (path, kind, stat.st_size, stat.st_mtime_ns))
+        session = get_session(file_path.relative_to(root_path))
+        try:
+            if kind == "export":
+                self.__insert_item(path, kind, session, None, file_path.stem, None, None, None)
+            elif file_path.suffix == archive.PROJECT_SUFFIX:
+                self.__read_project(file_path, session)
+            else:
+                properties, shape, dtype = read_data_item_file(file_path)
+                uuid = properties.get("uuid")
+                row = self.connection.execute("SELECT title FROM project_items WHERE uuid = ?", (uuid,)).fetchone()
+                title = row["title"] if row and row["title"] is not None else properties.get("title")
+                self.__insert_item(path, "data_item", session, uuid, title, shape, dtype, properties.get("created"))
+                self.__update_session(session, properties.get("session_metadata"))
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            logging.info("- Could not catalog %s: %s", file_path, e)
+
+    def __read_project(self, file_path, session):
+        with open(file_path, "r") as f:
+            project_properties = json.load(f)
+        self.__update_session(session, project_properties.get("session_metadata"))
+        for data_item in project_properties.get("data_items", list()):
+            uuid = data_item.get("uuid")
+            if not uuid:
+                continue
+            title = data_item.get("title")
+            self.connection.execute("INSERT OR REPLACE INTO project_items (uuid, path, title, created) VALUES (?, ?, ?, ?)",
+                                    (uuid, str(file_path), title, data_item.get("created")))
+            if title is not None:
+                title_fields = parse_title(title)
+                self.connection.execute("UPDATE items SET title = ?, no = ?, detector = ?, sub = ?, fov_nm = ?, descr = ? "
+                                        "WHERE uuid = ?", (title, title_fields["no"], title_fields["detector"],
+                                                           title_fields["sub"], title_fields["fov_nm"],
+                                                           title_fields["descr"], uuid))
+            self.__update_session(session, data_item.get("session_metadata"))
+
+    def __insert_item(self, path, kind, session, uuid, title, shape, dtype, created):
+        title_fields = parse_title(title)
+        self.connection.execute("INSERT INTO items (path, kind, session, uuid, title, no, detector, sub, fov_nm, descr, "
+                                "shape, dtype, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (path, kind, session, uuid, title, title_fields["no"], title_fields["detector"],
+                                 title_fields["sub"], title_fields["fov_nm"], title_fields["descr"],
+                                 "x".join(str(n) for n in shape) if shape is not None else None,
+                                 str(dtype) if dtype is not None else None, created))
+        self.__update_session(session, None)
+
+    def __update_session(self, session, session_metadata):
+        """ adds the session, with the fields from its folder name, and fills in fields of session_metadata """
+        if not session:
+            return
+        name_fields = parse_session_name(session)
+        self.connection.execute("INSERT OR IGNORE INTO sessions (session, date, microscopist, sample, sample_area) "
+                                "VALUES (?, ?, ?, ?, ?)", (session, name_fields.get("date"), name_fields.get("microscopist"),
+                                                           name_fields.get("sample"), name_fields.get("sample_area")))
+        for field in SESSION_FIELDS:
+            value = (session_metadata or dict()).get(field)
+            if value:
+                self.connection.execute("UPDATE sessions SET {0} = ? WHERE session = ?".format(field), (str(value), session))
+
+    def search(self, title=None, detector=None, sample=None, microscopist=None, session=None, kind=None, limit=100):
+        """
+        Returns the items matching all given criteria, newest sessions first. title and session
+        match substrings, detector, sample and microscopist match exactly (case insensitive).
+        """
+        conditions = list()
+        parameters = list()
+        if title:
+            conditions.append("items.title LIKE ?")
+            parameters.append("%" + title + "%")
+        if session:
+            conditions.append("items.session LIKE ?")
+            parameters.append("%" + session + "%")
+        if detector:
+            conditions.append("items.detector = ? COLLATE NOCASE")
+            parameters.append(detector)
+        if sample:
+            conditions.append("sessions.sample = ? COLLATE NOCASE")
+            parameters.append(sample)
+        if microscopist:
+            conditions.append("sessions.microscopist = ? COLLATE NOCASE")
+            parameters.append(microscopist)
+        if kind:
+            conditions.append("items.kind = ?")
+            parameters.append(kind)
+        query = ("SELECT items.*, sessions.date, sessions.microscopist, sessions.sample, sessions.sample_area, sessions.task "
+                 "FROM items LEFT JOIN sessions ON items.session = sessions.session")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY items.session DESC, items.no, items.title LIMIT ?"
+        parameters.append(limit)
+        return [dict(row) for row in self.connection.execute(query, parameters)]
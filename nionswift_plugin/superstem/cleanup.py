@@ -0,0 +1,157 @@
+# standard libraries
+import logging
+import os
+import pathlib
+import shutil
+import time
+import zipfile
+
+# local libraries
+from . import archive
+from . import archive_index
+from . import manifest
+
+
+class CleanupCandidate:
+    """ a raw project folder in data_base_directory that has an archive in export_base_directory """
+
+    def __init__(self, project_dir, project_name, archive_path, mtime):
+        self.project_dir = pathlib.Path(project_dir)
+        self.project_name = project_name
+        self.archive_path = pathlib.Path(archive_path)
+        # last modification of the project file, the age the candidates are sorted by
+        self.mtime = mtime
+        # bytes freed by deleting the project folder, known after verification
+        self.size = 0
+
+
+class CleanupReport:
+    """ result of a cleanup run """
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.deleted = list()
+        self.skipped = list()
+        self.freed_bytes = 0
+        self.free_bytes = 0
+
+    @property
+    def ok(self):
+        return not any(reason.startswith("delete failed") for project_name, reason in self.skipped)
+
+    def log_summary(self):
+        action = "Would delete" if self.dry_run else "Deleted"
+        for project_name, size in self.deleted:
+            logging.info("- %s %s (%d MB)", action, project_name, size // 2**20)
+        for project_name, reason in self.skipped:
+            logging.info("- Kept %s: %s", project_name, reason)
+        logging.info("- %s %d projects, %d MB, %d GB free %s", action, len(self.deleted), self.freed_bytes // 2**20,
+                     self.free_bytes // 2**30, "afterwards" if self.dry_run else "now")
+
+
+def find_candidates(data_base_dir, export_base_dir, exclude=(), min_age_days=7):
+    """
+    Returns the project folders in data_base_dir whose archive <name>_Raw.zip exists in export_base_dir,
+    oldest first. Projects in exclude (project strings, e.g. the default project) and projects
+    modified within min_age_days, such as the one open in Swift, are left out.
+    """
+    excluded_dirs = {archive.get_project_dir_and_name(project_string)[0] for project_string in exclude if project_string}
+    newest_mtime = time.time() - min_age_days * 24 * 3600
+    candidates = list()
+    for entry in os.scandir(data_base_dir):
+        if not entry.is_dir():
+            continue
+        project_dir = pathlib.Path(entry.path)
+        project_files = list(project_dir.glob("*" + archive.PROJECT_SUFFIX))
+        if len(project_files) != 1 or project_dir in excluded_dirs:
+            continue
+        project_dir, project_name = archive.get_project_dir_and_name(project_files[0])
+        mtime = project_files[0].stat().st_mtime
+        archive_path = pathlib.Path(export_base_dir) / project_name / (project_name + archive.ARCHIVE_SUFFIX)
+        if mtime < newest_mtime and archive_path.is_file():
+            candidates.append(CleanupCandidate(project_dir, project_name, archive_path, mtime))
+    candidates.sort(key=lambda candidate: candidate.mtime)
+    return candidates
+
+
+def verify_candidate(candidate: CleanupCandidate, throttle=None):
+    """
+    Checks that the archive holds every file of the project folder, unchanged since it was archived,
+    and that every member of the archive reads back with the SHA-256 of the file it was made from:
+    the hash recorded in the archive when the member was compressed or, for archives written before
+    hashes were recorded, the hash of the file in the project folder. An archive with a member that
+    has neither is not trusted. The project folder is only read for members without a recorded hash.
+    Returns None if the project can be deleted, else the reason why not.
+    """
+    try:
+        try:
+            index = archive_index.read_index(candidate.archive_path)
+        except (OSError, ValueError):
+            archive_index.write_index(candidate.archive_path, candidate.project_dir)
+            index = archive_index.read_index(candidate.archive_path)
+        with zipfile.ZipFile(candidate.archive_path, "r") as zf:
+            # the index hashes members without a recorded hash from the archive itself, which proves nothing
+            recorded_hashes = {zinfo.filename: archive.get_member_sha256(zinfo) for zinfo in zf.infolist()}
+        entries = {entry["name"]: entry for entry in index["members"]}
+        source_paths = dict()
+        archive_mtime = candidate.archive_path.stat().st_mtime
+        candidate.size = 0
+        for dir_path, dir_names, file_names in os.walk(candidate.project_dir):
+            for file_name in file_names:
+                file_path = pathlib.Path(dir_path) / file_name
+                stat = file_path.stat()
+                member_name = file_path.relative_to(candidate.project_dir.parent).as_posix()
+                entry = entries.get(member_name)
+                if entry is None:
+                    return "{0} is not in the archive".format(file_path.name)
+                if entry["file_size"] != stat.st_size or stat.st_mtime > archive_mtime:
+                    return "{0} changed since it was archived".format(file_path.name)
+                source_paths[member_name] = file_path
+                candidate.size += stat.st_size
+        for entry in index["members"]:
+            recorded_hash = recorded_hashes.get(entry["name"])
+            if recorded_hash:
+                if entry.get("sha256") != recorded_hash:
+                    return "index does not match the archive for {0}".format(entry["name"])
+            elif entry["name"] in source_paths:
+                if manifest.hash_file(source_paths[entry["name"]], throttle=throttle) != entry.get("sha256"):
+                    return "{0} differs from the archive".format(entry["name"])
+            else:
+                return "no hash recorded for {0}".format(entry["name"])
+            archive_index.verify_member(candidate.archive_path, entry, throttle)
+    except Exception as e:
+        return "archive check failed: {0}".format(e)
+    return None
+
+
+def cleanup_projects(data_base_dir, export_base_dir, target_free_bytes, dry_run=True, exclude=(), min_age_days=7,
+                     throttle=None) -> CleanupReport:
+    """
+    Deletes archived raw project folders from data_base_dir, oldest first, until the volume has
+    target_free_bytes free. Each project is only deleted after verify_candidate passed.
+    With dry_run nothing is deleted and the report lists what would be.
+    throttle limits the read rate of the verification, so the cleanup can run alongside a session.
+    """
+    report = CleanupReport(dry_run)
+    report.free_bytes = shutil.disk_usage(data_base_dir).free
+    for candidate in find_candidates(data_base_dir, export_base_dir, exclude, min_age_days):
+        if report.free_bytes >= target_free_bytes:
+            break
+        logging.info("- Checking %s against %s", candidate.project_dir, candidate.archive_path)
+        reason = verify_candidate(candidate, throttle)
+        if reason:
+            report.skipped.append((candidate.project_name, reason))
+            continue
+        if dry_run:
+            report.free_bytes += candidate.size
+        else:
+            try:
+                shutil.rmtree(candidate.project_dir)
+            except OSError as e:
+                report.skipped.append((candidate.project_name, "delete failed: {0}".format(e)))
+                report.free_bytes = shutil.disk_usage(data_base_dir).free
+                continue
+            report.free_bytes = shutil.disk_usage(data_base_dir).free
+        report.deleted.append((candidate.project_name, candidate.size))
+        report.freed_bytes += candidate.size
+    return report
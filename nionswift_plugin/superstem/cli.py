@@ -0,0 +1,526 @@
+"""
+Command line interface for the SuperSTEM archive jobs, so they can run outside Swift,
+e.g. from cron or a systemd timer on a post-processing server:
+
+    superstem-archive compress "F:/Active Swift Libraries/2024_03_12_ABC_S1234_area_Raw" --export-base-dir D:/New_Data
+    superstem-archive verify D:/New_Data/2024_03_12_ABC_S1234_area/2024_03_12_ABC_S1234_area_Raw.zip
+    superstem-archive hashes D:/New_Data --update --workers 8
+    superstem-archive verify-hashes D:/New_Data/hashes_sstem3_20240312-174501.txt --sample 0.01 --workers 8
+    superstem-archive watch D:/New_Data --stable 30
+    superstem-archive transfer D:/New_Data --destination //upload/sstem3/New_Data --workers 8
+    superstem-archive --config superstem_customisation.json cleanup --target-free-gb 2000 --dry-run
+    superstem-archive --config superstem_customisation.json catalog
+    superstem-archive --config superstem_customisation.json find --detector HAADF --sample 1234
+    superstem-archive restore //nas/archive/2024_03_12_ABC_S1234_area_Raw.zip --title "003_HAADF_1_16nm_overview" -o .
+    superstem-archive report D:/New_Data/2024_03_12_ABC_S1234_area --workers 8
+    superstem-archive --config superstem_customisation.json aggregate //upload/sstem3/New_Data //upload/sstem2/New_Data
+    superstem-archive --config superstem_customisation.json have D:/New_Data/2024_03_12_ABC_S1234_area/*.dm3
+    superstem-archive --config superstem_customisation.json duplicates --limit 20
+
+Exit codes: 0 success, 1 job failed, 2 usage error, 3 input not found.
+"""
+
+# standard libraries
+import argparse
+import json
+import logging
+import lzma
+import pathlib
+import sqlite3
+import sys
+import time
+import zipfile
+import zlib
+
+# local libraries
+from . import archive
+from . import archive_index
+from . import catalog
+from . import cleanup
+from . import codec
+from . import manifest
+from . import manifest_store
+from . import report
+from . import staging
+from . import throttle
+from . import transfer
+from . import watcher
+
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NOT_FOUND = 3
+
+
+def read_config(config_file):
+    """ reads superstem_customisation.json if given, so defaults match the Swift plugin """
+    if not config_file:
+        return dict()
+    with open(config_file, "r") as f:
+        return json.load(f)
+
+
+def add_job_options(parser):
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of workers for compression, hashing and verification (default 1)")
+    parser.add_argument("--throttle", type=float, default=0,
+                        help="limit the read rate to this many MB/s (default no limit)")
+
+
+def run_compress(args, config):
+    export_base_dir = args.export_base_dir or config.get("export_base_directory")
+    if not export_base_dir:
+        logging.error("No export base directory, use --export-base-dir or --config")
+        return EXIT_USAGE
+    instrument = args.instrument or config.get("superstem_instrument") or "sstem3"
+    job_throttle = throttle.Throttle.from_megabytes(args.throttle)
+    compression = codec.get_compression(args.compression or config.get("archive_compression", codec.ADAPTIVE),
+                                        args.time_budget or config.get("archive_time_budget_s"))
+    job = archive.ArchiveJob.from_project_string(args.project, export_base_dir, instrument,
+                                                 workers=args.workers, throttle=job_throttle,
+                                                 update_hashes=args.update, compression=compression,
+                                                 processes=args.processes,
+                                                 transfer_destination=config.get("transfer_destination_directory"))
+    if not job.project_dir.is_dir():
+        logging.error("Project folder %s not found", job.project_dir)
+        return EXIT_NOT_FOUND
+    # the staging area of the config is only used with incremental_archiving, as in the panel
+    staging_base_dir = args.staging_dir or (config.get("incremental_archiving") and config.get("archive_staging_directory"))
+    if staging_base_dir:
+        staging_area = staging.get_staging_area(job.project_dir, job.project_name, staging_base_dir,
+                                                compression=compression, throttle=job_throttle)
+        if staging_area.has_staged_files():
+            job.staging_area = staging_area
+    return EXIT_OK if job.run() == 0 else EXIT_FAILED
+
+
+def run_verify(args, config):
+    archive_path = pathlib.Path(args.archive)
+    if not archive_path.is_file():
+        logging.error("Archive %s not found", archive_path)
+        return EXIT_NOT_FOUND
+    if archive.verify_archive(archive_path, args.workers, throttle.Throttle.from_megabytes(args.throttle)):
+        logging.info("- Archive %s OK", archive_path)
+        return EXIT_OK
+    return EXIT_FAILED
+
+
+def run_index(args, config):
+    archive_path = pathlib.Path(args.archive)
+    if not archive_path.is_file():
+        logging.error("Archive %s not found", archive_path)
+        return EXIT_NOT_FOUND
+    try:
+        archive_index.write_index(archive_path, args.project_dir)
+    except (OSError, EOFError, zipfile.BadZipFile) as e:
+        logging.error("Indexing %s failed: %s", archive_path, e)
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def run_restore(args, config):
+    archive_path = pathlib.Path(args.archive)
+    output_dir = pathlib.Path(args.output)
+    if not archive_path.is_file() or not output_dir.is_dir():
+        logging.error("Archive %s or output directory %s not found", archive_path, output_dir)
+        return EXIT_NOT_FOUND
+    try:
+        index = archive_index.read_index(archive_path)
+    except (OSError, ValueError) as e:
+        logging.error("No usable index for %s (%s), run \"superstem-archive index\" first", archive_path, e)
+        return EXIT_NOT_FOUND
+    entries = archive_index.find_members(index, args.uuid, args.title, args.member)
+    if not entries:
+        logging.error("No matching data item in %s", archive_path)
+        return EXIT_NOT_FOUND
+    try:
+        for entry in entries:
+            archive_index.restore_member(archive_path, entry, output_dir / pathlib.PurePosixPath(entry["name"]).name,
+                                         throttle.Throttle.from_megabytes(args.throttle))
+    except (OSError, EOFError, NotImplementedError, zipfile.BadZipFile, lzma.LZMAError, zlib.error) as e:
+        logging.error("Restoring from %s failed: %s", archive_path, e)
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def run_watch(args, config):
+    root = args.root or config.get("export_base_directory")
+    if not root:
+        logging.error("No New_Data directory, give it as argument or use --config")
+        return EXIT_USAGE
+    if not pathlib.Path(root).is_dir():
+        logging.error("Directory %s not found", root)
+        return EXIT_NOT_FOUND
+    manifest_watcher = watcher.ManifestWatcher(root, args.stable or config.get("manifest_watcher_stable_s") or 30,
+                                               args.poll_interval, throttle.Throttle.from_megabytes(args.throttle))
+    manifest_watcher.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        manifest_watcher.stop()
+    return EXIT_OK
+
+
+def run_transfer(args, config):
+    root = args.root or config.get("export_base_directory")
+    destination = args.destination or config.get("transfer_destination_directory")
+    if not root or not destination:
+        logging.error("No New_Data or destination directory, give them as arguments or use --config")
+        return EXIT_USAGE
+    root_dir = pathlib.Path(root)
+    if not root_dir.is_dir():
+        logging.error("Directory %s not found", root_dir)
+        return EXIT_NOT_FOUND
+    if args.hashes_file and not pathlib.Path(args.hashes_file).is_file():
+        logging.error("Hashes file %s not found", args.hashes_file)
+        return EXIT_NOT_FOUND
+    report = transfer.transfer_directory(root_dir, destination, args.hashes_file, args.workers,
+                                         int(args.chunk_size * 1024 * 1024), throttle.Throttle.from_megabytes(args.throttle))
+    report.log_summary()
+    return EXIT_OK if report.ok else EXIT_FAILED
+
+
+def run_cleanup(args, config):
+    data_base_dir = args.data_base_dir or config.get("data_base_directory")
+    export_base_dir = args.export_base_dir or config.get("export_base_directory")
+    if not data_base_dir or not export_base_dir:
+        logging.error("No data or export base directory, use --data-base-dir, --export-base-dir or --config")
+        return EXIT_USAGE
+    for directory in (data_base_dir, export_base_dir):
+        if not pathlib.Path(directory).is_dir():
+            logging.error("Directory %s not found", directory)
+            return EXIT_NOT_FOUND
+    report = cleanup.cleanup_projects(data_base_dir, export_base_dir, int(args.target_free_gb * 2**30), args.dry_run,
+                                      [config.get("default_project")], args.min_age_days,
+                                      throttle.Throttle.from_megabytes(args.throttle))
+    report.log_summary()
+    return EXIT_OK if report.ok else EXIT_FAILED
+
+
+def get_catalog_database(args, config):
+    return args.database or config.get("catalog_database")
+
+
+def run_catalog(args, config):
+    database = get_catalog_database(args, config)
+    data_base_dir = args.data_base_dir or config.get("data_base_directory")
+    export_base_dir = args.export_base_dir or config.get("export_base_directory")
+    if not database or not (data_base_dir or export_base_dir):
+        logging.error("No catalog database or directories, use --database, --data-base-dir, --export-base-dir or --config")
+        return EXIT_USAGE
+    for directory in (data_base_dir, export_base_dir):
+        if directory and not pathlib.Path(directory).is_dir():
+            logging.error("Directory %s not found", directory)
+            return EXIT_NOT_FOUND
+    try:
+        with catalog.Catalog(database) as project_catalog:
+            project_catalog.update(data_base_dir, export_base_dir)
+    except (OSError, sqlite3.Error) as e:
+        logging.error("Updating the catalog %s failed: %s", database, e)
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def run_find(args, config):
+    database = get_catalog_database(args, config)
+    if not database:
+        logging.error("No catalog database, use --database or --config")
+        return EXIT_USAGE
+    if not pathlib.Path(database).is_file():
+        logging.error("Catalog %s not found, run \"superstem-archive catalog\" first", database)
+        return EXIT_NOT_FOUND
+    with catalog.Catalog(database) as project_catalog:
+        items = project_catalog.search(args.title, args.detector, args.sample, args.microscopist, args.session,
+                                       args.kind, args.limit)
+    for item in items:
+        print("\t".join(str(item[key] if item[key] is not None else "")
+                        for key in ("session", "title", "shape", "dtype", "path")))
+    return EXIT_OK if items else EXIT_NOT_FOUND
+
+
+def run_report(args, config):
+    export_dir = pathlib.Path(args.export_dir)
+    if not export_dir.is_dir():
+        logging.error("Directory %s not found", export_dir)
+        return EXIT_NOT_FOUND
+    try:
+        report.generate_report(export_dir, args.workers, args.thumbnail_size, args.columns, not args.threads)
+    except OSError as e:
+        logging.error("Writing the report of %s failed: %s", export_dir, e)
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def get_manifest_store(args, config):
+    return args.store or config.get("manifest_store")
+
+
+def run_aggregate(args, config):
+    store = get_manifest_store(args, config)
+    if not store:
+        logging.error("No manifest store, use --store or --config")
+        return EXIT_USAGE
+    for directory in args.directories:
+        if not pathlib.Path(directory).is_dir():
+            logging.error("Directory %s not found", directory)
+            return EXIT_NOT_FOUND
+    try:
+        with manifest_store.ManifestStore(store) as hashes_store:
+            hashes_store.ingest(args.directories)
+            for total in hashes_store.totals():
+                logging.info("- %s: %d files (%d distinct) %d GB in %d hashes files, %s to %s",
+                             total["instrument"], total["files"], total["distinct_hashes"], total["bytes"] // 2**30,
+                             total["hashes_files"], total["first_seen"], total["last_seen"])
+    except (OSError, sqlite3.Error) as e:
+        logging.error("Updating the manifest store %s failed: %s", store, e)
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def open_manifest_store(args, config):
+    """ the manifest store to query, or the exit code if there is none """
+    store = get_manifest_store(args, config)
+    if not store:
+        logging.error("No manifest store, use --store or --config")
+        return EXIT_USAGE
+    if not pathlib.Path(store).is_file():
+        logging.error("Manifest store %s not found, run \"superstem-archive aggregate\" first", store)
+        return EXIT_NOT_FOUND
+    return manifest_store.ManifestStore(store)
+
+
+def run_have(args, config):
+    hashes_store = open_manifest_store(args, config)
+    if isinstance(hashes_store, int):
+        return hashes_store
+    missing_count = 0
+    with hashes_store:
+        for file_or_hash in args.files:
+            if manifest_store.SHA256_PATTERN.match(file_or_hash):
+                sha256 = file_or_hash.lower()
+            elif pathlib.Path(file_or_hash).is_file():
+                sha256 = manifest.hash_file(file_or_hash)
+            else:
+                logging.error("File %s not found", file_or_hash)
+                missing_count += 1
+                continue
+            locations = hashes_store.lookup(sha256)
+            if not locations:
+                missing_count += 1
+            print("\t".join([file_or_hash, sha256] + (["{0}:{1}".format(location["instrument"], location["path"])
+                                                         for location in locations] or ["-"])))
+    return EXIT_OK if missing_count == 0 else EXIT_NOT_FOUND
+
+
+def run_duplicates(args, config):
+    hashes_store = open_manifest_store(args, config)
+    if isinstance(hashes_store, int):
+        return hashes_store
+    with hashes_store:
+        duplicates = hashes_store.duplicates(args.min_copies, args.limit)
+    for duplicate in duplicates:
+        print("\t".join([duplicate["sha256"], str(duplicate["size"]), str(duplicate["copies"])]
+                        + ["{0}:{1}".format(location["instrument"], location["path"]) for location in duplicate["locations"]]))
+    logging.info("- %d duplicated files, %d MB in extra copies", len(duplicates),
+                 sum(duplicate["wasted_bytes"] for duplicate in duplicates) // 2**20)
+    return EXIT_OK
+
+
+def run_hashes(args, config):
+    root = args.root or config.get("export_base_directory")
+    if not root:
+        logging.error("No New_Data directory, give it as argument or use --config")
+        return EXIT_USAGE
+    root_dir = pathlib.Path(root)
+    if not root_dir.is_dir():
+        logging.error("Directory %s not found", root_dir)
+        return EXIT_NOT_FOUND
+    instrument = args.instrument or config.get("superstem_instrument") or "sstem3"
+    previous_hashes_file = manifest.find_latest_hashes_file(root_dir) if args.update else None
+    try:
+        manifest.write_hashes_file(root_dir, instrument, args.workers,
+                                   throttle.Throttle.from_megabytes(args.throttle), previous_hashes_file)
+    except OSError as e:
+        logging.error("Calculating hashes failed: %s", e)
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def run_verify_hashes(args, config):
+    hashes_file = pathlib.Path(args.hashes_file)
+    root_dir = pathlib.Path(args.root) if args.root else hashes_file.parent
+    if not hashes_file.is_file() or not root_dir.is_dir():
+        logging.error("Hashes file %s or directory %s not found", hashes_file, root_dir)
+        return EXIT_NOT_FOUND
+    report = manifest.verify_hashes_file(hashes_file, root_dir, args.sample, args.deep, not args.ignore_mtime,
+                                         args.workers, throttle.Throttle.from_megabytes(args.throttle))
+    report.log_summary()
+    return EXIT_OK if report.ok else EXIT_FAILED
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog="superstem-archive",
+                                     description="Compress, verify and hash SuperSTEM data outside Nion Swift.")
+    parser.add_argument("--config", help="superstem_customisation.json to take default directories from")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only log errors")
+    subparsers = parser.add_subparsers(dest="command")
+
+    compress_parser = subparsers.add_parser("compress", help="compress a project folder, test the archive and hash New_Data")
+    compress_parser.add_argument("project", help="project .nsproj file or its <name>_Raw library folder")
+    compress_parser.add_argument("--export-base-dir", help="New_Data directory the archive is written to")
+    compress_parser.add_argument("--instrument", help="instrument name for the hashes file (default sstem3)")
+    compress_parser.add_argument("--compression", choices=[codec.ADAPTIVE] + sorted(codec.COMPRESSION_TYPES),
+                                 help="compression of the archive members (default adaptive per file)")
+    compress_parser.add_argument("--time-budget", type=float,
+                                 help="seconds of LZMA compression the adaptive compression may spend")
+    compress_parser.add_argument("--processes", action="store_true",
+                                 help="compress the shards of the project in worker processes instead of threads")
+    compress_parser.add_argument("--staging-dir",
+                                 help="finalise the archive from files staged during the session in this directory "
+                                      "(default archive_staging_directory, if incremental_archiving is set)")
+    compress_parser.add_argument("--update", action="store_true",
+                                 help="re-use unchanged entries of the latest hashes file")
+    add_job_options(compress_parser)
+    compress_parser.set_defaults(run=run_compress)
+
+    verify_parser = subparsers.add_parser("verify", help="test all members of an archive")
+    verify_parser.add_argument("archive", help="zip archive to test")
+    add_job_options(verify_parser)
+    verify_parser.set_defaults(run=run_verify)
+
+    index_parser = subparsers.add_parser("index", help="write the side-index of an archive for restoring single data items")
+    index_parser.add_argument("archive", help="zip archive to index")
+    index_parser.add_argument("--project-dir",
+                              help="<name>_Raw folder the archive was made from, to read data item titles from")
+    index_parser.set_defaults(run=run_index)
+
+    restore_parser = subparsers.add_parser("restore", help="restore single data items from an indexed archive")
+    restore_parser.add_argument("archive", help="zip archive with its .index.json next to it")
+    restore_selection = restore_parser.add_mutually_exclusive_group(required=True)
+    restore_selection.add_argument("--uuid", help="uuid of the data item")
+    restore_selection.add_argument("--title", help="title of the data item(s)")
+    restore_selection.add_argument("--member", help="original path of the file below the project folder, or its name")
+    restore_parser.add_argument("-o", "--output", default=".", help="directory to restore to (default current)")
+    restore_parser.add_argument("--throttle", type=float, default=0,
+                                help="limit the read rate to this many MB/s (default no limit)")
+    restore_parser.set_defaults(run=run_restore)
+
+    watch_parser = subparsers.add_parser("watch", help="hash new files in New_Data as they arrive, until interrupted")
+    watch_parser.add_argument("root", nargs="?", help="New_Data directory (default export_base_directory)")
+    watch_parser.add_argument("--stable", type=float,
+                              help="seconds a file must be unchanged before it is hashed (default 30)")
+    watch_parser.add_argument("--poll-interval", type=float, default=60,
+                              help="seconds between scans without the watchdog package (default 60)")
+    watch_parser.add_argument("--throttle", type=float, default=0,
+                              help="limit the read rate to this many MB/s (default no limit)")
+    watch_parser.set_defaults(run=run_watch)
+
+    transfer_parser = subparsers.add_parser("transfer", help="copy New_Data to the upload area, checked against a hashes file")
+    transfer_parser.add_argument("root", nargs="?", help="New_Data directory (default export_base_directory)")
+    transfer_parser.add_argument("--destination", help="directory to copy to (default transfer_destination_directory)")
+    transfer_parser.add_argument("--hashes-file", help="hashes file listing the files to copy (default the latest)")
+    transfer_parser.add_argument("--chunk-size", type=float, default=transfer.TRANSFER_CHUNK_SIZE / 2**20,
+                                 help="size in MB of the chunks copied in parallel and resumed (default 64)")
+    add_job_options(transfer_parser)
+    transfer_parser.set_defaults(run=run_transfer)
+
+    cleanup_parser = subparsers.add_parser("cleanup",
+                                           help="delete verified archived raw projects, oldest first, to free space")
+    cleanup_parser.add_argument("--target-free-gb", type=float, required=True,
+                                help="stop once the data volume has this many GB free")
+    cleanup_parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    cleanup_parser.add_argument("--min-age-days", type=float, default=7,
+                                help="keep projects modified within this many days (default 7)")
+    cleanup_parser.add_argument("--data-base-dir", help="directory of the Swift libraries (default data_base_directory)")
+    cleanup_parser.add_argument("--export-base-dir", help="New_Data directory (default export_base_directory)")
+    cleanup_parser.add_argument("--throttle", type=float, default=0,
+                                help="limit the read rate of the archive checks to this many MB/s (default no limit)")
+    cleanup_parser.set_defaults(run=run_cleanup)
+
+    catalog_parser = subparsers.add_parser("catalog", help="update the offline catalog of projects and exports")
+    catalog_parser.add_argument("--database", help="SQLite catalog file (default catalog_database)")
+    catalog_parser.add_argument("--data-base-dir", help="directory of the Swift libraries (default data_base_directory)")
+    catalog_parser.add_argument("--export-base-dir", help="New_Data directory (default export_base_directory)")
+    catalog_parser.set_defaults(run=run_catalog)
+
+    find_parser = subparsers.add_parser("find", help="search the offline catalog")
+    find_parser.add_argument("--database", help="SQLite catalog file (default catalog_database)")
+    find_parser.add_argument("--title", help="part of the title")
+    find_parser.add_argument("--detector", help="detector field of the title, e.g. HAADF")
+    find_parser.add_argument("--sample", help="sample number")
+    find_parser.add_argument("--microscopist", help="microscopist TLA")
+    find_parser.add_argument("--session", help="part of the library or export folder name")
+    find_parser.add_argument("--kind", choices=["data_item", "export"], help="only data items or only exports")
+    find_parser.add_argument("--limit", type=int, default=100, help="maximum number of results (default 100)")
+    find_parser.set_defaults(run=run_find)
+
+    report_parser = subparsers.add_parser("report",
+                                          help="write a contact sheet and CSV/JSON summary of a session's export directory")
+    report_parser.add_argument("export_dir", help="export directory of the session, e.g. New_Data/YYYY_MM_DD_TLA_Sxx_area")
+    report_parser.add_argument("--workers", type=int, default=4, help="number of worker processes (default 4)")
+    report_parser.add_argument("--threads", action="store_true", help="read the files in threads instead of processes")
+    report_parser.add_argument("--thumbnail-size", type=int, default=report.THUMBNAIL_SIZE,
+                               help="longest side of the thumbnails in pixels (default {0})".format(report.THUMBNAIL_SIZE))
+    report_parser.add_argument("--columns", type=int, default=report.CONTACT_SHEET_COLUMNS,
+                               help="thumbnails per row of the contact sheet (default {0})".format(report.CONTACT_SHEET_COLUMNS))
+    report_parser.set_defaults(run=run_report)
+
+    aggregate_parser = subparsers.add_parser("aggregate",
+                                             help="read the hashes files of all instruments into the manifest store")
+    aggregate_parser.add_argument("directories", nargs="+", help="directories searched for hashes_<instrument>_*.txt files")
+    aggregate_parser.add_argument("--store", help="SQLite manifest store (default manifest_store)")
+    aggregate_parser.set_defaults(run=run_aggregate)
+
+    have_parser = subparsers.add_parser("have", help="look up files or SHA-256 hashes in the manifest store")
+    have_parser.add_argument("files", nargs="+", help="files to hash and look up, or SHA-256 hashes")
+    have_parser.add_argument("--store", help="SQLite manifest store (default manifest_store)")
+    have_parser.set_defaults(run=run_have)
+
+    duplicates_parser = subparsers.add_parser("duplicates", help="list files stored more than once, largest waste first")
+    duplicates_parser.add_argument("--store", help="SQLite manifest store (default manifest_store)")
+    duplicates_parser.add_argument("--min-copies", type=int, default=2, help="minimum number of copies (default 2)")
+    duplicates_parser.add_argument("--limit", type=int, default=100, help="maximum number of results (default 100)")
+    duplicates_parser.set_defaults(run=run_duplicates)
+
+    hashes_parser = subparsers.add_parser("hashes", help="write a new hashes file for New_Data")
+    hashes_parser.add_argument("root", nargs="?", help="New_Data directory (default export_base_directory)")
+    hashes_parser.add_argument("--instrument", help="instrument name for the hashes file (default sstem3)")
+    hashes_parser.add_argument("--update", action="store_true",
+                               help="re-use unchanged entries of the latest hashes file")
+    add_job_options(hashes_parser)
+    hashes_parser.set_defaults(run=run_hashes)
+
+    verify_hashes_parser = subparsers.add_parser("verify-hashes",
+                                                 help="check a directory tree against a hashes file")
+    verify_hashes_parser.add_argument("hashes_file", help="hashes_<instrument>_<timestamp>.txt file to check against")
+    verify_hashes_parser.add_argument("--root", help="directory to check (default the folder of the hashes file)")
+    verify_hashes_parser.add_argument("--sample", type=float, default=0.0,
+                                      help="fraction of unchanged files to re-hash as a spot check (default 0)")
+    verify_hashes_parser.add_argument("--deep", action="store_true", help="re-hash every file")
+    verify_hashes_parser.add_argument("--ignore-mtime", action="store_true",
+                                      help="do not re-hash files just because they are newer than the hashes file")
+    add_job_options(verify_hashes_parser)
+    verify_hashes_parser.set_defaults(run=run_verify_hashes)
+
+    return parser
+
+
+def main(argv=None):
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_usage()
+        return EXIT_USAGE
+    logging.basicConfig(level=logging.ERROR if args.quiet else logging.INFO, format="%(message)s")
+    try:
+        config = read_config(args.config)
+    except (OSError, ValueError) as e:
+        logging.error("Cannot read config file %s: %s", args.config, e)
+        return EXIT_USAGE
+    return args.run(args, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
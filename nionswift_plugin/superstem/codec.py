@@ -0,0 +1,163 @@
+# standard libraries
+import copy
+import csv
+import logging
+import lzma
+import os
+import pathlib
+import threading
+import time
+import zipfile
+import zlib
+
+
+# names of the compression settings in superstem_customisation.json and on the command line
+COMPRESSION_TYPES = {
+    "store": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "lzma": zipfile.ZIP_LZMA,
+}
+COMPRESSION_NAMES = {compress_type: name for name, compress_type in COMPRESSION_TYPES.items()}
+ADAPTIVE = "adaptive"
+
+# files with these extensions are already compressed and are stored as they are
+INCOMPRESSIBLE_SUFFIXES = {".zip", ".7z", ".gz", ".bz2", ".xz", ".zst", ".png", ".jpg", ".jpeg", ".mp4", ".avi"}
+
+
+class CompressionPolicy:
+    """
+    Chooses the compression of each archive member from a sample of the file, instead of
+    compressing every file with LZMA:
+    - small files are deflated
+    - already compressed or incompressible files (deflate saves less than min_gain) are stored
+    - LZMA is used where it saves at least min_gain of the file size more than deflate,
+      as long as the projected LZMA time of the whole archive stays within time_budget seconds
+    - everything else is deflated
+    All members stay readable by standard zip tools (7-Zip, Windows Explorer for store/deflate).
+    One policy can be shared by several worker threads; worker processes get a share of it from split().
+    """
+
+    def __init__(self, time_budget=None, min_gain=0.05, small_file_size=64 * 1024,
+                 sample_size=256 * 1024, sample_count=4):
+        self.time_budget = time_budget
+        self.min_gain = min_gain
+        self.small_file_size = small_file_size
+        self.sample_size = sample_size
+        self.sample_count = sample_count
+        self.__lock = threading.Lock()
+        # projected compression time of the members chosen so far
+        self.__projected_seconds = 0.0
+
+    def __getstate__(self):
+        # a copy is sent to each worker process of a parallel archive job, without the lock
+        state = self.__dict__.copy()
+        del state["_CompressionPolicy__lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    @property
+    def projected_seconds(self):
+        with self.__lock:
+            return self.__projected_seconds
+
+    def split(self, shares):
+        """
+        Returns a copy of the policy per share (e.g. the bytes of each shard of a parallel archive job), for
+        worker processes, which cannot add to one projected time. The time budget left is split between the
+        copies in proportion to the shares, so all together stay within it.
+        """
+        total = sum(shares)
+        with self.__lock:
+            remaining_seconds = max(0.0, self.time_budget - self.__projected_seconds) if self.time_budget is not None else None
+        policies = list()
+        for share in shares:
+            policy = copy.copy(self)
+            policy.__projected_seconds = 0.0
+            if remaining_seconds is not None:
+                policy.time_budget = remaining_seconds * share / total if total else remaining_seconds / len(shares)
+            policies.append(policy)
+        return policies
+
+    def read_samples(self, file_path, file_size):
+        """ reads sample_count blocks spread evenly through the file """
+        samples = list()
+        with open(file_path, "rb") as f:
+            step = max(self.sample_size, file_size // self.sample_count)
+            for offset in range(0, file_size, step)[:self.sample_count]:
+                f.seek(offset)
+                samples.append(f.read(self.sample_size))
+        return samples
+
+    def choose(self, file_path):
+        """ returns the zipfile compression type for file_path """
+        file_path = pathlib.Path(file_path)
+        file_size = os.stat(file_path).st_size
+        if file_path.suffix.lower() in INCOMPRESSIBLE_SUFFIXES:
+            return zipfile.ZIP_STORED
+        if file_size < self.small_file_size:
+            return zipfile.ZIP_DEFLATED
+
+        samples = self.read_samples(file_path, file_size)
+        sampled_size = sum(len(sample) for sample in samples) or 1
+        start = time.perf_counter()
+        deflate_size = sum(len(zlib.compress(sample, 6)) for sample in samples)
+        deflate_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        lzma_size = sum(len(lzma.compress(sample)) for sample in samples)
+        lzma_seconds = time.perf_counter() - start
+        scale = file_size / sampled_size
+
+        if deflate_size > (1 - self.min_gain) * sampled_size:
+            return zipfile.ZIP_STORED
+        with self.__lock:
+            if (deflate_size - lzma_size) >= self.min_gain * sampled_size:
+                projected_seconds = self.__projected_seconds + lzma_seconds * scale
+                if self.time_budget is None or projected_seconds <= self.time_budget:
+                    self.__projected_seconds = projected_seconds
+                    return zipfile.ZIP_LZMA
+            self.__projected_seconds += deflate_seconds * scale
+        return zipfile.ZIP_DEFLATED
+
+
+def get_compression(compression_name, time_budget=None):
+    """
+    Returns a CompressionPolicy for "adaptive", else the zipfile compression type
+    for "store", "deflate" or "lzma".
+    """
+    if compression_name in (None, "", ADAPTIVE):
+        return CompressionPolicy(time_budget)
+    return COMPRESSION_TYPES[compression_name]
+
+
+def get_compress_type(compression, file_path):
+    """ resolves compression, a compression type or CompressionPolicy, for one file """
+    if isinstance(compression, CompressionPolicy):
+        return compression.choose(file_path)
+    return compression
+
+
+def write_compression_report(archive_path, report_path=None):
+    """
+    Writes the compression and ratio of every member of the archive to a CSV file next to it
+    (<archive>.compression.csv), so the policy can be tuned, and logs the totals per compression.
+    """
+    archive_path = pathlib.Path(archive_path)
+    report_path = pathlib.Path(report_path) if report_path else archive_path.with_name(archive_path.name + ".compression.csv")
+    totals = dict()
+    with zipfile.ZipFile(archive_path, "r") as zf, open(report_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["member", "compression", "file_size", "compress_size", "ratio"])
+        for zinfo in zf.infolist():
+            if zinfo.is_dir():
+                continue
+            compression_name = COMPRESSION_NAMES.get(zinfo.compress_type, str(zinfo.compress_type))
+            ratio = zinfo.compress_size / zinfo.file_size if zinfo.file_size else 1.0
+            writer.writerow([zinfo.filename, compression_name, zinfo.file_size, zinfo.compress_size, "{0:.3f}".format(ratio)])
+            count, file_size, compress_size = totals.get(compression_name, (0, 0, 0))
+            totals[compression_name] = (count + 1, file_size + zinfo.file_size, compress_size + zinfo.compress_size)
+    for compression_name, (count, file_size, compress_size) in sorted(totals.items()):
+        logging.info("- %s: %d files, %d MB -> %d MB", compression_name, count, file_size // 2**20, compress_size // 2**20)
+    return report_path
@@ -0,0 +1,133 @@
+# standard libraries
+import contextlib
+import datetime
+import io
+import logging
+import pathlib
+import re
+import threading
+import time
+# cProfile, pstats and tracemalloc are imported when a profile is taken, PhaseTimer runs at every Swift start
+
+
+# number of functions and allocation sites in the profile summaries
+PROFILE_TOP_N = 15
+# frames kept per allocation while memory is traced
+TRACEMALLOC_FRAMES = 5
+# one profile at a time: the profiler hooks are global, a second one would fail to start
+_profile_lock = threading.Lock()
+
+
+class PhaseTimer:
+    """
+    Measures the phases of a task, e.g. the plugin startup, and logs them in one line:
+    "- SuperSTEM startup: import 4 ms, top sections 12 ms, ..., total 30 ms"
+    mark(phase) ends the current phase; add(phase, seconds) records a phase measured elsewhere,
+    skip() starts the next phase without recording the time since the last mark.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.phases = list()
+        self.__last = time.perf_counter()
+
+    def add(self, phase, seconds):
+        self.phases.append((phase, seconds))
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.add(phase, now - self.__last)
+        self.__last = now
+
+    def skip(self):
+        self.__last = time.perf_counter()
+
+    @property
+    def total(self):
+        return sum(seconds for phase, seconds in self.phases)
+
+    def log(self):
+        logging.info("- %s: %s, total %.0f ms", self.name,
+                     ", ".join("{0} {1:.0f} ms".format(phase, seconds * 1000) for phase, seconds in self.phases),
+                     self.total * 1000)
+
+
+def get_profile_paths(directory, name, now=None):
+    """ returns the .prof (pstats) and .txt (summary) paths of a profile, e.g. 20261019-143512-127_export.prof """
+    stem = (now or datetime.datetime.now()).strftime("%Y%m%d-%H%M%S-%f")[:-3] + "_" + re.sub(r"[^A-Za-z0-9-]+", "_", name)
+    directory = pathlib.Path(directory)
+    return directory / (stem + ".prof"), directory / (stem + ".txt")
+
+
+def get_top_functions(profiler, top_n=PROFILE_TOP_N):
+    """ returns (cumulative seconds, own seconds, calls, "file:line(function)") of the top_n functions by cumulative time """
+    import pstats
+    stats = pstats.Stats(profiler).stats
+    functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top_n]
+    return [(cumulative, own, calls, "{0}:{1}({2})".format(pathlib.Path(file_name).name, line, function))
+            for (file_name, line, function), (primitive_calls, calls, own, cumulative, callers) in functions]
+
+
+def write_profile(name, directory, profiler, seconds, memory_statistics, peak_bytes, top_n=PROFILE_TOP_N):
+    """ writes the pstats file and a text summary of a profile, logs the top_n functions and allocations """
+    import pstats
+    prof_path, text_path = get_profile_paths(directory, name)
+    prof_path.parent.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(str(prof_path))
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top_n)
+    lines = ["{0}: {1:.0f} ms, peak {2:.1f} MB traced".format(name, seconds * 1000, peak_bytes / 2**20), "",
+             "Allocated during {0}, by line:".format(name)]
+    lines.extend("{0}".format(statistic) for statistic in memory_statistics[:top_n])
+    text_path.write_text("\n".join(lines) + "\n\n" + stream.getvalue())
+
+    logging.info("- Profile %s: %.0f ms, peak %.1f MB, written to %s", name, seconds * 1000, peak_bytes / 2**20, prof_path)
+    for cumulative, own, calls, function in get_top_functions(profiler, top_n):
+        logging.info("-   %8.1f ms cum %8.1f ms own %7d calls  %s", cumulative * 1000, own * 1000, calls, function)
+    for statistic in memory_statistics[:top_n]:
+        frame = statistic.traceback[0]
+        logging.info("-   %+8.1f kB in %6d blocks  %s:%d", statistic.size_diff / 1024, statistic.count_diff,
+                     pathlib.Path(frame.filename).name, frame.lineno)
+    return prof_path, text_path
+
+
+@contextlib.contextmanager
+def profile(name, directory, top_n=PROFILE_TOP_N):
+    """
+    Profiles the block with cProfile and traces its memory allocations with tracemalloc, then writes
+    <timestamp>_<name>.prof (open with pstats or snakeviz) and <timestamp>_<name>.txt to directory
+    and logs the top_n functions and allocation sites.
+    Only the calling thread is profiled. While another profile runs, the block runs unprofiled.
+    """
+    import cProfile
+    import tracemalloc
+    # allocations of the snapshots themselves are left out
+    tracemalloc_filters = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    if not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    try:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        first_snapshot = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            seconds = time.perf_counter() - start
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            memory_statistics = tracemalloc.take_snapshot().filter_traces(tracemalloc_filters).compare_to(
+                first_snapshot.filter_traces(tracemalloc_filters), "lineno")
+            if started_tracing:
+                tracemalloc.stop()
+            try:
+                write_profile(name, directory, profiler, seconds, memory_statistics, peak_bytes, top_n)
+            except OSError as e:
+                logging.info("- Could not write profile %s to %s: %s", name, directory, e)
+    finally:
+        _profile_lock.release()
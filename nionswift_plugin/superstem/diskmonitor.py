@@ -0,0 +1,117 @@
+# standard libraries
+import collections
+import logging
+import shutil
+import threading
+import time
+
+
+GB = 1024 ** 3
+
+
+class VolumeStatus:
+    """ one sample of a monitored volume, with the growth rate over the monitor's window """
+
+    def __init__(self, label, path, total, used, free, rate=None, warning_free_bytes=0, warning_seconds=0):
+        self.label = label
+        self.path = path
+        self.total = total
+        self.used = used
+        self.free = free
+        # bytes per second, None until there are two samples
+        self.rate = rate
+        self.warning_free_bytes = warning_free_bytes
+        self.warning_seconds = warning_seconds
+
+    @property
+    def time_to_full(self):
+        """ seconds until the volume is full at the current growth rate, None if it is not growing """
+        if not self.rate or self.rate <= 0:
+            return None
+        return self.free / self.rate
+
+    @property
+    def warning(self):
+        time_to_full = self.time_to_full
+        return self.free < self.warning_free_bytes or (time_to_full is not None and time_to_full < self.warning_seconds)
+
+    def format(self):
+        """ e.g. "Data: 512.3 GB free (21%), +2.1 GB/h, full in 10.3 h" """
+        text = "{0}: {1:.1f} GB free ({2:.0f}%)".format(self.label, self.free / GB, 100 * self.free / max(1, self.total))
+        if self.rate is not None:
+            text += ", {0:+.1f} GB/h".format(self.rate * 3600 / GB)
+        time_to_full = self.time_to_full
+        if time_to_full is not None:
+            if time_to_full < 2 * 24 * 3600:
+                text += ", full in {0:.1f} h".format(time_to_full / 3600)
+            else:
+                text += ", full in {0:.0f} d".format(time_to_full / (24 * 3600))
+        return text
+
+
+class DiskMonitor:
+    """
+    Samples free space of the data and export volumes every interval seconds in a background
+    thread, with shutil.disk_usage only (statvfs / GetDiskFreeSpaceEx), never walking directories.
+    The growth rate is the change of used space over the last window seconds, which includes the
+    active library and exports, and gives the projected time until the volume is full.
+    A volume is in warning state below warning_free_bytes or when it is projected to be full
+    within warning_seconds. on_update(statuses) is called from the monitor thread after every sample.
+    """
+
+    def __init__(self, paths, interval=30, window=600, warning_free_bytes=100 * GB, warning_seconds=12 * 3600,
+                 on_update=None):
+        # label -> directory on the volume, e.g. {"Data": data_base_dir, "Export": export_base_dir}
+        self.paths = dict(paths)
+        self.interval = interval
+        self.window = window
+        self.warning_free_bytes = warning_free_bytes
+        self.warning_seconds = warning_seconds
+        self.on_update = on_update
+        # label -> deque of (time, used bytes)
+        self.__samples = {label: collections.deque() for label in self.paths}
+        self.__warnings = set()
+        self.__stop_event = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def sample(self):
+        """ takes one sample of every volume and returns their VolumeStatus, skipping volumes that are not reachable """
+        statuses = list()
+        now = time.monotonic()
+        for label, path in self.paths.items():
+            try:
+                usage = shutil.disk_usage(path)
+            except OSError:
+                continue
+            samples = self.__samples[label]
+            samples.append((now, usage.used))
+            while len(samples) > 2 and now - samples[1][0] >= self.window:
+                samples.popleft()
+            rate = None
+            if len(samples) > 1 and now > samples[0][0]:
+                rate = (usage.used - samples[0][1]) / (now - samples[0][0])
+            status = VolumeStatus(label, path, usage.total, usage.used, usage.free, rate,
+                                  self.warning_free_bytes, self.warning_seconds)
+            if status.warning and label not in self.__warnings:
+                logging.info("----- LOW DISK SPACE %s -----", status.format())
+                self.__warnings.add(label)
+            elif not status.warning:
+                self.__warnings.discard(label)
+            statuses.append(status)
+        return statuses
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop_event.set()
+
+    def __run(self):
+        while not self.__stop_event.is_set():
+            try:
+                statuses = self.sample()
+                if self.on_update:
+                    self.on_update(statuses)
+            except Exception as e:
+                logging.info("- Exception DiskMonitor %s", e)
+            self.__stop_event.wait(self.interval)
@@ -0,0 +1,395 @@
+# standard libraries
+import bisect
+import copy
+import hashlib
+import io
+import logging
+import pathlib
+import queue
+import threading
+import uuid
+
+# third party libraries
+import numpy
+
+# local libraries
+from . import manifest
+
+
+class PatchRecorder:
+    """
+    Write-only stream that discards the data and records where the writer seeks back and
+    overwrites earlier bytes (the DM writer fills in sizes once they are known), with the
+    final values. A dry run through it tells HashingStream the final content in advance.
+    """
+
+    def __init__(self):
+        self.patches = dict()
+        self.__position = 0
+        self.__end = 0
+
+    def write(self, data):
+        byte_count = memoryview(data).nbytes
+        if self.__position < self.__end:
+            self.patches[self.__position] = bytes(data)
+        self.__position += byte_count
+        self.__end = max(self.__end, self.__position)
+        return byte_count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.__position = offset
+        elif whence == io.SEEK_CUR:
+            self.__position += offset
+        else:
+            self.__position = self.__end + offset
+        return self.__position
+
+    def tell(self):
+        return self.__position
+
+    def flush(self):
+        pass
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return False
+
+
+class HashingStream:
+    """
+    Wraps a binary output stream and hashes the bytes while they are written, so the
+    SHA-256 of an exported file comes for free and the file never has to be read back.
+    patches are the final values of bytes the writer overwrites later (from a PatchRecorder
+    dry run): they are hashed in place of the bytes first written there, and each overwrite is
+    checked against them. If the writer overwrites bytes any other way, the hash of the stream
+    is not the hash of the file and hexdigest() returns None.
+    """
+
+    def __init__(self, stream, patches=None):
+        self.__stream = stream
+        self.__sha256 = hashlib.sha256()
+        self.__patches = dict(patches or dict())
+        self.__patch_offsets = sorted(self.__patches)
+        self.__max_patch_length = max((len(patch) for patch in self.__patches.values()), default=1)
+        self.__position = 0
+        self.__end = 0
+        self.__sequential = True
+
+    def write(self, data):
+        byte_count = memoryview(data).nbytes
+        if self.__position != self.__end:
+            if self.__position > self.__end or self.__patches.get(self.__position) != bytes(data):
+                self.__sequential = False
+        elif self.__sequential:
+            self.__sha256.update(self.__get_final_bytes(data, byte_count))
+        written = self.__stream.write(data)
+        self.__position += byte_count
+        self.__end = max(self.__end, self.__position)
+        return written
+
+    def __get_final_bytes(self, data, byte_count):
+        """ data written at the end of the stream, with the patches that will overwrite parts of it applied """
+        start, end = self.__position, self.__position + byte_count
+        # patches starting before this write may reach into it
+        first = bisect.bisect_left(self.__patch_offsets, start - self.__max_patch_length + 1)
+        last = bisect.bisect_left(self.__patch_offsets, end)
+        final_bytes = None
+        for offset in self.__patch_offsets[first:last]:
+            patch = self.__patches[offset]
+            overlap_start, overlap_end = max(start, offset), min(end, offset + len(patch))
+            if overlap_start < overlap_end:
+                if final_bytes is None:
+                    final_bytes = bytearray(memoryview(data).cast("B"))
+                final_bytes[overlap_start - start:overlap_end - start] = patch[overlap_start - offset:overlap_end - offset]
+        return data if final_bytes is None else final_bytes
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self.__position = self.__stream.seek(offset, whence)
+        return self.__position
+
+    def tell(self):
+        return self.__position
+
+    def flush(self):
+        self.__stream.flush()
+
+    def fileno(self):
+        # writing through the file descriptor (e.g. numpy tofile) would bypass the hash
+        raise io.UnsupportedOperation("fileno")
+
+    def seekable(self):
+        return self.__stream.seekable()
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return False
+
+    def hexdigest(self):
+        return self.__sha256.hexdigest() if self.__sequential else None
+
+
+def get_dm_save_image():
+    """ returns the DM writing function of the nionswift-io DM plugin, or None if it is not available """
+    try:
+        from nionswift_plugin.DM_IO import dm3_image_utils
+    except ImportError:
+        return None
+    return getattr(dm3_image_utils, "save_image", None)
+
+
+def write_dm_hashed(xdata, export_path):
+    """
+    Writes xdata as DM3 or DM4 file (chosen by the extension) through a HashingStream.
+    The DM writer fills in sizes after writing what they refer to, so it first runs through
+    a PatchRecorder, which costs serialising the data twice but no reading back.
+    The file is written under a temporary name and only renamed when complete.
+    Returns the SHA-256 of the file, or None if the file was written but could not be hashed.
+    Raises if the DM plugin cannot write the data this way; the partial file is then removed.
+    """
+    save_image = get_dm_save_image()
+    if save_image is None:
+        raise NotImplementedError("nionswift-io DM plugin not available")
+    export_path = pathlib.Path(export_path)
+    file_version = 4 if export_path.suffix.lower() == ".dm4" else 3
+    patch_recorder = PatchRecorder()
+    save_image(xdata, patch_recorder, file_version)
+    partial_path = export_path.with_name(export_path.name + ".part")
+    try:
+        with open(partial_path, "wb") as f:
+            stream = HashingStream(f, patch_recorder.patches)
+            save_image(xdata, stream, file_version)
+        partial_path.replace(export_path)
+    except Exception:
+        try:
+            partial_path.unlink()
+        except OSError:
+            pass
+        raise
+    return stream.hexdigest()
+
+
+def export_display_item(display_item, export_path, write_fn, export_spool=None):
+    """
+    Exports the data of display_item to export_path, hashing the byte stream while it is
+    written and adding the hash to the running manifest of the export directory.
+    If the data cannot be written via a hashing stream, write_fn(path) is used instead to write
+    the file with the regular Swift writer; the file is then hashed by the later hashes stage.
+    With an export_spool the file is written to the spool and moved to export_path in the background.
+    Returns the SHA-256 of the exported file, or None.
+    """
+    data_item = getattr(display_item, "data_item", None)
+    xdata = data_item.xdata if data_item is not None else None
+    file_path = export_spool.get_spool_path(export_path) if export_spool else export_path
+    sha256 = None
+    written = False
+    if xdata is not None:
+        try:
+            sha256 = write_dm_hashed(xdata, file_path)
+            written = True
+        except Exception as e:
+            logging.info("- Export without hashing, %s", e)
+    if not written:
+        write_fn(file_path)
+    if export_spool:
+        export_spool.submit(file_path, export_path, sha256)
+    elif sha256:
+        manifest.add_export_manifest_entry(export_path, sha256)
+    return sha256
+
+
+def get_xdata_properties(xdata):
+    """ the calibrations and metadata of xdata, without its data, as keyword arguments of new_data_and_metadata """
+    return {"intensity_calibration": copy.deepcopy(xdata.intensity_calibration),
+            "dimensional_calibrations": copy.deepcopy(xdata.dimensional_calibrations),
+            "metadata": copy.deepcopy(dict(xdata.metadata)),
+            "timestamp": xdata.timestamp,
+            "data_descriptor": copy.deepcopy(xdata.data_descriptor),
+            "timezone": xdata.timezone,
+            "timezone_offset": xdata.timezone_offset}
+
+
+def new_xdata(data, xdata_properties):
+    """ xdata from data and the properties returned by get_xdata_properties """
+    from nion.data import DataAndMetadata
+    return DataAndMetadata.new_data_and_metadata(data, **xdata_properties)
+
+
+def snapshot_xdata(xdata, data=None):
+    """
+    Returns a copy of xdata that stays valid while the live data item changes,
+    optionally with data replaced (e.g. by a memory-mapped spill file).
+    """
+    return new_xdata(numpy.copy(xdata.data) if data is None else data, get_xdata_properties(xdata))
+
+
+class ExportJob:
+    """
+    one pending export: a snapshot in memory, or spilled to a scratch file, in which case
+    only the calibrations and metadata are kept (xdata_properties), not the live data item's xdata
+    """
+
+    def __init__(self, export_path, xdata, nbytes, spill_path=None, xdata_properties=None):
+        self.export_path = pathlib.Path(export_path)
+        self.xdata = xdata
+        self.nbytes = nbytes
+        self.spill_path = spill_path
+        self.xdata_properties = xdata_properties
+
+    def get_xdata(self):
+        if self.spill_path is not None:
+            return new_xdata(numpy.load(self.spill_path, mmap_mode="r"), self.xdata_properties)
+        return self.xdata
+
+
+class ExportQueue:
+    """
+    Writes exports from snapshots of the data in a background thread, so several large
+    SI/4D exports in a row cannot pile up copies in memory next to the acquisition buffers.
+    submit() only keeps a reference to the data; a snapshot thread copies it right away, so the
+    click does not wait for the copy. At most memory_ceiling bytes of snapshots are held in memory.
+    Beyond that, a snapshot is spilled to scratch_dir if one is configured; otherwise the snapshot
+    thread waits until enough pending exports have been written (an export larger than the ceiling
+    on its own is always accepted once the queue is empty).
+    With an export_spool, files are written to the spool and moved to their export path from there.
+    With a preview_writer (preview.PreviewWriter), the preview is written from the same snapshot.
+    A failed export leaves no file behind and is reported to on_export_failed(export_path, error),
+    called in a background thread.
+    """
+
+    def __init__(self, memory_ceiling, scratch_dir=None, export_spool=None, preview_writer=None, on_export_failed=None):
+        self.memory_ceiling = memory_ceiling
+        self.scratch_dir = pathlib.Path(scratch_dir) if scratch_dir else None
+        self.export_spool = export_spool
+        self.preview_writer = preview_writer
+        self.on_export_failed = on_export_failed
+        self.__in_flight_bytes = 0
+        self.__pending_paths = set()
+        self.__condition = threading.Condition()
+        # (export path, xdata, whether xdata is the live data) waiting to be copied or spilled
+        self.__snapshot_queue = queue.Queue()
+        self.__queue = queue.Queue()
+        self.__snapshot_thread = threading.Thread(target=self.__run_snapshots, daemon=True)
+        self.__snapshot_thread.start()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    @property
+    def in_flight_bytes(self):
+        with self.__condition:
+            return self.__in_flight_bytes
+
+    def is_pending(self, export_path):
+        """ True while an export to export_path is queued but not yet written """
+        with self.__condition:
+            return pathlib.Path(export_path) in self.__pending_paths
+
+    def submit(self, display_item, export_path, xdata=None):
+        """
+        queues the export of the data of display_item to export_path, or of xdata if given,
+        which must not share its data with the display item (e.g. the result of a reduction)
+        """
+        snapshot = xdata is None
+        xdata = display_item.data_item.xdata if snapshot else xdata
+        export_path = pathlib.Path(export_path)
+        with self.__condition:
+            self.__pending_paths.add(export_path)
+        self.__snapshot_queue.put((export_path, xdata, snapshot))
+
+    def wait_for_snapshots(self):
+        """ waits until the data of all submitted exports has been copied or spilled """
+        self.__snapshot_queue.join()
+
+    def __take_snapshot(self, export_path, xdata, snapshot):
+        """ queues the export with a copy of xdata in memory, or spilled to scratch_dir over the ceiling """
+        nbytes = xdata.data.nbytes
+        with self.__condition:
+            over_ceiling = self.__in_flight_bytes + nbytes > self.memory_ceiling
+        if over_ceiling and self.scratch_dir is not None:
+            self.scratch_dir.mkdir(parents=True, exist_ok=True)
+            spill_path = self.scratch_dir / (uuid.uuid4().hex + ".npy")
+            logging.info("- Export queue full (%d MB), spilling %s to %s",
+                         self.in_flight_bytes // 2**20, export_path.name, spill_path)
+            numpy.save(spill_path, xdata.data)
+            self.__queue.put(ExportJob(export_path, None, 0, spill_path, get_xdata_properties(xdata)))
+            return
+        with self.__condition:
+            if self.__in_flight_bytes + nbytes > self.memory_ceiling and self.__in_flight_bytes > 0:
+                logging.info("- Export queue full (%d MB), waiting for pending exports before copying %s",
+                             self.__in_flight_bytes // 2**20, export_path.name)
+                self.__condition.wait_for(lambda: self.__in_flight_bytes == 0 or
+                                                  self.__in_flight_bytes + nbytes <= self.memory_ceiling)
+            self.__in_flight_bytes += nbytes
+        self.__queue.put(ExportJob(export_path, snapshot_xdata(xdata) if snapshot else xdata, nbytes))
+
+    def __run_snapshots(self):
+        while True:
+            item = self.__snapshot_queue.get()
+            try:
+                if item is None:
+                    self.__queue.put(None)
+                    break
+                try:
+                    self.__take_snapshot(*item)
+                except Exception as e:
+                    export_path = item[0]
+                    logging.info("----- EXPORT FAILED %s: %s -----", export_path, e)
+                    with self.__condition:
+                        self.__pending_paths.discard(export_path)
+                    self.__report_failed(export_path, e)
+            finally:
+                # no reference to the live data is kept while waiting for the next export
+                item = None
+                self.__snapshot_queue.task_done()
+
+    def __report_failed(self, export_path, error):
+        if self.on_export_failed:
+            try:
+                self.on_export_failed(export_path, error)
+            except Exception as callback_error:
+                logging.info("- Could not report failed export: %s", callback_error)
+
+    def close(self):
+        """ writes all pending exports and stops the background threads """
+        self.__snapshot_queue.put(None)
+        self.__snapshot_thread.join()
+        self.__thread.join()
+
+    def __run(self):
+        while True:
+            job = self.__queue.get()
+            if job is None:
+                break
+            try:
+                xdata = job.get_xdata()
+                if self.export_spool:
+                    spool_path = self.export_spool.get_spool_path(job.export_path)
+                    self.export_spool.submit(spool_path, job.export_path, write_dm_hashed(xdata, spool_path))
+                    logging.info("- Exported %s to spool", job.export_path.name)
+                else:
+                    sha256 = write_dm_hashed(xdata, job.export_path)
+                    if sha256:
+                        manifest.add_export_manifest_entry(job.export_path, sha256)
+                    logging.info("- Exported to %s", job.export_path.name)
+                if self.preview_writer:
+                    self.preview_writer.write(xdata, job.export_path)
+            except Exception as e:
+                logging.info("----- EXPORT FAILED %s: %s -----", job.export_path, e)
+                self.__report_failed(job.export_path, e)
+            finally:
+                if job.spill_path is not None:
+                    try:
+                        job.spill_path.unlink()
+                    except OSError:
+                        pass
+                with self.__condition:
+                    self.__in_flight_bytes -= job.nbytes
+                    self.__pending_paths.discard(job.export_path)
+                    self.__condition.notify_all()
@@ -0,0 +1,282 @@
+# standard libraries
+import concurrent.futures
+import datetime
+import functools
+import hashlib
+import logging
+import os
+import pathlib
+import random
+import threading
+import typing
+
+
+# hashes files are named hashes_<instrument>_<YYYYmmdd-HHMMSS>.txt
+HASHES_FILE_PREFIX = "hashes_"
+# folders containing this string are GoodSync's own state and are never hashed
+SKIP_MARKER = "_gsdata_"
+# files are hashed in chunks of this size
+CHUNK_SIZE = 1024 * 1024
+# running manifest of files hashed while they were exported, one per export directory
+EXPORT_MANIFEST_NAME = ".sstem_export_hashes.txt"
+# temporary files of exports, archives, hashes files and transfers, which are renamed when complete
+TEMPORARY_SUFFIXES = (".part", ".chunks")
+
+_export_manifest_lock = threading.Lock()
+
+
+def hash_file(file_path, chunk_size=CHUNK_SIZE, throttle=None):
+    """ returns the SHA-256 hex digest of a file, read in chunks """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(functools.partial(f.read, chunk_size), b""):
+            sha256.update(chunk)
+            if throttle:
+                throttle.consume(len(chunk))
+    return sha256.hexdigest()
+
+
+def get_hashes_file_name(instrument="sstem3", now=None):
+    """ constructs the hashes file name, e.g. hashes_sstem3_20240312-174501.txt """
+    now = now or datetime.datetime.now()
+    return HASHES_FILE_PREFIX + str(instrument) + "_" + now.strftime("%Y%m%d-%H%M%S") + ".txt"
+
+
+def is_skipped(relative_path: pathlib.PurePath):
+    """ True for files that are never hashed (GoodSync state folders, running export manifests and files being written) """
+    return (SKIP_MARKER in str(relative_path) or relative_path.name == EXPORT_MANIFEST_NAME
+            or relative_path.name.endswith(TEMPORARY_SUFFIXES))
+
+
+def get_manifest_key(relative_path):
+    """ relative paths are compared with "/" separators, whichever OS wrote the hashes file """
+    return str(relative_path).replace("\\", "/")
+
+
+def iter_data_files(root_dir) -> typing.Iterator[pathlib.Path]:
+    """ walks root_dir recursively and yields all files that need hashing, in sorted order """
+    root_path = pathlib.Path(root_dir)
+    for dir_path, dir_names, file_names in os.walk(root_path):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            file_path = pathlib.Path(dir_path) / file_name
+            if not is_skipped(file_path.relative_to(root_path)):
+                yield file_path
+
+
+def format_hashes_line(relative_path, sha256, file_size):
+    """ one line of the hashes file: relative path, SHA-256 hash and file size """
+    return "{0} {1} {2} \n".format(relative_path, sha256, file_size)
+
+
+def read_hashes_file(hashes_file) -> typing.Dict[str, typing.Tuple[str, int]]:
+    """
+    Reads a hashes file and returns a dictionary of manifest key (relative path with "/")
+    to (SHA-256 hash, file size). Paths may contain spaces, so lines are split from the right.
+    """
+    entries = dict()
+    with open(hashes_file, "r") as f:
+        for line in f:
+            fields = line.rstrip().rsplit(None, 2)
+            if len(fields) != 3:
+                continue
+            relative_path, sha256, file_size = fields
+            try:
+                entries[get_manifest_key(relative_path)] = (sha256.lower(), int(file_size))
+            except ValueError:
+                logging.info("- Skipping malformed line in %s: %s", hashes_file, line.rstrip())
+    return entries
+
+
+def add_export_manifest_entry(file_path, sha256, stat=None):
+    """
+    Appends a file hashed during export to the running manifest of its directory,
+    together with size and modification time, so the hashes stage can trust the entry
+    for as long as the file is unchanged.
+    stat is the os.stat result the hash belongs to, by default the file is stat'ed now.
+    """
+    file_path = pathlib.Path(file_path)
+    stat = stat or file_path.stat()
+    with _export_manifest_lock:
+        with open(file_path.parent / EXPORT_MANIFEST_NAME, "a") as f:
+            f.write("{0} {1} {2} {3}\n".format(file_path.name, sha256, stat.st_size, stat.st_mtime_ns))
+
+
+def read_export_manifest(directory) -> typing.Dict[str, typing.Tuple[str, int, int]]:
+    """ returns file name -> (SHA-256 hash, file size, mtime in ns) for the running manifest of a directory """
+    entries = dict()
+    try:
+        with open(pathlib.Path(directory) / EXPORT_MANIFEST_NAME, "r") as f:
+            for line in f:
+                fields = line.rstrip("\n").rsplit(" ", 3)
+                if len(fields) == 4:
+                    try:
+                        entries[fields[0]] = (fields[1], int(fields[2]), int(fields[3]))
+                    except ValueError:
+                        pass
+    except OSError:
+        pass
+    return entries
+
+
+def get_export_manifest_hash(file_path, stat, export_manifests: typing.Dict[pathlib.Path, typing.Dict]):
+    """
+    Returns the hash recorded during export if the file is unchanged since, else None.
+    export_manifests caches the running manifests already read, by directory.
+    """
+    directory = file_path.parent
+    if directory not in export_manifests:
+        export_manifests[directory] = read_export_manifest(directory)
+    entry = export_manifests[directory].get(file_path.name)
+    if entry and entry[1] == stat.st_size and entry[2] == stat.st_mtime_ns:
+        return entry[0]
+    return None
+
+
+def find_latest_hashes_file(root_dir) -> typing.Optional[pathlib.Path]:
+    """ returns the most recently written hashes file in root_dir, or None """
+    hashes_files = [p for p in pathlib.Path(root_dir).glob(HASHES_FILE_PREFIX + "*.txt") if p.is_file()]
+    if not hashes_files:
+        return None
+    return max(hashes_files, key=lambda p: p.stat().st_mtime)
+
+
+def write_hashes_file(root_dir, instrument="sstem3", workers=1, throttle=None, previous_hashes_file=None) -> pathlib.Path:
+    """
+    Calculates SHA-256 hashes and file sizes for all files below root_dir and writes
+    them with their relative paths to a new hashes file in root_dir, ready to be
+    uploaded via GoodSync.
+    Files hashed while they were exported are taken from the running export manifests.
+    If previous_hashes_file is given, the hashes of files that have the same size and
+    were not modified since it was written are taken over as well, so only the remaining
+    files are read.
+    Files are hashed by up to workers threads; throttle limits the read rate.
+    The file is written under a temporary name and only renamed when complete.
+    Returns the path of the hashes file.
+    """
+    root_path = pathlib.Path(root_dir)
+    hashes_file = root_path / get_hashes_file_name(instrument)
+    partial_file = hashes_file.with_name(hashes_file.name + ".part")
+    logging.info("- Calculating hashes of %s", root_path)
+
+    previous_entries = dict()
+    previous_mtime = 0.0
+    if previous_hashes_file:
+        previous_entries = read_hashes_file(previous_hashes_file)
+        previous_mtime = pathlib.Path(previous_hashes_file).stat().st_mtime
+
+    export_manifests = dict()
+    export_manifests_lock = threading.Lock()
+
+    def get_line(file_path):
+        relative_path = file_path.relative_to(root_path)
+        stat = file_path.stat()
+        with export_manifests_lock:
+            sha256 = get_export_manifest_hash(file_path, stat, export_manifests)
+        if sha256:
+            return format_hashes_line(relative_path, sha256, stat.st_size)
+        previous_entry = previous_entries.get(get_manifest_key(relative_path))
+        if previous_entry and previous_entry[1] == stat.st_size and stat.st_mtime < previous_mtime:
+            return format_hashes_line(relative_path, previous_entry[0], stat.st_size)
+        return format_hashes_line(relative_path, hash_file(file_path, throttle=throttle), stat.st_size)
+
+    file_paths = list(iter_data_files(root_path))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        with open(partial_file, "w") as f:
+            # map keeps the sorted file order
+            for line in executor.map(get_line, file_paths):
+                f.write(line)
+    partial_file.replace(hashes_file)
+
+    logging.info("- Hashes written to %s", hashes_file)
+    return hashes_file
+
+
+class ManifestReport:
+    """ result of checking a hashes file against a directory tree """
+
+    def __init__(self):
+        self.missing = list()
+        self.extra = list()
+        self.corrupt = list()
+        self.checked_count = 0
+        self.hashed_count = 0
+
+    @property
+    def ok(self):
+        """ extra files are reported but do not count as a failure """
+        return not self.missing and not self.corrupt
+
+    def log_summary(self):
+        for relative_path in self.missing:
+            logging.info("- MISSING %s", relative_path)
+        for relative_path in self.corrupt:
+            logging.info("- CORRUPT %s", relative_path)
+        for relative_path in self.extra:
+            logging.info("- EXTRA %s", relative_path)
+        logging.info("- Checked %d files, hashed %d: %d missing, %d corrupt, %d extra",
+                     self.checked_count, self.hashed_count, len(self.missing), len(self.corrupt), len(self.extra))
+
+
+def verify_hashes_file(hashes_file, root_dir=None, sample_fraction=0.0, deep=False, check_mtime=True,
+                       workers=1, throttle=None) -> ManifestReport:
+    """
+    Checks the files below root_dir (default: the folder of the hashes file) against a hashes file.
+    First a cheap pass compares existence and size of every file. Only files which are suspicious,
+    i.e. modified after the hashes file was written (if check_mtime), plus a random sample_fraction
+    of the others are then re-hashed, in parallel by up to workers threads.
+    With deep=True every file is re-hashed.
+    Files below root_dir that are not listed are reported as extra, apart from hashes files.
+    """
+    hashes_file = pathlib.Path(hashes_file)
+    root_path = pathlib.Path(root_dir) if root_dir else hashes_file.parent
+    entries = read_hashes_file(hashes_file)
+    manifest_mtime = hashes_file.stat().st_mtime
+    report = ManifestReport()
+
+    # cheap pass: existence, size and mtime only
+    to_hash = list()
+    unsuspicious = list()
+    for key, (sha256, file_size) in entries.items():
+        report.checked_count += 1
+        file_path = root_path / key
+        try:
+            stat = file_path.stat()
+        except OSError:
+            report.missing.append(key)
+            continue
+        if stat.st_size != file_size:
+            report.corrupt.append(key)
+        elif deep or (check_mtime and stat.st_mtime > manifest_mtime):
+            to_hash.append(key)
+        else:
+            unsuspicious.append(key)
+    if sample_fraction > 0 and unsuspicious:
+        sample_count = min(len(unsuspicious), max(1, int(round(len(unsuspicious) * sample_fraction))))
+        to_hash.extend(random.sample(unsuspicious, sample_count))
+
+    # deep pass: re-hash the suspicious and sampled files
+    def get_hash(key):
+        try:
+            return hash_file(root_path / key, throttle=throttle)
+        except OSError:
+            return None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for key, sha256 in zip(to_hash, executor.map(get_hash, to_hash)):
+            report.hashed_count += 1
+            if sha256 is None:
+                report.missing.append(key)
+            elif sha256 != entries[key][0]:
+                report.corrupt.append(key)
+
+    for file_path in iter_data_files(root_path):
+        relative_path = file_path.relative_to(root_path)
+        key = get_manifest_key(relative_path)
+        is_hashes_file = len(relative_path.parts) == 1 and key.startswith(HASHES_FILE_PREFIX)
+        if key not in entries and not is_hashes_file:
+            report.extra.append(key)
+
+    report.missing.sort()
+    report.corrupt.sort()
+    return report
@@ -0,0 +1,177 @@
+# standard libraries
+import datetime
+import logging
+import os
+import pathlib
+import posixpath
+import re
+import sqlite3
+
+# local libraries
+from . import manifest
+
+
+# hashes_<instrument>_<YYYYmmdd-HHMMSS>.txt, as written by manifest.write_hashes_file and newHashes.bat
+HASHES_FILE_PATTERN = re.compile(r"^" + manifest.HASHES_FILE_PREFIX + r"(?P<instrument>.+)_(?P<written>\d{8}-\d{6})\.txt$")
+SHA256_PATTERN = re.compile(r"^[0-9a-fA-F]{64}$")
+# entries are committed every so many hashes files
+COMMIT_INTERVAL = 20
+
+# SHA-256 hashes are stored as 32 byte blobs and relative paths split into a shared directory and the file name.
+# An entry is one file seen by one instrument, with the times of the first and last hashes file that listed it,
+# so the repeated listings of New_Data in successive hashes files do not add rows.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS instruments (id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS directories (id INTEGER PRIMARY KEY, path TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS hashes_files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, instrument_id INTEGER, written INTEGER,
+                                         size INTEGER, mtime_ns INTEGER, entry_count INTEGER);
+CREATE TABLE IF NOT EXISTS entries (sha256 BLOB, instrument_id INTEGER, directory_id INTEGER, name TEXT, size INTEGER,
+                                    first_seen INTEGER, last_seen INTEGER,
+                                    PRIMARY KEY (sha256, instrument_id, directory_id, name)) WITHOUT ROWID;
+"""
+
+
+def parse_hashes_file_name(file_name):
+    """ returns (instrument, written as YYYYmmddHHMMSS integer) of a hashes file name, or (None, None) """
+    match = HASHES_FILE_PATTERN.match(file_name)
+    if not match:
+        return None, None
+    return match.group("instrument"), int(match.group("written").replace("-", ""))
+
+
+def format_seen(seen):
+    """ YYYYmmddHHMMSS integer -> "YYYY-mm-dd HH:MM:SS" """
+    text = str(seen)
+    return "{0}-{1}-{2} {3}:{4}:{5}".format(text[:4], text[4:6], text[6:8], text[8:10], text[10:12], text[12:14])
+
+
+class ManifestStore:
+    """
+    Store of the hashes files of all instruments in one SQLite database keyed by SHA-256,
+    to see across instruments and years what has been uploaded and what is duplicated.
+    ingest() reads the hashes files below the given directories, skipping those already read
+    unchanged (by size and mtime); lookups by hash use the primary key.
+    """
+
+    def __init__(self, database_path):
+        self.database_path = pathlib.Path(database_path)
+        self.database_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.database_path))
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.__ids = {"instruments": dict(), "directories": dict()}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __get_id(self, table, column, value):
+        ids = self.__ids[table]
+        if value not in ids:
+            self.connection.execute("INSERT OR IGNORE INTO {0} ({1}) VALUES (?)".format(table, column), (value,))
+            ids[value] = self.connection.execute("SELECT id FROM {0} WHERE {1} = ?".format(table, column),
+                                                 (value,)).fetchone()["id"]
+        return ids[value]
+
+    def find_hashes_files(self, directories):
+        """ the hashes files in and below directories """
+        for directory in directories:
+            for dir_path, dir_names, file_names in os.walk(directory):
+                dir_names[:] = [dir_name for dir_name in dir_names if manifest.SKIP_MARKER not in dir_name]
+                for file_name in file_names:
+                    if HASHES_FILE_PATTERN.match(file_name):
+                        yield pathlib.Path(dir_path) / file_name
+
+    def ingest(self, directories):
+        """ reads new and changed hashes files below directories, returns the number of files read """
+        read_count = 0
+        for hashes_file in sorted(self.find_hashes_files(directories)):
+            stat = hashes_file.stat()
+            row = self.connection.execute("SELECT size, mtime_ns FROM hashes_files WHERE path = ?",
+                                          (str(hashes_file),)).fetchone()
+            if row and (row["size"], row["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            try:
+                self.ingest_file(hashes_file, stat)
+            except (OSError, ValueError) as e:
+                logging.info("- Could not read %s: %s", hashes_file, e)
+                continue
+            read_count += 1
+            if read_count % COMMIT_INTERVAL == 0:
+                self.connection.commit()
+        self.connection.commit()
+        logging.info("- Manifest store %s updated, %d hashes files read", self.database_path, read_count)
+        return read_count
+
+    def ingest_file(self, hashes_file, stat=None):
+        """ adds the entries of one hashes file; a file read before only moves first_seen / last_seen """
+        hashes_file = pathlib.Path(hashes_file)
+        stat = stat or hashes_file.stat()
+        instrument, written = parse_hashes_file_name(hashes_file.name)
+        if written is None:
+            written = int(datetime.datetime.fromtimestamp(stat.st_mtime).strftime("%Y%m%d%H%M%S"))
+        instrument_id = self.__get_id("instruments", "name", instrument or "unknown")
+        entries = manifest.read_hashes_file(hashes_file)
+        rows = list()
+        for relative_path, (sha256, file_size) in entries.items():
+            directory, name = posixpath.split(relative_path)
+            rows.append((bytes.fromhex(sha256), instrument_id, self.__get_id("directories", "path", directory), name,
+                         file_size, written, written))
+        self.connection.executemany("INSERT INTO entries (sha256, instrument_id, directory_id, name, size, first_seen, last_seen) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                                    "ON CONFLICT (sha256, instrument_id, directory_id, name) DO UPDATE SET "
+                                    "first_seen = min(first_seen, excluded.first_seen), "
+                                    "last_seen = max(last_seen, excluded.last_seen)", rows)
+        self.connection.execute("INSERT OR REPLACE INTO hashes_files (path, instrument_id, written, size, mtime_ns, entry_count) "
+                                "VALUES (?, ?, ?, ?, ?, ?)", (str(hashes_file), instrument_id, written,
+                                                              stat.st_size, stat.st_mtime_ns, len(rows)))
+        return len(rows)
+
+    def lookup(self, sha256):
+        """ returns where a file with this SHA-256 (hex) was seen, oldest first; empty if it was never uploaded """
+        query = ("SELECT instruments.name AS instrument, directories.path AS directory, entries.name, entries.size, "
+                 "entries.first_seen, entries.last_seen FROM entries "
+                 "JOIN instruments ON entries.instrument_id = instruments.id "
+                 "JOIN directories ON entries.directory_id = directories.id "
+                 "WHERE entries.sha256 = ? ORDER BY entries.first_seen")
+        return [self.__location(row) for row in self.connection.execute(query, (bytes.fromhex(sha256),))]
+
+    def duplicates(self, min_copies=2, limit=100):
+        """
+        Returns the hashes listed under at least min_copies paths or instruments, largest
+        wasted space first, each with its size, number of copies and locations.
+        """
+        query = ("SELECT sha256, max(size) AS size, count(*) AS copies FROM entries GROUP BY sha256 "
+                 "HAVING count(*) >= ? ORDER BY max(size) * (count(*) - 1) DESC LIMIT ?")
+        duplicates = list()
+        for row in self.connection.execute(query, (min_copies, limit)).fetchall():
+            sha256 = row["sha256"].hex()
+            duplicates.append({"sha256": sha256, "size": row["size"], "copies": row["copies"],
+                               "wasted_bytes": row["size"] * (row["copies"] - 1), "locations": self.lookup(sha256)})
+        return duplicates
+
+    def totals(self):
+        """ per instrument: hashes files, files, distinct hashes, bytes and the time span covered """
+        query = ("SELECT instruments.name AS instrument, count(*) AS files, count(DISTINCT entries.sha256) AS distinct_hashes, "
+                 "sum(entries.size) AS bytes, min(entries.first_seen) AS first_seen, max(entries.last_seen) AS last_seen, "
+                 "(SELECT count(*) FROM hashes_files WHERE hashes_files.instrument_id = instruments.id) AS hashes_files "
+                 "FROM entries JOIN instruments ON entries.instrument_id = instruments.id "
+                 "GROUP BY instruments.id ORDER BY instruments.name")
+        totals = list()
+        for row in self.connection.execute(query):
+            total = dict(row)
+            total["first_seen"], total["last_seen"] = format_seen(row["first_seen"]), format_seen(row["last_seen"])
+            totals.append(total)
+        return totals
+
+    @staticmethod
+    def __location(row):
+        return {"instrument": row["instrument"],
+                "path": posixpath.join(row["directory"], row["name"]) if row["directory"] else row["name"],
+                "size": row["size"], "first_seen": format_seen(row["first_seen"]), "last_seen": format_seen(row["last_seen"])}
@@ -0,0 +1,69 @@
+# standard libraries
+import logging
+import threading
+
+
+# the persistent strings the panel writes
+PERSISTENT_KEYS = ("export_directory", "export_filter", "sstem_last_project_dir", "sstem_current_project_dir")
+
+
+class PersistentStrings:
+    """
+    Write-behind layer for the panel's persistent strings in Swift's app-data file.
+    set() only caches the value; a burst of updates, e.g. editing the export dir and setting the
+    export filter, is written with one flush delay seconds after the first of them, and only keys
+    whose value differs from Swift's are written. get() returns a value not yet written, else
+    reads it from Swift, as Application.switch_project_reference writes the project keys itself.
+    get_ui returns the Swift ui (document_controller.ui) with get/set_persistent_string,
+    queue_task(fn) runs fn on the UI thread, where the flush is done. close() flushes at once.
+    """
+
+    def __init__(self, get_ui, queue_task, delay=2.0, keys=PERSISTENT_KEYS):
+        self.get_ui = get_ui
+        self.queue_task = queue_task
+        self.delay = delay
+        self.keys = keys
+        # key -> value not yet written
+        self.__pending = dict()
+        self.__lock = threading.Lock()
+        self.__timer = None
+
+    @property
+    def pending_count(self):
+        return len(self.__pending)
+
+    def get(self, key):
+        with self.__lock:
+            if key in self.__pending:
+                return self.__pending[key]
+        return self.get_ui().get_persistent_string(key)
+
+    def set(self, key, value):
+        if key not in self.keys:
+            raise KeyError("{0} is not a SuperSTEM persistent string".format(key))
+        with self.__lock:
+            self.__pending[key] = value
+            if self.__timer is None:
+                self.__timer = threading.Timer(self.delay, self.queue_task, (self.flush,))
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    def flush(self):
+        """ writes the pending values, on the UI thread """
+        with self.__lock:
+            pending, self.__pending = self.__pending, dict()
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+        if not pending:
+            return
+        try:
+            ui = self.get_ui()
+            for key, value in pending.items():
+                if ui.get_persistent_string(key) != value:
+                    ui.set_persistent_string(key, value)
+        except Exception as e:
+            logging.info("- Exception PersistentStrings %s", e)
+
+    def close(self):
+        self.flush()
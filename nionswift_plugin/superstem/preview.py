@@ -0,0 +1,177 @@
+# standard libraries
+import logging
+import math
+import pathlib
+import queue
+import struct
+import threading
+import zlib
+
+# third party libraries
+import numpy
+
+
+# longest side of a preview in pixels
+PREVIEW_SIZE = 256
+PREVIEW_FORMATS = {"png": ".png", "jpeg": ".jpg"}
+# percentiles mapped to black and white
+CONTRAST_PERCENTILES = (1, 99)
+
+
+def get_preview_path(export_path, preview_format="png") -> pathlib.Path:
+    """ the preview of 001_HAADF_16nm_overview.dm3 is 001_HAADF_16nm_overview.png """
+    export_path = pathlib.Path(export_path)
+    return export_path.with_name(export_path.stem + PREVIEW_FORMATS[preview_format])
+
+
+def downsample(image, max_size=PREVIEW_SIZE):
+    """ block-averages a 2D array by the smallest integer factor that brings both sides to at most max_size """
+    factor = max(1, math.ceil(max(image.shape) / max_size))
+    # a line scan is only reduced along its length
+    factor_y, factor_x = min(factor, image.shape[0]), min(factor, image.shape[1])
+    if factor_y == factor_x == 1:
+        return image
+    height, width = image.shape[0] // factor_y, image.shape[1] // factor_x
+    image = image[:height * factor_y, :width * factor_x]
+    return image.reshape(height, factor_y, width, factor_x).mean(axis=(1, 3))
+
+
+def scale_to_uint8(image, percentiles=CONTRAST_PERCENTILES):
+    """ maps the percentiles of the finite values to 0 and 255 """
+    image = numpy.asarray(image, dtype=numpy.float32)
+    finite = numpy.isfinite(image)
+    if not finite.any():
+        return numpy.zeros(image.shape, numpy.uint8)
+    low, high = numpy.percentile(image[finite], percentiles)
+    if high <= low:
+        high = low + 1
+    scaled = (numpy.where(finite, image, low) - low) * (255 / (high - low))
+    return numpy.clip(scaled, 0, 255).astype(numpy.uint8)
+
+
+def render_spectrum(spectrum, width=PREVIEW_SIZE, height=PREVIEW_SIZE // 2):
+    """ draws a spectrum as white area under the curve on black, averaged to at most width columns """
+    values = numpy.nan_to_num(numpy.asarray(spectrum, dtype=numpy.float64))
+    if values.shape[0] > width:
+        edges = numpy.linspace(0, values.shape[0], width + 1).astype(int)
+        values = numpy.add.reduceat(values, edges[:-1]) / numpy.diff(edges)
+    low, high = values.min(), values.max()
+    heights = numpy.round((values - low) / ((high - low) or 1) * (height - 1)).astype(int)
+    rows = numpy.arange(height)[:, numpy.newaxis]
+    return numpy.where(rows >= height - 1 - heights[numpy.newaxis, :], 255, 0).astype(numpy.uint8)
+
+
+def make_preview(data, is_sequence=False, collection_dimension_count=None, datum_dimension_count=None,
+                 max_size=PREVIEW_SIZE):
+    """
+    Returns a uint8 image of at most max_size x max_size for data of any dimension:
+    images are downsampled, sequences summed, spectra plotted, spectrum images (SI) summed over
+    energy and 4D data summed over the detector, i.e. the sum image of the scan.
+    Without the dimension counts (plain arrays, e.g. from a DM file) the last axes are taken as datum.
+    """
+    data = numpy.asarray(data)
+    if numpy.iscomplexobj(data):
+        data = numpy.abs(data)
+    if is_sequence and data.ndim > 1:
+        data = data.sum(axis=0, dtype=numpy.float64)
+    if datum_dimension_count is None:
+        datum_dimension_count = 1 if data.ndim == 1 else 2
+        collection_dimension_count = data.ndim - datum_dimension_count
+    if collection_dimension_count:
+        data = data.sum(axis=tuple(range(data.ndim - datum_dimension_count, data.ndim)), dtype=numpy.float64)
+    while data.ndim > 2:
+        data = data.sum(axis=0, dtype=numpy.float64)
+    if data.ndim == 1:
+        # spectra, and sum images of line scans
+        return render_spectrum(data, max_size, max_size // 2)
+    return scale_to_uint8(downsample(data, max_size))
+
+
+def make_xdata_preview(xdata, max_size=PREVIEW_SIZE):
+    """ make_preview for a DataAndMetadata, with the dimensions from its data descriptor """
+    data_descriptor = xdata.data_descriptor
+    return make_preview(xdata.data, data_descriptor.is_sequence, data_descriptor.collection_dimension_count,
+                        data_descriptor.datum_dimension_count, max_size)
+
+
+def encode_png(image):
+    """ encodes a uint8 grey (2D) or RGB (3D) image as PNG, with zlib only """
+    height, width = image.shape[:2]
+    color_type = 0 if image.ndim == 2 else 2
+    # every row starts with filter type 0
+    raw = numpy.insert(numpy.ascontiguousarray(image).reshape(height, -1), 0, 0, axis=1).tobytes()
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+def encode_image(image, preview_format="png"):
+    """ PNG is encoded here, JPEG needs imageio (installed with Swift) """
+    if preview_format == "jpeg":
+        import imageio.v3 as imageio
+        return imageio.imwrite("<bytes>", image, extension=".jpg")
+    return encode_png(image)
+
+
+def write_image(image, path, preview_format="png"):
+    """ writes the image under a temporary name, renamed when complete """
+    path = pathlib.Path(path)
+    partial_path = path.with_name(path.name + ".part")
+    with open(partial_path, "wb") as f:
+        f.write(encode_image(image, preview_format))
+    partial_path.replace(path)
+    return path
+
+
+class PreviewWriter:
+    """
+    Writes a small PNG or JPEG preview next to each export, so the exports of a session can be
+    browsed without loading the DM files. write() writes at once, in the caller's thread, e.g. the
+    export queue's; submit() queues the preview for a background thread, so the export button
+    returns immediately.
+    """
+
+    def __init__(self, preview_format="png", max_size=PREVIEW_SIZE):
+        if preview_format not in PREVIEW_FORMATS:
+            raise ValueError("Unknown preview format {0}".format(preview_format))
+        self.preview_format = preview_format
+        self.max_size = max_size
+        self.__queue = queue.Queue()
+        self.__thread = None
+        self.__lock = threading.Lock()
+
+    def write(self, xdata, export_path):
+        preview_path = get_preview_path(export_path, self.preview_format)
+        try:
+            write_image(make_xdata_preview(xdata, self.max_size), preview_path, self.preview_format)
+        except Exception as e:
+            logging.info("- Could not write preview %s: %s", preview_path, e)
+            return None
+        return preview_path
+
+    def submit(self, xdata, export_path):
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+        self.__queue.put((xdata, export_path))
+
+    def close(self):
+        """ writes the queued previews and stops the background thread """
+        with self.__lock:
+            thread, self.__thread = self.__thread, None
+        if thread is not None:
+            self.__queue.put(None)
+            thread.join()
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                break
+            self.write(*item)
@@ -0,0 +1,148 @@
+# standard libraries
+import copy
+import logging
+
+# third party libraries
+import numpy
+
+
+# profile keys: bin_spatial and bin_energy are binning factors, crop "roi" crops to a rectangle graphic,
+# dtype is the float type float64 data is written as; float16 is opt-in, it keeps about 3 significant digits
+# and values beyond its range (+-65504) are clamped
+PROFILE_KEYS = ("bin_spatial", "bin_energy", "crop", "dtype")
+DOWNCAST_DTYPES = ("float32", "float16")
+# a rectangle graphic with this label is used for cropping, else the first rectangle
+CROP_GRAPHIC_LABEL = "crop"
+# metadata key the reduction is recorded under
+METADATA_KEY = "superstem_export_reduction"
+
+
+def get_roi_bounds(display_item):
+    """ returns the normalised (top, left, height, width) of the crop rectangle of a display item, or None """
+    rectangles = [graphic for graphic in getattr(display_item, "graphics", list()) if graphic.type == "rect-graphic"]
+    if not rectangles:
+        return None
+    labelled = [graphic for graphic in rectangles if (graphic.label or "").lower() == CROP_GRAPHIC_LABEL]
+    bounds = (labelled or rectangles)[0].bounds
+    return bounds.top, bounds.left, bounds.height, bounds.width
+
+
+def get_axes(data_descriptor):
+    """ returns the spatial, energy and crop axes of data laid out as [sequence] [collection] datum """
+    first_collection_axis = 1 if data_descriptor.is_sequence else 0
+    collection_axes = tuple(range(first_collection_axis, first_collection_axis + data_descriptor.collection_dimension_count))
+    datum_axes = tuple(range(first_collection_axis + data_descriptor.collection_dimension_count,
+                             first_collection_axis + data_descriptor.collection_dimension_count + data_descriptor.datum_dimension_count))
+    spatial_axes = collection_axes if collection_axes else (datum_axes if len(datum_axes) == 2 else ())
+    energy_axes = datum_axes if len(datum_axes) == 1 else ()
+    # the displayed image a rectangle graphic refers to: an image, or the scan of an SI
+    if len(collection_axes) == 0 and len(datum_axes) == 2:
+        crop_axes = datum_axes
+    elif len(collection_axes) == 2 and len(datum_axes) == 1:
+        crop_axes = collection_axes
+    else:
+        crop_axes = ()
+    return spatial_axes, energy_axes, crop_axes
+
+
+def bin_axes(data, axes, factor):
+    """ sums blocks of factor pixels along axes, dropping the remainder; integer data is summed without overflow """
+    if factor <= 1 or not axes:
+        return data
+    slices = [slice(None)] * data.ndim
+    shape = list()
+    sum_axes = list()
+    for axis, length in enumerate(data.shape):
+        if axis in axes:
+            slices[axis] = slice(0, length // factor * factor)
+            shape.extend([length // factor, factor])
+            sum_axes.append(len(shape) - 1)
+        else:
+            shape.append(length)
+    sum_dtype = numpy.int64 if numpy.issubdtype(data.dtype, numpy.integer) else None
+    binned = data[tuple(slices)].reshape(shape).sum(axis=tuple(sum_axes), dtype=sum_dtype)
+    if sum_dtype is not None and binned.size:
+        # back to the original type, or 32 bit, if the sums fit
+        for candidate in (data.dtype, numpy.int32 if numpy.issubdtype(data.dtype, numpy.signedinteger) else numpy.uint32):
+            info = numpy.iinfo(candidate)
+            if binned.min() >= info.min and binned.max() <= info.max:
+                return binned.astype(candidate)
+    return binned
+
+
+def downcast(data, dtype):
+    """ returns data as dtype, with values outside its range clamped to it, and the number of values clamped """
+    info = numpy.finfo(dtype)
+    out_of_range = (data < info.min) | (data > info.max)
+    clamped_count = int(numpy.count_nonzero(out_of_range))
+    if clamped_count:
+        logging.info("WARNING - %d values outside the %s range clamped to +-%g", clamped_count, dtype, info.max)
+        data = numpy.clip(data, info.min, info.max)
+    return data.astype(dtype), clamped_count
+
+
+def reduce_xdata(xdata, profile, roi_bounds=None, profile_name=None):
+    """
+    Applies a reduction profile to xdata before it is exported: crop to roi_bounds (if the
+    profile has crop "roi"), binning of the spatial and energy axes and downcast of float64 data.
+    Calibrations are adjusted and the reduction is recorded in the metadata under METADATA_KEY.
+    Returns the reduced xdata, with its own copy of the data, and the description of the reduction
+    (None, and xdata unchanged, if nothing applied).
+    """
+    from nion.data import Calibration
+    from nion.data import DataAndMetadata
+    data = xdata.data
+    spatial_axes, energy_axes, crop_axes = get_axes(xdata.data_descriptor)
+    calibrations = [Calibration.Calibration(calibration.offset, calibration.scale, calibration.units)
+                    for calibration in xdata.dimensional_calibrations]
+    description = dict()
+
+    if profile.get("crop") == "roi" and roi_bounds is not None:
+        if crop_axes:
+            slices = [slice(None)] * data.ndim
+            crop = list()
+            for axis, start, length in zip(crop_axes, roi_bounds[:2], roi_bounds[2:]):
+                first = max(0, min(data.shape[axis] - 1, int(round(start * data.shape[axis]))))
+                last = max(first + 1, min(data.shape[axis], int(round((start + length) * data.shape[axis]))))
+                slices[axis] = slice(first, last)
+                calibrations[axis].offset += first * calibrations[axis].scale
+                crop.extend([first, last - first])
+            data = data[tuple(slices)]
+            description["crop"] = crop[0::2] + crop[1::2]
+        else:
+            logging.info("- Crop to ROI not supported for %d-dimensional data, not cropped", data.ndim)
+
+    for key, axes in (("bin_spatial", spatial_axes), ("bin_energy", energy_axes)):
+        factor = int(profile.get(key) or 1)
+        if factor > 1 and axes:
+            data = bin_axes(data, axes, factor)
+            for axis in axes:
+                calibrations[axis].offset += (factor - 1) / 2 * calibrations[axis].scale
+                calibrations[axis].scale *= factor
+            description[key] = factor
+
+    dtype = profile.get("dtype")
+    if dtype in DOWNCAST_DTYPES and data.dtype == numpy.float64:
+        data, clamped_count = downcast(data, dtype)
+        description["dtype"] = dtype
+        if clamped_count:
+            description["clamped"] = clamped_count
+
+    if not description:
+        return xdata, None
+    if numpy.shares_memory(data, xdata.data):
+        # only cropped: the export must not change with the live data
+        data = numpy.copy(data)
+    description.update({"profile": profile_name, "original_shape": list(xdata.data.shape),
+                        "original_dtype": str(xdata.data.dtype)})
+    metadata = copy.deepcopy(dict(xdata.metadata))
+    metadata[METADATA_KEY] = description
+    reduced_xdata = DataAndMetadata.new_data_and_metadata(data,
+                                                          intensity_calibration=xdata.intensity_calibration,
+                                                          dimensional_calibrations=calibrations,
+                                                          metadata=metadata,
+                                                          timestamp=xdata.timestamp,
+                                                          data_descriptor=xdata.data_descriptor,
+                                                          timezone=xdata.timezone,
+                                                          timezone_offset=xdata.timezone_offset)
+    return reduced_xdata, description
@@ -0,0 +1,151 @@
+# standard libraries
+import concurrent.futures
+import csv
+import datetime
+import json
+import logging
+import math
+import os
+import pathlib
+
+# third party libraries
+import numpy
+
+# local libraries
+from . import catalog
+from . import preview
+
+
+# the report of <export dir> is <export dir>/<export dir name>_report.png/.csv/.json
+REPORT_SUFFIX = "_report"
+THUMBNAIL_SIZE = 160
+CONTACT_SHEET_COLUMNS = 8
+# height of the title under each thumbnail, if Pillow is there to draw it
+LABEL_HEIGHT = 14
+BACKGROUND = 32
+CSV_COLUMNS = ("file", "title", "no", "detector", "sub", "fov_nm", "descr", "shape", "dtype", "size_bytes",
+               "modified", "error")
+
+
+def get_report_paths(export_dir):
+    """ returns the paths of the contact sheet, CSV and JSON summary of an export directory """
+    export_dir = pathlib.Path(export_dir)
+    stem = export_dir.name + REPORT_SUFFIX
+    return export_dir / (stem + ".png"), export_dir / (stem + ".csv"), export_dir / (stem + ".json")
+
+
+def find_exports(export_dir):
+    """
+    the DM files written by the export buttons to export_dir and its subfolders (see shard.py),
+    in the order of their names
+    """
+    file_paths = list()
+    with os.scandir(export_dir) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                with os.scandir(entry.path) as shard_entries:
+                    file_paths.extend(pathlib.Path(shard_entry.path) for shard_entry in shard_entries
+                                      if shard_entry.is_file() and pathlib.Path(shard_entry.name).suffix.lower() in catalog.EXPORT_SUFFIXES)
+            elif entry.is_file() and pathlib.Path(entry.name).suffix.lower() in catalog.EXPORT_SUFFIXES:
+                file_paths.append(pathlib.Path(entry.path))
+    return sorted(file_paths, key=lambda file_path: (file_path.name, str(file_path)))
+
+
+def summarize_export(file_path, thumbnail_size=THUMBNAIL_SIZE):
+    """
+    Reads one DM file and returns its summary row and thumbnail (uint8 array, None if it could not be read).
+    Runs in the worker processes of generate_report; reading DM files needs the DM plugin of nionswift-io.
+    """
+    file_path = pathlib.Path(file_path)
+    stat = file_path.stat()
+    row = {"file": file_path.name, "title": file_path.stem}
+    row.update(catalog.parse_title(file_path.stem))
+    row.update({"shape": None, "dtype": None, "size_bytes": stat.st_size,
+                "modified": datetime.datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"), "error": None})
+    thumbnail = None
+    try:
+        from nionswift_plugin.DM_IO import dm3_image_utils
+        with open(file_path, "rb") as f:
+            xdata = dm3_image_utils.load_image(f)
+        row["shape"] = "x".join(str(n) for n in xdata.data.shape)
+        row["dtype"] = str(xdata.data.dtype)
+        thumbnail = preview.make_xdata_preview(xdata, thumbnail_size)
+    except Exception as e:
+        row["error"] = str(e) or type(e).__name__
+    return row, thumbnail
+
+
+def draw_labels(sheet, labels):
+    """ draws (x, y, text) labels onto the sheet if Pillow is installed (it is with Swift), else leaves it as is """
+    try:
+        from PIL import Image, ImageDraw
+    except ImportError:
+        return sheet
+    image = Image.fromarray(sheet)
+    draw = ImageDraw.Draw(image)
+    for x, y, text in labels:
+        draw.text((x + 2, y + 1), text, fill=255)
+    return numpy.asarray(image)
+
+
+def make_contact_sheet(thumbnails, titles, thumbnail_size=THUMBNAIL_SIZE, columns=CONTACT_SHEET_COLUMNS):
+    """ tiles the thumbnails, centred in cells of thumbnail_size with the title below, into one uint8 image """
+    columns = max(1, min(columns, len(thumbnails)))
+    rows = max(1, math.ceil(len(thumbnails) / columns))
+    cell_height = thumbnail_size + LABEL_HEIGHT
+    sheet = numpy.full((rows * cell_height, columns * thumbnail_size), BACKGROUND, numpy.uint8)
+    labels = list()
+    # about 6 pixels per character of the default font
+    max_chars = thumbnail_size // 6
+    for index, (thumbnail, title) in enumerate(zip(thumbnails, titles)):
+        y, x = index // columns * cell_height, index % columns * thumbnail_size
+        if thumbnail is not None:
+            # small data, e.g. the sum image of an SI, is enlarged by pixel repetition
+            factor = thumbnail_size // max(thumbnail.shape)
+            if factor > 1:
+                thumbnail = thumbnail.repeat(factor, axis=0).repeat(factor, axis=1)
+            height, width = thumbnail.shape
+            top, left = y + (thumbnail_size - height) // 2, x + (thumbnail_size - width) // 2
+            sheet[top:top + height, left:left + width] = thumbnail
+        labels.append((x, y + thumbnail_size, title if len(title) <= max_chars else title[:max_chars - 1] + "~"))
+    return draw_labels(sheet, labels)
+
+
+def generate_report(export_dir, workers=4, thumbnail_size=THUMBNAIL_SIZE, columns=CONTACT_SHEET_COLUMNS,
+                    processes=True):
+    """
+    Writes a one-page overview of a session's export directory: a contact sheet of thumbnails of
+    all DM files and a CSV and JSON summary with the fields of their titles, shapes and sizes.
+    The files are read and reduced to thumbnails in parallel, in worker processes unless
+    processes=False (threads, for use inside Swift); only the thumbnails are sent back.
+    Returns the paths of the contact sheet, CSV and JSON file.
+    """
+    export_dir = pathlib.Path(export_dir)
+    file_paths = find_exports(export_dir)
+    executor_class = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+    with executor_class(max_workers=max(1, workers)) as executor:
+        results = list(executor.map(summarize_export, file_paths, [thumbnail_size] * len(file_paths),
+                                    chunksize=max(1, len(file_paths) // (4 * max(1, workers)))))
+    rows = [row for row, thumbnail in results]
+    for row in rows:
+        if row["error"]:
+            logging.info("- Could not read %s: %s", row["file"], row["error"])
+
+    sheet_path, csv_path, json_path = get_report_paths(export_dir)
+    if results:
+        preview.write_image(make_contact_sheet([thumbnail for row, thumbnail in results],
+                                               [row["title"] for row in rows], thumbnail_size, columns), sheet_path)
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    summary = {"export_directory": str(export_dir),
+               "session": catalog.parse_session_name(export_dir.name),
+               "generated": datetime.datetime.now().isoformat(timespec="seconds"),
+               "item_count": len(rows),
+               "total_bytes": sum(row["size_bytes"] for row in rows),
+               "items": rows}
+    with open(json_path, "w") as f:
+        json.dump(summary, f, indent=1)
+    logging.info("- Report of %d exports (%d MB) written to %s", len(rows), summary["total_bytes"] // 2**20, json_path.parent)
+    return sheet_path, csv_path, json_path
@@ -0,0 +1,75 @@
+# standard libraries
+import datetime
+import logging
+import pathlib
+
+
+# the session fields the export directory is made of, as in the "stem.session.<field>" library keys
+SESSION_FIELDS = ("microscopist", "sample", "sample_area", "task")
+
+
+def get_session_string(snapshot):
+    """ e.g. "DMH_S1234_area1" from microscopist, sample and sample_area (the task is not part of it) """
+    microscopist = str(snapshot.get("microscopist")).upper()
+    sample = "S" + str(snapshot.get("sample"))
+    sample_area = str(snapshot.get("sample_area"))
+    return "_".join([microscopist, sample, sample_area])
+
+
+class SessionMetadataObserver:
+    """
+    Keeps a snapshot of the session fields and the export directory name derived from them.
+    The fields are read with get_library_value once; after start() changes made in the Session
+    panel update the snapshot field by field, from the property changed events of Swift's session
+    metadata model, and on_changed(observer) is called when the session string changed.
+    Without that model (older Swift) refresh() reads all fields again.
+    """
+
+    def __init__(self, get_library_value, on_changed=None):
+        self.get_library_value = get_library_value
+        self.on_changed = on_changed
+        self.snapshot = dict()
+        self.session_string = ""
+        self.__listener = None
+        self.refresh()
+
+    @property
+    def is_observing(self):
+        return self.__listener is not None
+
+    def start(self):
+        try:
+            from nion.swift.model import ApplicationData
+            self.__listener = ApplicationData.get_session_metadata_model().property_changed_event.listen(
+                self.__property_changed)
+        except (ImportError, AttributeError) as e:
+            self.__listener = None
+            logging.info("- Session metadata changes are not observed (%s)", e)
+
+    def close(self):
+        if self.__listener is not None:
+            self.__listener.close()
+            self.__listener = None
+
+    def refresh(self):
+        """ reads all session fields """
+        for field in SESSION_FIELDS:
+            self.snapshot[field] = self.get_library_value("stem.session." + field)
+        self.session_string = get_session_string(self.snapshot)
+
+    def get_export_dir_path(self, export_base_dir, date=None) -> pathlib.Path:
+        """ the export directory <export_base_dir>/<YYYY_MM_DD>_<session string> """
+        if not self.is_observing:
+            self.refresh()
+        date_string = (date or datetime.datetime.now()).strftime("%Y_%m_%d")
+        return pathlib.Path(export_base_dir).joinpath(date_string + "_" + self.session_string)
+
+    def __property_changed(self, name):
+        if name not in SESSION_FIELDS:
+            return
+        self.snapshot[name] = self.get_library_value("stem.session." + name)
+        session_string = get_session_string(self.snapshot)
+        if session_string != self.session_string:
+            self.session_string = session_string
+            if self.on_changed:
+                self.on_changed(self)
@@ -0,0 +1,92 @@
+# standard libraries
+import logging
+import os
+import pathlib
+import re
+
+
+# export_shard_by: subfolders named after the detector label of the export button, or after ranges of No
+SHARD_BY = ("detector", "no")
+# DM files in an export directory before further exports go into subfolders
+SHARD_THRESHOLD = 1000
+# the files counted, as catalog.EXPORT_SUFFIXES: previews and hashes files next to the exports are not
+EXPORT_SUFFIXES = (".dm3", ".dm4")
+# Nos per subfolder when sharding by No, 100 gives 000-099, 100-199, ...
+NO_RANGE = 100
+
+
+def get_shard_name(shard_by, detector, no_field_string, no_range=NO_RANGE):
+    """ returns the subfolder of an export, e.g. "HAADF" or "100-199", or None if the field is not usable """
+    if shard_by == "detector":
+        return re.sub(r"[^A-Za-z0-9_-]+", "_", str(detector)).strip("_") or None
+    if shard_by == "no":
+        if not str(no_field_string).isdigit():
+            return None
+        first = int(no_field_string) // no_range * no_range
+        return "{0:03d}-{1:03d}".format(first, first + no_range - 1)
+    return None
+
+
+def count_files(directory):
+    """ the number of DM files directly in directory, 0 if it does not exist """
+    try:
+        with os.scandir(directory) as entries:
+            return sum(1 for entry in entries if entry.name.lower().endswith(EXPORT_SUFFIXES) and entry.is_file())
+    except OSError:
+        return 0
+
+
+class ExportLayout:
+    """
+    Where the quick exports of an export directory go. Without shard_by, or while the directory
+    holds fewer than threshold DM files, exports go into the directory itself; past that into a
+    subfolder named after the detector label or the No range of the export, so a long session
+    does not leave thousands of files in one folder.
+    The path of an export follows from its fields alone: the directory is listed once, on the first
+    export to it, and the exports written since are counted, so checking whether an export exists
+    takes at most two stats however large the directory is.
+    """
+
+    def __init__(self, shard_by=None, threshold=SHARD_THRESHOLD, no_range=NO_RANGE):
+        self.shard_by = shard_by
+        self.threshold = threshold
+        self.no_range = no_range
+        # export directory -> number of files in it, counted on first use
+        self.__file_counts = dict()
+
+    def is_sharded(self, directory):
+        if not self.shard_by:
+            return False
+        directory = pathlib.Path(directory)
+        if directory not in self.__file_counts:
+            self.__file_counts[directory] = count_files(directory)
+        return self.__file_counts[directory] >= self.threshold
+
+    def get_shard_path(self, directory, file_name, detector, no_field_string):
+        shard_name = get_shard_name(self.shard_by, detector, no_field_string, self.no_range)
+        return pathlib.Path(directory).joinpath(shard_name, file_name) if shard_name else None
+
+    def get_export_path(self, directory, file_name, detector, no_field_string):
+        """ the path a new export is written to """
+        if self.is_sharded(directory):
+            shard_path = self.get_shard_path(directory, file_name, detector, no_field_string)
+            if shard_path:
+                return shard_path
+        return pathlib.Path(directory).joinpath(file_name)
+
+    def get_candidate_paths(self, directory, file_name, detector, no_field_string):
+        """ the paths an export of this name may already have: the directory itself and its shard """
+        candidate_paths = [pathlib.Path(directory).joinpath(file_name)]
+        shard_path = self.get_shard_path(directory, file_name, detector, no_field_string) if self.shard_by else None
+        if shard_path:
+            candidate_paths.append(shard_path)
+        return candidate_paths
+
+    def add(self, export_path):
+        """ counts an export written to the top level of its directory """
+        directory = pathlib.Path(export_path).parent
+        if directory in self.__file_counts:
+            self.__file_counts[directory] += 1
+            if self.__file_counts[directory] == self.threshold:
+                logging.info("- %s holds %d files, further exports go into subfolders by %s",
+                             directory, self.threshold, self.shard_by)
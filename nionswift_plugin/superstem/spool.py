@@ -0,0 +1,169 @@
+# standard libraries
+import functools
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import uuid
+
+# local libraries
+from . import manifest
+
+
+# every spooled file has a sidecar <spool file>.json with its destination and hash
+SIDECAR_SUFFIX = ".json"
+
+
+class SpoolEntry:
+    """ one spooled export waiting to be moved to its destination """
+
+    def __init__(self, spool_path, destination, sha256=None):
+        self.spool_path = pathlib.Path(spool_path)
+        self.destination = pathlib.Path(destination)
+        self.sha256 = sha256
+        self.attempts = 0
+        self.next_attempt = 0.0
+
+    @property
+    def sidecar_path(self) -> pathlib.Path:
+        return self.spool_path.with_name(self.spool_path.name + SIDECAR_SUFFIX)
+
+
+def copy_hashed(source_path, destination_path):
+    """ copies a file in chunks, returns the SHA-256 of the bytes copied """
+    sha256 = hashlib.sha256()
+    with open(source_path, "rb") as src, open(destination_path, "wb") as dst:
+        for chunk in iter(functools.partial(src.read, manifest.CHUNK_SIZE), b""):
+            dst.write(chunk)
+            sha256.update(chunk)
+        dst.flush()
+        os.fsync(dst.fileno())
+    return sha256.hexdigest()
+
+
+class ExportSpool:
+    """
+    Exports are written to a fast local spool directory first, so an export click never waits
+    on a slow or unreachable export share. A background drainer moves the spooled files to their
+    export directory: it copies each file under a temporary name, reads the copy back to check its
+    SHA-256, renames it into place and adds it to the running manifest of the export directory.
+    Failed moves are retried with exponential backoff up to max_delay seconds, for as long as it
+    takes. Destination and hash are kept in a sidecar file next to each spooled file, so files
+    still spooled when Swift closes are drained after the next start.
+    """
+
+    def __init__(self, spool_dir, initial_delay=2.0, max_delay=300.0):
+        self.spool_dir = pathlib.Path(spool_dir)
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.__entries = list()
+        self.__condition = threading.Condition()
+        self.__closed = False
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.__recover()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    @property
+    def pending_count(self):
+        with self.__condition:
+            return len(self.__entries)
+
+    def is_pending(self, export_path):
+        """ True while a file for export_path is spooled but not yet moved to it """
+        export_path = pathlib.Path(export_path)
+        with self.__condition:
+            return any(entry.destination == export_path for entry in self.__entries)
+
+    def get_spool_path(self, export_path) -> pathlib.Path:
+        """ returns a new spool file path for an export to export_path, with the same extension """
+        export_path = pathlib.Path(export_path)
+        return self.spool_dir / (uuid.uuid4().hex + "_" + export_path.name)
+
+    def submit(self, spool_path, export_path, sha256=None):
+        """ queues a file written to spool_path to be moved to export_path; sha256 is its hash if known """
+        entry = SpoolEntry(spool_path, export_path, sha256)
+        partial_path = entry.sidecar_path.with_name(entry.sidecar_path.name + ".part")
+        with open(partial_path, "w") as f:
+            json.dump({"destination": str(entry.destination), "sha256": sha256}, f)
+        partial_path.replace(entry.sidecar_path)
+        with self.__condition:
+            self.__entries.append(entry)
+            self.__condition.notify_all()
+
+    def close(self):
+        """ stops the drainer after the current move, files still spooled are drained after the next start """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+
+    def __recover(self):
+        for sidecar_path in sorted(self.spool_dir.glob("*" + SIDECAR_SUFFIX)):
+            spool_path = sidecar_path.with_name(sidecar_path.name[:-len(SIDECAR_SUFFIX)])
+            try:
+                with open(sidecar_path, "r") as f:
+                    sidecar = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.info("- Ignoring spool file %s: %s", sidecar_path, e)
+                continue
+            if spool_path.is_file():
+                self.__entries.append(SpoolEntry(spool_path, sidecar["destination"], sidecar.get("sha256")))
+        if self.__entries:
+            logging.info("- %d exports left in spool %s, draining them", len(self.__entries), self.spool_dir)
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__closed:
+                    now = time.monotonic()
+                    ready = [entry for entry in self.__entries if entry.next_attempt <= now]
+                    if ready:
+                        break
+                    timeout = min(entry.next_attempt for entry in self.__entries) - now if self.__entries else None
+                    self.__condition.wait(timeout)
+                if self.__closed:
+                    return
+                entry = ready[0]
+            try:
+                self.__move(entry)
+                with self.__condition:
+                    self.__entries.remove(entry)
+                    self.__condition.notify_all()
+            except FileExistsError as e:
+                # needs a decision by hand, the file stays in the spool until the next start
+                logging.info("----- COULD NOT MOVE %s FROM SPOOL: %s -----", entry.spool_path, e)
+                with self.__condition:
+                    self.__entries.remove(entry)
+                    self.__condition.notify_all()
+            except Exception as e:
+                entry.attempts += 1
+                delay = min(self.max_delay, self.initial_delay * 2 ** (entry.attempts - 1))
+                entry.next_attempt = time.monotonic() + delay
+                logging.info("- Moving %s to %s failed (attempt %d), retrying in %.1f s: %s",
+                             entry.spool_path.name, entry.destination, entry.attempts, delay, e)
+
+    def __move(self, entry: SpoolEntry):
+        destination = entry.destination
+        if destination.exists():
+            # a previous attempt got as far as the rename; otherwise never overwrite an export
+            sha256 = entry.sha256 or manifest.hash_file(entry.spool_path)
+            if manifest.hash_file(destination) != sha256:
+                raise FileExistsError("{0} exists with different content".format(destination))
+            manifest.add_export_manifest_entry(destination, sha256)
+        else:
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            partial_path = destination.with_name(destination.name + ".part")
+            sha256 = copy_hashed(entry.spool_path, partial_path)
+            if entry.sha256 and sha256 != entry.sha256:
+                raise IOError("Spool file {0} does not match its hash".format(entry.spool_path))
+            if manifest.hash_file(partial_path) != sha256:
+                raise IOError("Copy of {0} does not match".format(entry.spool_path))
+            partial_path.replace(destination)
+            manifest.add_export_manifest_entry(destination, sha256)
+        entry.spool_path.unlink()
+        entry.sidecar_path.unlink()
+        logging.info("- Moved %s from spool to %s", destination.name, destination.parent)
@@ -0,0 +1,314 @@
+# standard libraries
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# local libraries
+from . import archive
+from . import codec
+
+
+STATE_FILE_NAME = "staging.json"
+# seconds between attempts to take a lock held elsewhere
+LOCK_POLL_INTERVAL = 0.1
+
+
+def get_staging_area(project_dir, project_name, staging_base_dir, **kwargs):
+    """ each project is staged in its own folder <staging_base_dir>/<project name> """
+    return StagingArea(project_dir, pathlib.Path(staging_base_dir) / project_name, **kwargs)
+
+
+class StagingLock:
+    """
+    Exclusive lock on a lock file, held while a StagingArea stages, finalises or removes its staging dir,
+    so that two StagingArea instances of one project (the session archiver's and the one of the compress
+    job, which may run in another process such as superstem-archive) never work on it at the same time.
+    It is an OS lock on the open file, released by the OS if the process ends while holding it.
+    """
+
+    def __init__(self, lock_path):
+        self.lock_path = pathlib.Path(lock_path)
+        self.__file = None
+
+    def acquire(self, blocking=True):
+        """ takes the lock, waiting for it unless blocking is False; returns whether it was taken """
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.lock_path, "a+b")
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            except OSError:
+                if not blocking:
+                    f.close()
+                    return False
+                time.sleep(LOCK_POLL_INTERVAL)
+                continue
+            if self.__is_current(f):
+                self.__file = f
+                return True
+            # the holder removed the lock file with its staging dir meanwhile, lock the new one
+            f.close()
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            f = open(self.lock_path, "a+b")
+
+    def __is_current(self, f):
+        """ whether the locked file is still the one at lock_path """
+        try:
+            return os.path.samestat(os.fstat(f.fileno()), os.stat(self.lock_path))
+        except OSError:
+            return False
+
+    def unlink(self):
+        """ removes the lock file while the lock is held; where open files cannot be deleted it is left """
+        try:
+            self.lock_path.unlink()
+        except OSError:
+            pass
+
+    def release(self):
+        f, self.__file = self.__file, None
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        f.close()
+
+
+class StagingArea:
+    """
+    Staging area for the archive of one raw Swift project, so the project can be compressed
+    while the session is still running.
+    Every data file of the project is compressed into its own single-member zip in
+    staging_dir once it is stable. finalize() then only stages the files that are new or
+    changed since and assembles the final archive from the staged members without
+    recompressing them.
+    The state (member name -> size, mtime and staged zip) is kept in staging.json, so staging
+    continues where it left off when Swift is restarted.
+    scan(), finalize() and remove() hold the lock file <staging_dir>.lock and reread the state
+    when they take it, so they also see what another instance of the same project did.
+    """
+
+    def __init__(self, project_dir, staging_dir, compression=None, throttle=None):
+        self.project_dir = pathlib.Path(project_dir)
+        self.staging_dir = pathlib.Path(staging_dir)
+        # zipfile compression type or codec.CompressionPolicy, by default adaptive per file
+        self.compression = compression if compression is not None else codec.CompressionPolicy()
+        self.throttle = throttle
+        self.__lock = threading.RLock()
+        self.__staging_lock = StagingLock(self.staging_dir.with_name(self.staging_dir.name + ".lock"))
+        self.__lock_depth = 0
+        # (size, mtime_ns) of each file seen in the last scan, to tell when a file has become stable
+        self.__observed = dict()
+        self.__state = self.__read_state()
+
+    @property
+    def staged_count(self):
+        return len(self.__state)
+
+    def has_staged_files(self):
+        return self.staged_count > 0
+
+    def __read_state(self):
+        try:
+            with open(self.staging_dir / STATE_FILE_NAME, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    @contextlib.contextmanager
+    def __locked(self, blocking=True):
+        """ holds the thread lock and the lock file, yields whether they were taken """
+        if not self.__lock.acquire(blocking):
+            yield False
+            return
+        try:
+            if self.__lock_depth == 0:
+                if not self.__staging_lock.acquire(blocking):
+                    yield False
+                    return
+                self.__state = self.__read_state()
+            self.__lock_depth += 1
+            try:
+                yield True
+            finally:
+                self.__lock_depth -= 1
+                if self.__lock_depth == 0:
+                    self.__staging_lock.release()
+        finally:
+            self.__lock.release()
+
+    def __write_state(self):
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        partial_file = self.staging_dir / (STATE_FILE_NAME + ".part")
+        with open(partial_file, "w") as f:
+            json.dump(self.__state, f)
+        partial_file.replace(self.staging_dir / STATE_FILE_NAME)
+
+    def get_member_name(self, file_path):
+        """ member names start with the project folder name, as in archive.compress_directory """
+        return pathlib.Path(file_path).relative_to(self.project_dir.parent).as_posix()
+
+    def __stage_file(self, file_path, member_name, stat):
+        """ compresses one file into its own zip in the staging dir, returns False if it changed meanwhile """
+        staged_name = uuid.uuid4().hex + ".zip"
+        staged_path = self.staging_dir / staged_name
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(staged_path, "w", allowZip64=True) as zf:
+            archive.write_member(zf, file_path, member_name, codec.get_compress_type(self.compression, file_path),
+                                 self.throttle)
+        new_stat = os.stat(file_path)
+        if (new_stat.st_size, new_stat.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            staged_path.unlink()
+            return False
+        old_entry = self.__state.get(member_name)
+        self.__state[member_name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "file": staged_name}
+        if old_entry:
+            try:
+                (self.staging_dir / old_entry["file"]).unlink()
+            except OSError:
+                pass
+        return True
+
+    def scan(self, stable_seconds=None, stop_event=None, blocking=True):
+        """
+        Stages all files that are new or changed since they were staged and that are stable,
+        i.e. unchanged since the previous scan and not modified for stable_seconds.
+        With stable_seconds None every new or changed file is staged right away.
+        The scan ends early, after the file being staged, once stop_event is set.
+        Unless blocking, nothing is staged while another instance holds the lock.
+        Returns the number of files staged.
+        """
+        with self.__locked(blocking) as locked:
+            if not locked:
+                logging.info("- Staging of %s skipped, %s is busy", self.project_dir, self.staging_dir)
+                return 0
+            now = time.time()
+            observed = dict()
+            staged_count = 0
+            for dir_path, dir_names, file_names in os.walk(self.project_dir):
+                if stop_event is not None and stop_event.is_set():
+                    break
+                for file_name in file_names:
+                    if stop_event is not None and stop_event.is_set():
+                        break
+                    file_path = pathlib.Path(dir_path) / file_name
+                    try:
+                        stat = file_path.stat()
+                    except OSError:
+                        continue
+                    member_name = self.get_member_name(file_path)
+                    signature = (stat.st_size, stat.st_mtime_ns)
+                    observed[member_name] = signature
+                    entry = self.__state.get(member_name)
+                    if entry and (entry["size"], entry["mtime_ns"]) == signature:
+                        continue
+                    if stable_seconds is not None:
+                        if self.__observed.get(member_name) != signature or now - stat.st_mtime < stable_seconds:
+                            continue
+                    try:
+                        if self.__stage_file(file_path, member_name, stat):
+                            staged_count += 1
+                    except OSError as e:
+                        logging.info("- Could not stage %s: %s", file_path, e)
+            if stop_event is not None and stop_event.is_set():
+                if staged_count:
+                    self.__write_state()
+                return staged_count
+            # forget files that were deleted from the project
+            deleted_member_names = set(self.__state) - set(observed)
+            for member_name in deleted_member_names:
+                try:
+                    (self.staging_dir / self.__state.pop(member_name)["file"]).unlink()
+                except OSError:
+                    pass
+            self.__observed = observed
+            if staged_count or deleted_member_names:
+                self.__write_state()
+            return staged_count
+
+    def finalize(self, archive_path):
+        """
+        Stages the remaining new or changed files and writes the final archive from the
+        staged members, in the same member order as archive.compress_directory.
+        The archive is written under a temporary name and only renamed when complete.
+        """
+        with self.__locked():
+            staged_count = self.scan()
+            logging.info("- Staged %d remaining files, assembling %s", staged_count, archive_path)
+            archive_path = pathlib.Path(archive_path)
+            partial_path = archive_path.with_name(archive_path.name + ".part")
+            with zipfile.ZipFile(partial_path, "w", allowZip64=True) as target:
+                for dir_path, dir_names, file_names in os.walk(self.project_dir):
+                    dir_names.sort()
+                    dir_path = pathlib.Path(dir_path)
+                    target.write(dir_path, self.get_member_name(dir_path))
+                    for file_name in sorted(file_names):
+                        member_name = self.get_member_name(dir_path / file_name)
+                        entry = self.__state.get(member_name)
+                        if entry is None:
+                            # appeared after the last scan, compress it directly
+                            archive.write_member(target, dir_path / file_name, member_name,
+                                                 codec.get_compress_type(self.compression, dir_path / file_name),
+                                                 self.throttle)
+                            continue
+                        with zipfile.ZipFile(self.staging_dir / entry["file"], "r") as source:
+                            archive.copy_member_raw(source, source.getinfo(member_name), target)
+            partial_path.replace(archive_path)
+
+    def remove(self):
+        """ deletes the staging dir and its lock file, once the final archive has been verified """
+        with self.__locked():
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            self.__staging_lock.unlink()
+            self.__state = dict()
+            self.__observed = dict()
+
+
+class SessionArchiver:
+    """
+    Background thread that stages the files of the active project every interval seconds
+    while the session runs, so that "Compress Last Proj" only has to finalise the archive.
+    """
+
+    def __init__(self, staging_area: StagingArea, interval=60, stable_seconds=30):
+        self.staging_area = staging_area
+        self.interval = interval
+        self.stable_seconds = stable_seconds
+        self.__stop_event = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self):
+        logging.info("- Incremental archiving of %s to %s", self.staging_area.project_dir, self.staging_area.staging_dir)
+        self.__thread.start()
+
+    def stop(self):
+        """ stops after the file being staged and waits for it, so the staging area can be finalised next """
+        self.__stop_event.set()
+        if self.__thread.is_alive():
+            self.__thread.join()
+
+    def __run(self):
+        while not self.__stop_event.wait(self.interval):
+            try:
+                # a compress job finalising the same project has the lock, skip the scan rather than wait
+                self.staging_area.scan(self.stable_seconds, self.__stop_event, blocking=False)
+            except Exception as e:
+                logging.info("- Exception SessionArchiver %s", e)
@@ -0,0 +1,34 @@
+# standard libraries
+import threading
+import time
+
+
+class Throttle:
+    """
+    Limits the rate at which a job reads data to max_bytes_per_second.
+    One throttle is shared by all worker threads of a job, so the limit applies to
+    the job as a whole. A max_bytes_per_second of None or 0 means no limit.
+    """
+
+    def __init__(self, max_bytes_per_second=None):
+        self.max_bytes_per_second = max_bytes_per_second
+        self.__lock = threading.Lock()
+        self.__start = time.monotonic()
+        self.__bytes = 0
+
+    @classmethod
+    def from_megabytes(cls, max_megabytes_per_second):
+        """ creates a throttle from a limit in MB/s, as given on the command line """
+        if not max_megabytes_per_second:
+            return cls()
+        return cls(int(max_megabytes_per_second * 1024 * 1024))
+
+    def consume(self, byte_count):
+        """ accounts for byte_count bytes read and sleeps as long as the job is ahead of its rate """
+        if not self.max_bytes_per_second:
+            return
+        with self.__lock:
+            self.__bytes += byte_count
+            delay = self.__start + self.__bytes / self.max_bytes_per_second - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,205 @@
+# standard libraries
+import concurrent.futures
+import logging
+import os
+import pathlib
+import shutil
+import threading
+
+# local libraries
+from . import manifest
+
+
+# files are copied in chunks of this size, which is also the granularity a copy resumes at
+TRANSFER_CHUNK_SIZE = 64 * 1024 * 1024
+# the chunks of <file>.part already copied are listed in <file>.part.chunks
+CHUNKS_SUFFIX = ".chunks"
+# seconds the mtime of a copy may differ from its source, shares and FAT drives store it in 2 s steps
+MTIME_TOLERANCE = 2
+
+
+class TransferReport:
+    """ result of a transfer """
+
+    def __init__(self):
+        self.copied = list()
+        self.skipped = list()
+        self.failed = list()
+        self.copied_bytes = 0
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def log_summary(self):
+        for relative_path in self.failed:
+            logging.info("- FAILED %s", relative_path)
+        logging.info("- Copied %d files (%d MB), %d already there, %d failed",
+                     len(self.copied), self.copied_bytes // 2**20, len(self.skipped), len(self.failed))
+
+
+class FileTransfer:
+    """
+    Copy of one file in chunks to <destination>.part, renamed to destination once all chunks
+    are copied and the copy matches the SHA-256 of the manifest.
+    The chunks already copied are recorded in <destination>.part.chunks, after the first line
+    identifying the source (size, mtime and hash), so an interrupted copy of the same source
+    resumes with the missing chunks.
+    """
+
+    def __init__(self, source_path, destination_path, sha256, file_size, chunk_size=TRANSFER_CHUNK_SIZE):
+        self.source_path = pathlib.Path(source_path)
+        self.destination_path = pathlib.Path(destination_path)
+        self.sha256 = sha256
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+        self.partial_path = self.destination_path.with_name(self.destination_path.name + ".part")
+        self.chunks_path = self.partial_path.with_name(self.partial_path.name + CHUNKS_SUFFIX)
+        self.__lock = threading.Lock()
+        self.__remaining = set()
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.file_size // self.chunk_size))
+
+    def __get_source_line(self):
+        stat = self.source_path.stat()
+        return "{0} {1} {2}\n".format(stat.st_size, stat.st_mtime_ns, self.sha256)
+
+    def prepare(self):
+        """ returns the indices of the chunks still to copy, starting the copy afresh unless it can be resumed """
+        source_line = self.__get_source_line()
+        done = set()
+        try:
+            with open(self.chunks_path, "r") as f:
+                lines = f.readlines()
+            if lines and lines[0] == source_line and self.partial_path.stat().st_size == self.file_size:
+                done = {int(line) for line in lines[1:] if line.strip().isdigit()}
+        except OSError:
+            pass
+        if not done:
+            self.destination_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.partial_path, "wb") as f:
+                f.truncate(self.file_size)
+            with open(self.chunks_path, "w") as f:
+                f.write(source_line)
+        self.__remaining = set(range(self.chunk_count)) - done
+        return sorted(self.__remaining)
+
+    def copy_chunk(self, index, throttle=None):
+        """ copies one chunk, returns True when it was the last one missing """
+        offset = index * self.chunk_size
+        remaining = min(self.chunk_size, self.file_size - offset)
+        with open(self.source_path, "rb") as src, open(self.partial_path, "r+b") as dst:
+            src.seek(offset)
+            dst.seek(offset)
+            while remaining > 0:
+                data = src.read(min(remaining, manifest.CHUNK_SIZE))
+                if not data:
+                    raise EOFError("{0} is shorter than in the manifest".format(self.source_path))
+                dst.write(data)
+                remaining -= len(data)
+                if throttle:
+                    throttle.consume(len(data))
+            dst.flush()
+            os.fsync(dst.fileno())
+        with self.__lock:
+            with open(self.chunks_path, "a") as f:
+                f.write("{0}\n".format(index))
+            self.__remaining.discard(index)
+            return not self.__remaining
+
+    def finish(self, throttle=None):
+        """ checks the copy against the manifest hash and renames it into place; a bad copy is started afresh next time """
+        if manifest.hash_file(self.partial_path, throttle=throttle) != self.sha256:
+            self.partial_path.unlink()
+            self.chunks_path.unlink()
+            raise IOError("Copy of {0} does not match the manifest".format(self.source_path))
+        shutil.copystat(self.source_path, self.partial_path)
+        self.partial_path.replace(self.destination_path)
+        self.chunks_path.unlink()
+
+
+def is_copy_of(destination_path, source_stat):
+    """ whether destination_path is a finished copy of the source: same size and the mtime copystat gave it """
+    try:
+        stat = os.stat(destination_path)
+    except OSError:
+        return False
+    return stat.st_size == source_stat.st_size and abs(stat.st_mtime - source_stat.st_mtime) < MTIME_TOLERANCE
+
+
+def transfer_directory(source_root, destination_root, hashes_file=None, workers=4, chunk_size=TRANSFER_CHUNK_SIZE,
+                       throttle=None) -> TransferReport:
+    """
+    Copies all files listed in the hashes file (default: the latest one in source_root) from
+    source_root to destination_root, e.g. the upload area or a mirror of New_Data.
+    Files already at the destination with the size and mtime of the source are skipped. The others are
+    copied in chunks by up to workers threads, several chunks of a large file in parallel,
+    each checked against its SHA-256 in the manifest before it is renamed into place.
+    Copies interrupted by an error or a restart resume at the missing chunks.
+    The hashes file itself is copied last, once all files it lists have arrived.
+    """
+    source_root = pathlib.Path(source_root)
+    destination_root = pathlib.Path(destination_root)
+    hashes_file = pathlib.Path(hashes_file) if hashes_file else manifest.find_latest_hashes_file(source_root)
+    report = TransferReport()
+    if hashes_file is None:
+        logging.info("- No hashes file in %s, nothing to transfer", source_root)
+        report.failed.append(str(source_root))
+        return report
+    logging.info("- Transferring %s to %s", source_root, destination_root)
+
+    transfers = list()
+    for key, (sha256, file_size) in manifest.read_hashes_file(hashes_file).items():
+        source_path = source_root / key
+        destination_path = destination_root / key
+        try:
+            source_stat = source_path.stat()
+            if source_stat.st_size != file_size:
+                logging.info("- %s changed since %s", key, hashes_file.name)
+                report.failed.append(key)
+                continue
+        except OSError:
+            logging.info("- %s is missing", key)
+            report.failed.append(key)
+            continue
+        if is_copy_of(destination_path, source_stat):
+            report.skipped.append(key)
+            continue
+        transfers.append((key, FileTransfer(source_path, destination_path, sha256, file_size, chunk_size)))
+
+    def copy_chunk(file_transfer: FileTransfer, index):
+        if file_transfer.copy_chunk(index, throttle):
+            file_transfer.finish(throttle)
+            return True
+        return False
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = dict()
+        for key, file_transfer in transfers:
+            try:
+                indices = file_transfer.prepare()
+                if not indices:
+                    # all chunks were copied before, but the copy was not checked yet
+                    futures[executor.submit(file_transfer.finish, throttle)] = (key, file_transfer)
+                for index in indices:
+                    futures[executor.submit(copy_chunk, file_transfer, index)] = (key, file_transfer)
+            except OSError as e:
+                logging.info("- Could not start copy of %s: %s", key, e)
+                report.failed.append(key)
+        for future in concurrent.futures.as_completed(futures):
+            key, file_transfer = futures[future]
+            try:
+                if future.result() is not False:
+                    report.copied.append(key)
+                    report.copied_bytes += file_transfer.file_size
+            except Exception as e:
+                if key not in report.failed:
+                    logging.info("- Copy of %s failed: %s", key, e)
+                    report.failed.append(key)
+
+    if report.ok:
+        shutil.copy2(hashes_file, destination_root / hashes_file.name)
+    report.failed.sort()
+    return report
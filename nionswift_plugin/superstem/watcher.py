@@ -0,0 +1,209 @@
+# standard libraries
+import logging
+import os
+import pathlib
+import threading
+import time
+
+# local libraries
+from . import manifest
+
+
+class ManifestWatcher:
+    """
+    Keeps the running manifests of New_Data current while the session runs, so the hashes
+    file can be written at any time without reading any data again (manifest.write_hashes_file
+    takes the hashes from the running manifests).
+    Every new or changed file is hashed once it is stable, i.e. its size and mtime are unchanged
+    for stable_seconds, and added to the running manifest of its directory.
+    Changes are picked up from OS change notifications if the optional watchdog package is
+    installed, else by polling root_dir every poll_interval seconds: a poll only stats the
+    directories and lists those whose mtime changed, i.e. where files were added, renamed or
+    deleted (exports and copies are renamed into place).
+    """
+
+    def __init__(self, root_dir, stable_seconds=30, poll_interval=60, throttle=None):
+        self.root_path = pathlib.Path(root_dir)
+        self.stable_seconds = stable_seconds
+        self.poll_interval = poll_interval
+        self.throttle = throttle
+        # file path -> (size, mtime_ns) of files waiting to become stable
+        self.__pending = dict()
+        # running manifests read so far, by directory
+        self.__export_manifests = dict()
+        # directory -> (mtime_ns, subdirectories) at the last poll
+        self.__directories = dict()
+        # paths reported by change notifications since the last check
+        self.__changed_paths = set()
+        self.__changed_paths_lock = threading.Lock()
+        self.__observer = None
+        self.__stop_event = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    @property
+    def pending_count(self):
+        return len(self.__pending)
+
+    def start(self):
+        try:
+            from watchdog.observers import Observer
+            self.__observer = Observer()
+            self.__observer.schedule(self, str(self.root_path), recursive=True)
+            self.__observer.start()
+            logging.info("- Watching %s for changes", self.root_path)
+        except (ImportError, OSError) as e:
+            self.__observer = None
+            logging.info("- Polling %s for changes every %d s (%s)", self.root_path, self.poll_interval, e)
+        self.__thread.start()
+
+    def stop(self):
+        """ stops after the file being hashed, without waiting for it """
+        self.__stop_event.set()
+        if self.__observer is not None:
+            self.__observer.stop()
+
+    def dispatch(self, event):
+        """ called by the watchdog observer for every change below root_dir """
+        with self.__changed_paths_lock:
+            self.__changed_paths.add(event.src_path)
+            if getattr(event, "dest_path", None):
+                self.__changed_paths.add(event.dest_path)
+
+    def write_hashes_file(self, instrument="sstem3", workers=1):
+        """ writes the hashes file of root_dir, only files not hashed yet are read """
+        return manifest.write_hashes_file(self.root_path, instrument, workers, self.throttle)
+
+    def is_watched(self, file_path: pathlib.Path):
+        try:
+            relative_path = file_path.relative_to(self.root_path)
+        except ValueError:
+            return False
+        if manifest.is_skipped(relative_path):
+            return False
+        # hashes files in root_dir are not listed in the hashes files
+        return not (len(relative_path.parts) == 1 and file_path.name.startswith(manifest.HASHES_FILE_PREFIX))
+
+    def check_file(self, file_path: pathlib.Path):
+        """ queues the file for hashing unless its running manifest has it already """
+        if file_path.name == manifest.EXPORT_MANIFEST_NAME:
+            # written to by exports as well, read again when needed
+            self.__export_manifests.pop(file_path.parent, None)
+            return
+        if not self.is_watched(file_path):
+            return
+        try:
+            stat = file_path.stat()
+        except OSError:
+            self.__pending.pop(file_path, None)
+            return
+        if not file_path.is_file() or manifest.get_export_manifest_hash(file_path, stat, self.__export_manifests):
+            self.__pending.pop(file_path, None)
+        else:
+            self.__pending[file_path] = (stat.st_size, stat.st_mtime_ns)
+
+    def scan(self, directory=None):
+        """ checks all files below directory (default root_dir) """
+        for dir_path, dir_names, file_names in os.walk(directory or self.root_path):
+            dir_names[:] = [dir_name for dir_name in dir_names if manifest.SKIP_MARKER not in dir_name]
+            for file_name in file_names:
+                self.check_file(pathlib.Path(dir_path) / file_name)
+
+    def poll(self):
+        """
+        Checks the files of the directories below root_dir that are new or whose mtime changed
+        since the last poll; unchanged directories are not listed again. Returns their number.
+        """
+        directories = dict()
+        changed_count = 0
+        stack = [self.root_path]
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            known = self.__directories.get(directory)
+            if known and known[0] == mtime_ns:
+                subdirectories = known[1]
+            else:
+                # its running manifest may have been replaced as well
+                self.__export_manifests.pop(directory, None)
+                subdirectories = list()
+                file_paths = set()
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            if entry.is_dir(follow_symlinks=False):
+                                if manifest.SKIP_MARKER not in entry.name:
+                                    subdirectories.append(pathlib.Path(entry.path))
+                            else:
+                                file_paths.add(pathlib.Path(entry.path))
+                except OSError:
+                    continue
+                for file_path in sorted(file_paths):
+                    self.check_file(file_path)
+                # files deleted or renamed since they were queued
+                for file_path in [file_path for file_path in self.__pending
+                                  if file_path.parent == directory and file_path not in file_paths]:
+                    self.__pending.pop(file_path, None)
+                changed_count += 1
+            directories[directory] = (mtime_ns, subdirectories)
+            stack.extend(subdirectories)
+        self.__directories = directories
+        return changed_count
+
+    def hash_stable_files(self):
+        """ hashes the pending files which did not change for stable_seconds, returns their number """
+        hashed_count = 0
+        now = time.time()
+        for file_path, signature in list(self.__pending.items()):
+            if self.__stop_event.is_set():
+                break
+            if now - signature[1] / 1e9 < self.stable_seconds:
+                continue
+            try:
+                stat = file_path.stat()
+                if (stat.st_size, stat.st_mtime_ns) != signature:
+                    self.__pending[file_path] = (stat.st_size, stat.st_mtime_ns)
+                    continue
+                sha256 = manifest.hash_file(file_path, throttle=self.throttle)
+                if file_path.stat().st_mtime_ns != stat.st_mtime_ns:
+                    continue
+                manifest.add_export_manifest_entry(file_path, sha256, stat)
+                self.__export_manifests.setdefault(file_path.parent, dict())[file_path.name] = \
+                    (sha256, stat.st_size, stat.st_mtime_ns)
+                hashed_count += 1
+            except OSError as e:
+                logging.info("- Could not hash %s: %s", file_path, e)
+            self.__pending.pop(file_path, None)
+        return hashed_count
+
+    def __run(self):
+        try:
+            if self.__observer is None:
+                self.poll()
+            else:
+                self.scan()
+        except Exception as e:
+            logging.info("- Exception ManifestWatcher %s", e)
+        last_scan = time.monotonic()
+        while not self.__stop_event.wait(min(self.poll_interval, max(1.0, self.stable_seconds / 2))):
+            try:
+                if self.__observer is None:
+                    if time.monotonic() - last_scan >= self.poll_interval:
+                        self.poll()
+                        last_scan = time.monotonic()
+                else:
+                    with self.__changed_paths_lock:
+                        changed_paths, self.__changed_paths = self.__changed_paths, set()
+                    for changed_path in sorted(changed_paths):
+                        changed_path = pathlib.Path(changed_path)
+                        if changed_path.is_dir():
+                            self.scan(changed_path)
+                        else:
+                            self.check_file(changed_path)
+                hashed_count = self.hash_stable_files()
+                if hashed_count:
+                    logging.info("- Hashed %d new files in %s", hashed_count, self.root_path)
+            except Exception as e:
+                logging.info("- Exception ManifestWatcher %s", e)
@@ -0,0 +1,47 @@
+# standard libraries
+import io
+import json
+import uuid as uuid_module
+import zipfile
+
+# third party libraries
+import numpy
+import pytest
+
+
+def write_ndata(file_path, uuid, title, data, session_metadata=None):
+    """ writes a Swift .ndata data item file: a zip with metadata.json and data.npy """
+    properties = {"uuid": uuid, "title": title, "created": "2024-03-12T10:00:00.000000",
+                  "session_metadata": session_metadata or dict()}
+    buffer = io.BytesIO()
+    numpy.save(buffer, data)
+    with zipfile.ZipFile(file_path, "w") as zf:
+        zf.writestr("metadata.json", json.dumps(properties))
+        zf.writestr("data.npy", buffer.getvalue())
+
+
+@pytest.fixture
+def make_project(tmp_path):
+    """
+    returns a function that creates a Swift project library folder <data dir>/<name>_Raw with
+    <name>.nsproj and a few .ndata data items, one of them random (incompressible) data
+    """
+    def make(name="2024_03_12_ABC_S1234_area", data_dir=None, item_count=3, shape=(64, 64)):
+        project_dir = (data_dir or tmp_path / "data") / (name + "_Raw")
+        items_dir = project_dir / "Nion Swift Data 13"
+        items_dir.mkdir(parents=True)
+        rng = numpy.random.default_rng(0)
+        data_items = list()
+        for i in range(item_count):
+            uuid = str(uuid_module.UUID(int=i + 1))
+            title = "{0:03d}_HAADF_16nm_item{0}".format(i + 1)
+            data = rng.random(shape, numpy.float32) if i == 0 else numpy.full(shape, i, numpy.float32)
+            write_ndata(items_dir / "data_{0}.ndata".format(uuid.replace("-", "")), uuid, title, data,
+                        {"microscopist": "ABC", "sample": "1234"})
+            data_items.append({"uuid": uuid, "title": title, "created": "2024-03-12T10:00:00.000000"})
+        with open(project_dir / (name + ".nsproj"), "w") as f:
+            json.dump({"type": "project", "version": 3, "data_items": data_items,
+                       "session_metadata": {"microscopist": "ABC", "sample": "1234", "sample_area": "area"}}, f)
+        return project_dir
+
+    return make
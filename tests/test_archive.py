@@ -0,0 +1,82 @@
+# standard libraries
+import pathlib
+import zipfile
+
+# local libraries
+from nionswift_plugin.superstem import archive
+from nionswift_plugin.superstem import manifest
+
+
+def test_project_string_may_be_nsproj_or_folder_with_either_separator():
+    assert archive.get_project_dir_and_name("F:\\Libs\\2024_ABC_Raw\\2024_ABC.nsproj") == (pathlib.Path("F:/Libs/2024_ABC_Raw"), "2024_ABC")
+    assert archive.get_project_dir_and_name("F:/Libs/2024_ABC_Raw") == (pathlib.Path("F:/Libs/2024_ABC_Raw"), "2024_ABC")
+    assert archive.get_project_dir_and_name("F:/Libs/2024_ABC_Raw/ ") == (pathlib.Path("F:/Libs/2024_ABC_Raw"), "2024_ABC")
+
+
+def test_compress_directory_keeps_folder_name_and_content(make_project, tmp_path):
+    project_dir = make_project()
+    archive_path = tmp_path / "project.zip"
+    archive.compress_directory(project_dir, archive_path, zipfile.ZIP_DEFLATED)
+    assert not archive_path.with_name(archive_path.name + ".part").exists()
+    with zipfile.ZipFile(archive_path) as zf:
+        for file_path in project_dir.rglob("*"):
+            if file_path.is_file():
+                zinfo = zf.getinfo(file_path.relative_to(project_dir.parent).as_posix())
+                assert zf.read(zinfo) == file_path.read_bytes()
+                assert archive.get_member_sha256(zinfo) == manifest.hash_file(file_path)
+    assert archive.verify_archive(archive_path)
+
+
+def test_verify_archive_detects_corruption(make_project, tmp_path):
+    archive_path = tmp_path / "project.zip"
+    archive.compress_directory(make_project(), archive_path, zipfile.ZIP_STORED)
+    with zipfile.ZipFile(archive_path) as zf:
+        zinfo = max(zf.infolist(), key=lambda zinfo: zinfo.file_size)
+    data = bytearray(archive_path.read_bytes())
+    data[zinfo.header_offset + 30 + len(zinfo.filename) + len(zinfo.extra) + 100] ^= 0xFF
+    archive_path.write_bytes(bytes(data))
+    assert not archive.verify_archive(archive_path)
+
+
+def test_archive_job_compresses_verifies_and_hashes(make_project, tmp_path):
+    project_dir = make_project()
+    export_base_dir = tmp_path / "New_Data"
+    (export_base_dir / "2024_03_12_ABC_S1234_area").mkdir(parents=True)
+    (export_base_dir / "2024_03_12_ABC_S1234_area" / "001_HAADF_16nm_test.dm3").write_bytes(b"dm3")
+    job = archive.ArchiveJob.from_project_string(str(project_dir / "2024_03_12_ABC_S1234_area.nsproj"),
+                                                 export_base_dir, "sstem9", workers=2)
+    assert job.run() == 0
+    assert job.archive_path == export_base_dir / "2024_03_12_ABC_S1234_area" / "2024_03_12_ABC_S1234_area_Raw.zip"
+    assert archive.verify_archive(job.archive_path)
+    hashes_file = manifest.find_latest_hashes_file(export_base_dir)
+    assert hashes_file.name.startswith("hashes_sstem9_")
+    entries = manifest.read_hashes_file(hashes_file)
+    archive_key = "2024_03_12_ABC_S1234_area/2024_03_12_ABC_S1234_area_Raw.zip"
+    assert entries[archive_key] == (manifest.hash_file(job.archive_path), job.archive_path.stat().st_size)
+    assert "2024_03_12_ABC_S1234_area/001_HAADF_16nm_test.dm3" in entries
+
+
+def test_archive_job_fails_without_project(tmp_path):
+    job = archive.ArchiveJob(tmp_path / "missing_Raw", "missing", tmp_path / "New_Data")
+    assert job.run() == 1
+
+
+def test_get_shards_balances_sizes():
+    shards = archive.get_shards([("a", 100), ("b", 60), ("c", 50), ("d", 10)], 2)
+    assert sorted(shards) == [["a", "d"], ["b", "c"]]
+    assert archive.get_shards([("a", 1)], 4) == [["a"]]
+
+
+def test_parallel_archive_matches_serial_archive(make_project, tmp_path):
+    project_dir = make_project(item_count=6)
+    serial_path = tmp_path / "serial.zip"
+    parallel_path = tmp_path / "parallel.zip"
+    archive.compress_directory(project_dir, serial_path, zipfile.ZIP_DEFLATED)
+    archive.compress_directory_parallel(project_dir, parallel_path, zipfile.ZIP_DEFLATED, workers=3)
+    assert not parallel_path.with_name(parallel_path.name + ".shards").exists()
+    assert archive.verify_archive(parallel_path, workers=2)
+    with zipfile.ZipFile(serial_path) as serial_zf, zipfile.ZipFile(parallel_path) as parallel_zf:
+        assert parallel_zf.namelist() == serial_zf.namelist()
+        for zinfo in serial_zf.infolist():
+            assert parallel_zf.read(zinfo.filename) == serial_zf.read(zinfo)
+            assert archive.get_member_sha256(parallel_zf.getinfo(zinfo.filename)) == archive.get_member_sha256(zinfo)
@@ -0,0 +1,74 @@
+# standard libraries
+import json
+import zipfile
+
+# third party libraries
+import pytest
+
+# local libraries
+from nionswift_plugin.superstem import archive
+from nionswift_plugin.superstem import archive_index
+
+
+UUID = "00000000-0000-0000-0000-000000000001"
+
+
+def make_archive(make_project, tmp_path, compression):
+    project_dir = make_project()
+    # the project file holds the newer title
+    nsproj_path = next(project_dir.glob("*.nsproj"))
+    project_properties = json.loads(nsproj_path.read_text())
+    project_properties["data_items"][0]["title"] = "001_HAADF_16nm_renamed"
+    nsproj_path.write_text(json.dumps(project_properties))
+    archive_path = tmp_path / (project_dir.name + ".zip")
+    archive.compress_directory(project_dir, archive_path, compression)
+    return project_dir, archive_path
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_LZMA])
+def test_restore_member_from_index(make_project, tmp_path, compression):
+    project_dir, archive_path = make_archive(make_project, tmp_path, compression)
+    index_path = archive_index.write_index(archive_path, project_dir)
+    assert index_path == archive_path.with_name(archive_path.name + ".index.json")
+    index = archive_index.read_index(archive_path)
+    entries = archive_index.find_members(index, uuid=UUID.upper())
+    assert len(entries) == 1
+    assert entries[0]["title"] == "001_HAADF_16nm_renamed"
+    assert archive_index.find_members(index, title="001_HAADF_16nm_renamed") == entries
+    assert archive_index.find_members(index, member_name="Nion Swift Data 13\\" + entries[0]["name"].split("/")[-1]) == entries
+    output_path = archive_index.restore_member(archive_path, entries[0], tmp_path / "restored.ndata")
+    source_path = project_dir.parent / entries[0]["name"]
+    assert output_path.read_bytes() == source_path.read_bytes()
+
+
+def test_index_without_project_folder_reads_the_archive(make_project, tmp_path):
+    project_dir, archive_path = make_archive(make_project, tmp_path, zipfile.ZIP_DEFLATED)
+    archive_index.write_index(archive_path)
+    index = archive_index.read_index(archive_path)
+    assert archive_index.find_members(index, uuid=UUID)[0]["title"] == "001_HAADF_16nm_renamed"
+    assert all(entry["sha256"] for entry in index["members"])
+
+
+def test_stale_index_is_rejected(make_project, tmp_path):
+    project_dir, archive_path = make_archive(make_project, tmp_path, zipfile.ZIP_STORED)
+    archive_index.write_index(archive_path, project_dir)
+    with zipfile.ZipFile(archive_path, "a") as zf:
+        zf.writestr("added.txt", "added")
+    with pytest.raises(ValueError):
+        archive_index.read_index(archive_path)
+
+
+def test_corrupt_member_is_not_restored(make_project, tmp_path):
+    project_dir, archive_path = make_archive(make_project, tmp_path, zipfile.ZIP_STORED)
+    archive_index.write_index(archive_path, project_dir)
+    entry = archive_index.find_members(archive_index.read_index(archive_path), uuid=UUID)[0]
+    data = bytearray(archive_path.read_bytes())
+    data[entry["data_offset"] + 100] ^= 0xFF
+    archive_path.write_bytes(bytes(data))
+    with pytest.raises(zipfile.BadZipFile):
+        archive_index.verify_member(archive_path, entry)
+    output_path = tmp_path / "restored.ndata"
+    with pytest.raises(zipfile.BadZipFile):
+        archive_index.restore_member(archive_path, entry, output_path)
+    assert not output_path.exists()
+    assert not output_path.with_name(output_path.name + ".part").exists()
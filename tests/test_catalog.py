@@ -0,0 +1,51 @@
+# local libraries
+from nionswift_plugin.superstem import catalog
+
+
+def test_parse_title_and_session_name():
+    assert catalog.parse_title("012_HAADF_sub_16.5nm_grain boundary") == {"no": 12, "detector": "HAADF", "sub": "sub",
+                                                                           "fov_nm": 16.5, "descr": "grain boundary"}
+    assert catalog.parse_title("012_MAADF_32nm_") == {"no": 12, "detector": "MAADF", "sub": None, "fov_nm": 32.0, "descr": ""}
+    assert catalog.parse_title("untitled")["no"] is None
+    assert catalog.parse_session_name("2024_03_12_ABC_S1234_area 2") == {"date": "2024_03_12", "microscopist": "ABC",
+                                                                         "sample": "1234", "sample_area": "area"}
+    assert catalog.parse_session_name("Default") == dict()
+
+
+def make_catalog_dirs(make_project, tmp_path):
+    data_dir = tmp_path / "data"
+    make_project(data_dir=data_dir)
+    export_dir = tmp_path / "export" / "2024_03_12_ABC_S1234_area"
+    export_dir.mkdir(parents=True)
+    (export_dir / "007_MAADF_32nm_overview.dm4").write_bytes(b"dm4")
+    (export_dir / "007_MAADF_32nm_overview.png").write_bytes(b"png")
+    return data_dir, tmp_path / "export"
+
+
+def test_update_and_search(make_project, tmp_path):
+    data_dir, export_dir = make_catalog_dirs(make_project, tmp_path)
+    with catalog.Catalog(tmp_path / "catalog.sqlite") as sstem_catalog:
+        assert sstem_catalog.update(data_dir, export_dir) == 5
+        items = sstem_catalog.search(detector="haadf")
+        assert len(items) == 3
+        assert items[0]["title"] == "001_HAADF_16nm_item1"
+        assert items[0]["shape"] == "64x64"
+        assert items[0]["dtype"] == "float32"
+        assert items[0]["session"] == "2024_03_12_ABC_S1234_area"
+        assert items[0]["sample_area"] == "area"
+        exports = sstem_catalog.search(kind="export")
+        assert [item["title"] for item in exports] == ["007_MAADF_32nm_overview"]
+        assert sstem_catalog.search(sample="1234", microscopist="abc", title="item2")[0]["no"] == 2
+        assert sstem_catalog.search(sample="9999") == list()
+
+
+def test_update_reads_only_changed_files(make_project, tmp_path):
+    data_dir, export_dir = make_catalog_dirs(make_project, tmp_path)
+    with catalog.Catalog(tmp_path / "catalog.sqlite") as sstem_catalog:
+        sstem_catalog.update(data_dir, export_dir)
+        assert sstem_catalog.update(data_dir, export_dir) == 0
+        export_path = export_dir / "2024_03_12_ABC_S1234_area" / "007_MAADF_32nm_overview.dm4"
+        export_path.unlink()
+        assert sstem_catalog.update(data_dir, export_dir) == 0
+        assert sstem_catalog.search(kind="export") == list()
+        assert len(sstem_catalog.search()) == 3
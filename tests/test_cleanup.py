@@ -0,0 +1,88 @@
+# standard libraries
+import os
+import time
+import zipfile
+
+# local libraries
+from nionswift_plugin.superstem import archive
+from nionswift_plugin.superstem import cleanup
+
+
+def make_archived_project(make_project, tmp_path, recorded_hashes=True):
+    """ a project in tmp_path/data, archived to tmp_path/export/<name>/<name>_Raw.zip and a day old """
+    project_dir = make_project()
+    project_name = project_dir.name[:-len(archive.RAW_SUFFIX)]
+    archive_path = tmp_path / "export" / project_name / (project_name + archive.ARCHIVE_SUFFIX)
+    archive_path.parent.mkdir(parents=True)
+    day_ago = time.time() - 24 * 3600
+    for file_path in project_dir.rglob("*"):
+        os.utime(file_path, (day_ago, day_ago))
+    if recorded_hashes:
+        archive.compress_directory(project_dir, archive_path, zipfile.ZIP_DEFLATED)
+    else:
+        # as archived by 7-Zip, before the hashes were recorded
+        with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for file_path in sorted(project_dir.rglob("*")):
+                zf.write(file_path, file_path.relative_to(project_dir.parent).as_posix())
+    return project_dir, archive_path
+
+
+def get_candidate(tmp_path):
+    candidates = cleanup.find_candidates(tmp_path / "data", tmp_path / "export", min_age_days=0.5)
+    assert len(candidates) == 1
+    return candidates[0]
+
+
+def test_archived_project_is_deleted(make_project, tmp_path):
+    project_dir, archive_path = make_archived_project(make_project, tmp_path)
+    assert cleanup.verify_candidate(get_candidate(tmp_path)) is None
+    report = cleanup.cleanup_projects(tmp_path / "data", tmp_path / "export", 2**62, dry_run=True, min_age_days=0.5)
+    assert [project_name for project_name, size in report.deleted] == ["2024_03_12_ABC_S1234_area"]
+    assert project_dir.is_dir()
+    report = cleanup.cleanup_projects(tmp_path / "data", tmp_path / "export", 2**62, dry_run=False, min_age_days=0.5)
+    assert report.ok and len(report.deleted) == 1
+    assert not project_dir.exists()
+    assert archive_path.is_file()
+
+
+def test_recent_and_excluded_projects_are_no_candidates(make_project, tmp_path):
+    project_dir, archive_path = make_archived_project(make_project, tmp_path)
+    assert cleanup.find_candidates(tmp_path / "data", tmp_path / "export", min_age_days=2) == list()
+    assert cleanup.find_candidates(tmp_path / "data", tmp_path / "export", exclude=[str(project_dir)],
+                                   min_age_days=0.5) == list()
+
+
+def test_archive_without_recorded_hashes_is_checked_against_the_project(make_project, tmp_path):
+    project_dir, archive_path = make_archived_project(make_project, tmp_path, recorded_hashes=False)
+    assert cleanup.verify_candidate(get_candidate(tmp_path)) is None
+    # changed in place, with the size and mtime it had when it was archived
+    file_path = next(project_dir.rglob("*.ndata"))
+    stat = file_path.stat()
+    data = bytearray(file_path.read_bytes())
+    data[-100] ^= 0xFF
+    file_path.write_bytes(bytes(data))
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cleanup.verify_candidate(get_candidate(tmp_path)).endswith("differs from the archive")
+
+
+def test_archive_member_without_recorded_hash_or_source_is_not_trusted(make_project, tmp_path):
+    project_dir, archive_path = make_archived_project(make_project, tmp_path, recorded_hashes=False)
+    # deleted from the project after it was archived
+    next(project_dir.rglob("*.ndata")).unlink()
+    assert cleanup.verify_candidate(get_candidate(tmp_path)).startswith("no hash recorded for")
+    report = cleanup.cleanup_projects(tmp_path / "data", tmp_path / "export", 2**62, dry_run=False, min_age_days=0.5)
+    assert report.deleted == list()
+    assert project_dir.is_dir()
+
+
+def test_changed_project_or_corrupt_archive_is_kept(make_project, tmp_path):
+    project_dir, archive_path = make_archived_project(make_project, tmp_path)
+    (project_dir / "new.txt").write_text("added after archiving")
+    assert cleanup.verify_candidate(get_candidate(tmp_path)) == "new.txt is not in the archive"
+    (project_dir / "new.txt").unlink()
+    with zipfile.ZipFile(archive_path) as zf:
+        zinfo = max(zf.infolist(), key=lambda zinfo: zinfo.file_size)
+    data = bytearray(archive_path.read_bytes())
+    data[zinfo.header_offset + 30 + len(zinfo.filename) + len(zinfo.extra) + 100] ^= 0xFF
+    archive_path.write_bytes(bytes(data))
+    assert cleanup.verify_candidate(get_candidate(tmp_path)).startswith("archive check failed")
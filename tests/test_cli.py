@@ -0,0 +1,47 @@
+# standard libraries
+import subprocess
+import sys
+
+# local libraries
+from nionswift_plugin.superstem import cli
+from nionswift_plugin.superstem import manifest
+from nionswift_plugin.superstem import throttle
+
+
+def test_cli_does_not_load_the_swift_panel():
+    code = "import sys; import nionswift_plugin.superstem.cli; print('nion.ui' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+    assert "Loaded SuperSTEM Panel" not in result.stderr
+
+
+def test_exit_codes(tmp_path):
+    assert cli.main([]) == cli.EXIT_USAGE
+    assert cli.main(["hashes"]) == cli.EXIT_USAGE
+    assert cli.main(["hashes", str(tmp_path / "missing")]) == cli.EXIT_NOT_FOUND
+    assert cli.main(["--config", str(tmp_path / "missing.json"), "hashes"]) == cli.EXIT_USAGE
+
+
+def test_compress_takes_directories_from_config(make_project, tmp_path):
+    project_dir = make_project()
+    config_file = tmp_path / "superstem_customisation.json"
+    config_file.write_text('{{"export_base_directory": "{0}", "superstem_instrument": "sstem9"}}'.format(
+        (tmp_path / "New_Data").as_posix()))
+    assert cli.main(["-q", "--config", str(config_file), "compress", str(project_dir), "--compression", "deflate"]) == cli.EXIT_OK
+    assert (tmp_path / "New_Data" / "2024_03_12_ABC_S1234_area" / "2024_03_12_ABC_S1234_area_Raw.zip").is_file()
+    assert manifest.find_latest_hashes_file(tmp_path / "New_Data").name.startswith("hashes_sstem9_")
+    # without incremental_archiving the staging directory is not used
+    config_file.write_text('{{"export_base_directory": "{0}", "archive_staging_directory": "{1}"}}'.format(
+        (tmp_path / "New_Data").as_posix(), (tmp_path / "staging").as_posix()))
+    assert cli.main(["-q", "--config", str(config_file), "compress", str(project_dir), "--compression", "deflate"]) == cli.EXIT_OK
+    assert not (tmp_path / "staging").exists()
+    assert cli.main(["-q", "compress", str(tmp_path / "missing_Raw"), "--export-base-dir", str(tmp_path)]) == cli.EXIT_NOT_FOUND
+
+
+def test_throttle_limits_the_rate(monkeypatch):
+    sleeps = list()
+    monkeypatch.setattr(throttle.time, "sleep", sleeps.append)
+    job_throttle = throttle.Throttle.from_megabytes(1)
+    job_throttle.consume(2 * 1024 * 1024)
+    assert sleeps and 1.5 < sleeps[0] <= 2
+    assert throttle.Throttle.from_megabytes(0).max_bytes_per_second is None
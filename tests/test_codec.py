@@ -0,0 +1,77 @@
+# standard libraries
+import pickle
+import zipfile
+
+# third party libraries
+import numpy
+import pytest
+
+# local libraries
+from nionswift_plugin.superstem import archive
+from nionswift_plugin.superstem import codec
+
+
+def write_test_files(directory):
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / "small.txt").write_text("small")
+    (directory / "random.bin").write_bytes(numpy.random.default_rng(0).bytes(512 * 1024))
+    (directory / "zeros.bin").write_bytes(bytes(512 * 1024))
+    (directory / "image.png").write_bytes(bytes(512 * 1024))
+    return directory
+
+
+def test_policy_chooses_compression_per_file(tmp_path):
+    directory = write_test_files(tmp_path / "files")
+    policy = codec.CompressionPolicy()
+    assert policy.choose(directory / "small.txt") == zipfile.ZIP_DEFLATED
+    assert policy.choose(directory / "random.bin") == zipfile.ZIP_STORED
+    assert policy.choose(directory / "image.png") == zipfile.ZIP_STORED
+    assert policy.choose(directory / "zeros.bin") in (zipfile.ZIP_DEFLATED, zipfile.ZIP_LZMA)
+
+
+def test_policy_without_time_budget_left_deflates(tmp_path):
+    directory = write_test_files(tmp_path / "files")
+    assert codec.CompressionPolicy(time_budget=0).choose(directory / "zeros.bin") == zipfile.ZIP_DEFLATED
+
+
+def test_get_compression():
+    assert isinstance(codec.get_compression("adaptive", 60), codec.CompressionPolicy)
+    assert codec.get_compression("adaptive", 60).time_budget == 60
+    assert codec.get_compression("lzma") == zipfile.ZIP_LZMA
+    assert codec.get_compress_type(zipfile.ZIP_STORED, "any.bin") == zipfile.ZIP_STORED
+
+
+def test_split_shares_the_time_budget_left():
+    policy = codec.CompressionPolicy(time_budget=60)
+    policies = policy.split([300, 100, 0])
+    assert [shard_policy.time_budget for shard_policy in policies] == [45, 15, 0]
+    assert all(shard_policy.projected_seconds == 0 for shard_policy in policies)
+    # the copies are sent to worker processes
+    assert pickle.loads(pickle.dumps(policies[0])).time_budget == 45
+    assert [shard_policy.time_budget for shard_policy in codec.CompressionPolicy().split([1, 2])] == [None, None]
+
+
+def test_parallel_archive_in_processes_splits_the_time_budget(tmp_path, monkeypatch):
+    folder_path = write_test_files(tmp_path / "files")
+    policy = codec.CompressionPolicy(time_budget=8)
+    split_policies = list()
+    split = codec.CompressionPolicy.split
+
+    def recording_split(self, shares):
+        split_policies.extend(split(self, shares))
+        return split_policies
+
+    monkeypatch.setattr(codec.CompressionPolicy, "split", recording_split)
+    archive_path = tmp_path / "files.zip"
+    archive.compress_directory_parallel(folder_path, archive_path, policy, workers=2, processes=True)
+    assert archive.verify_archive(archive_path)
+    assert sum(shard_policy.time_budget for shard_policy in split_policies) == pytest.approx(8)
+
+
+def test_compression_report(tmp_path):
+    archive_path = tmp_path / "files.zip"
+    archive.compress_directory(write_test_files(tmp_path / "files"), archive_path, codec.CompressionPolicy())
+    report_path = codec.write_compression_report(archive_path)
+    lines = report_path.read_text().splitlines()
+    assert lines[0] == "member,compression,file_size,compress_size,ratio"
+    assert any(line.startswith("files/random.bin,store,") for line in lines)
@@ -0,0 +1,82 @@
+# standard libraries
+import cProfile
+import datetime
+import logging
+import pathlib
+import pstats
+import subprocess
+import sys
+import time
+
+# third party libraries
+import pytest
+
+# local libraries
+from nionswift_plugin.superstem import diagnostics
+
+
+def test_phase_timer_logs_phases_in_one_line(caplog):
+    timer = diagnostics.PhaseTimer("SuperSTEM startup")
+    timer.add("import", 0.004)
+    time.sleep(0.01)
+    timer.mark("top sections")
+    time.sleep(0.05)
+    # e.g. waiting for the UI thread, not part of the startup
+    timer.skip()
+    timer.mark("lower sections")
+    assert [phase for phase, seconds in timer.phases] == ["import", "top sections", "lower sections"]
+    assert timer.phases[1][1] >= 0.01
+    assert timer.phases[2][1] < 0.05
+    assert timer.total == sum(seconds for phase, seconds in timer.phases)
+    with caplog.at_level(logging.INFO):
+        timer.log()
+    assert caplog.messages[-1].startswith("- SuperSTEM startup: import 4 ms, top sections ")
+    assert ", lower sections " in caplog.messages[-1] and ", total " in caplog.messages[-1]
+
+
+def allocate_blocks():
+    return [bytearray(1024) for i in range(100)]
+
+
+def test_profile_paths():
+    prof_path, text_path = diagnostics.get_profile_paths("D:/profiles", "Export SI-EELS", datetime.datetime(2026, 10, 19, 14, 35, 12, 127000))
+    assert prof_path == pathlib.Path("D:/profiles/20261019-143512-127_Export_SI-EELS.prof")
+    assert text_path.name == "20261019-143512-127_Export_SI-EELS.txt"
+
+
+def test_profile_writes_stats_and_summary(tmp_path, caplog):
+    with caplog.at_level(logging.INFO):
+        with diagnostics.profile("export", tmp_path, top_n=5):
+            blocks = allocate_blocks()
+    prof_path = next(tmp_path.glob("*_export.prof"))
+    assert any(function == "allocate_blocks" for file_name, line, function in pstats.Stats(str(prof_path)).stats)
+    summary = prof_path.with_suffix(".txt").read_text()
+    assert summary.startswith("export: ") and "Allocated during export, by line:" in summary
+    assert any(message.startswith("- Profile export: ") for message in caplog.messages)
+    assert len(blocks) == 100
+
+
+def test_nested_profile_runs_unprofiled(tmp_path):
+    with diagnostics.profile("outer", tmp_path):
+        with diagnostics.profile("inner", tmp_path):
+            allocate_blocks()
+    assert [path.name.split("_", 1)[1] for path in sorted(tmp_path.glob("*.prof"))] == ["outer.prof"]
+
+
+def test_top_functions():
+    profiler = cProfile.Profile()
+    profiler.runcall(allocate_blocks)
+    top_functions = diagnostics.get_top_functions(profiler, top_n=2)
+    assert len(top_functions) == 2
+    assert top_functions[0][3].endswith("(allocate_blocks)")
+
+
+def test_panel_module_only_imports_the_light_modules():
+    pytest.importorskip("nion.ui")
+    code = ("import sys; import nionswift_plugin.superstem.SuperSTEM; "
+            "print(*sorted(name for name in sys.modules if name.startswith('nionswift_plugin.superstem.')), "
+            "'tracemalloc' in sys.modules)")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    # archive, export, staging, ... (numpy, threads) are imported by the handlers that use them
+    assert result.stdout.split() == ["nionswift_plugin.superstem." + name
+                                     for name in ("SuperSTEM", "diagnostics", "persistent", "session", "shard")] + ["False"]
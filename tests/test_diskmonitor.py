@@ -0,0 +1,65 @@
+# standard libraries
+import collections
+import threading
+
+# local libraries
+from nionswift_plugin.superstem import diskmonitor
+
+
+GB = diskmonitor.GB
+DiskUsage = collections.namedtuple("DiskUsage", ["total", "used", "free"])
+
+
+def test_volume_status_format_and_warning():
+    status = diskmonitor.VolumeStatus("Data", "D:/", 1000 * GB, 800 * GB, 200 * GB, rate=10 * GB / 3600,
+                                      warning_free_bytes=100 * GB, warning_seconds=12 * 3600)
+    assert status.format() == "Data: 200.0 GB free (20%), +10.0 GB/h, full in 20.0 h"
+    assert not status.warning
+    status.warning_seconds = 24 * 3600
+    assert status.warning
+    shrinking = diskmonitor.VolumeStatus("Export", "E:/", 1000 * GB, 100 * GB, 50 * GB, rate=-1.0, warning_free_bytes=100 * GB)
+    assert shrinking.time_to_full is None
+    assert shrinking.warning
+    assert diskmonitor.VolumeStatus("Data", "D:/", 1000 * GB, 0, 1000 * GB, rate=GB / 3600).format().endswith("full in 42 d")
+
+
+def test_sample_projects_growth_over_the_window(monkeypatch):
+    now = [0.0]
+    used = {"D:/": 800 * GB, "E:/": 100 * GB}
+    monkeypatch.setattr(diskmonitor.time, "monotonic", lambda: now[0])
+
+    def disk_usage(path):
+        if path not in used:
+            raise OSError("not reachable")
+        return DiskUsage(1000 * GB, used[path], 1000 * GB - used[path])
+
+    monkeypatch.setattr(diskmonitor.shutil, "disk_usage", disk_usage)
+    monitor = diskmonitor.DiskMonitor({"Data": "D:/", "Export": "E:/", "Offline": "X:/"}, window=600,
+                                      warning_free_bytes=100 * GB, warning_seconds=12 * 3600)
+    statuses = monitor.sample()
+    assert [status.label for status in statuses] == ["Data", "Export"]
+    assert statuses[0].rate is None and not statuses[0].warning
+    now[0] = 300.0
+    used["D:/"] += 3 * GB
+    data_status = monitor.sample()[0]
+    assert data_status.rate == 3 * GB / 300
+    # 197 GB free at 36 GB/h
+    assert data_status.warning
+    # the rate only covers the last window
+    now[0] = 1200.0
+    assert monitor.sample()[0].rate == 0
+
+
+def test_monitor_thread_calls_on_update(tmp_path):
+    updated = threading.Event()
+    updates = list()
+
+    def on_update(statuses):
+        updates.append(statuses)
+        updated.set()
+
+    monitor = diskmonitor.DiskMonitor({"Data": str(tmp_path)}, interval=60, on_update=on_update)
+    monitor.start()
+    assert updated.wait(10)
+    monitor.stop()
+    assert updates[0][0].label == "Data" and updates[0][0].free > 0
@@ -0,0 +1,166 @@
+# standard libraries
+import gc
+import hashlib
+import io
+import struct
+import threading
+import weakref
+
+# third party libraries
+import numpy
+import pytest
+
+# local libraries
+from nionswift_plugin.superstem import export
+from nionswift_plugin.superstem import manifest
+
+
+class DataItem:
+    def __init__(self, xdata):
+        self.xdata = xdata
+
+
+class DisplayItem:
+    def __init__(self, xdata):
+        self.data_item = DataItem(xdata)
+
+
+def make_xdata(shape=(32, 48), dtype=numpy.float32):
+    DataAndMetadata = pytest.importorskip("nion.data.DataAndMetadata")
+    data = numpy.random.default_rng(0).random(shape).astype(dtype)
+    return DataAndMetadata.new_data_and_metadata(data, metadata={"instrument": {"name": "sstem3"}})
+
+
+@pytest.fixture
+def dm_writer():
+    if export.get_dm_save_image() is None:
+        pytest.skip("writing DM files needs the DM plugin of nionswift-io")
+
+
+def write_with_size_fields(f):
+    """ writes like the DM writer: size placeholders, filled in once the content is written """
+    f.write(struct.pack(">ll", 3, 0))
+    f.write(b"x" * 1000)
+    f.write(struct.pack(">l", 0))
+    f.write(b"y" * 10)
+    end = f.tell()
+    f.seek(4)
+    f.write(struct.pack(">l", end))
+    f.seek(1008)
+    f.write(struct.pack(">l", 10))
+    f.seek(0, io.SEEK_END)
+
+
+def test_hashing_stream_hashes_final_content_with_patches():
+    patch_recorder = export.PatchRecorder()
+    write_with_size_fields(patch_recorder)
+    assert patch_recorder.patches == {4: struct.pack(">l", 1022), 1008: struct.pack(">l", 10)}
+    f = io.BytesIO()
+    stream = export.HashingStream(f, patch_recorder.patches)
+    write_with_size_fields(stream)
+    assert stream.hexdigest() == hashlib.sha256(f.getvalue()).hexdigest()
+
+
+def test_hashing_stream_gives_up_on_unexpected_overwrites():
+    f = io.BytesIO()
+    stream = export.HashingStream(f)
+    write_with_size_fields(stream)
+    assert stream.hexdigest() is None
+
+
+@pytest.mark.parametrize("suffix", [".dm3", ".dm4"])
+def test_write_dm_hashed(tmp_path, dm_writer, suffix):
+    for shape in [(32, 48), (4, 6, 100), (3, 4, 8, 8)]:
+        export_path = tmp_path / ("export" + str(len(shape)) + suffix)
+        assert export.write_dm_hashed(make_xdata(shape), export_path) == manifest.hash_file(export_path)
+
+
+def test_export_display_item_adds_manifest_entry(tmp_path, dm_writer):
+    export_path = tmp_path / "001_HAADF_16nm_test.dm3"
+    sha256 = export.export_display_item(DisplayItem(make_xdata()), export_path, None)
+    assert sha256 == manifest.hash_file(export_path)
+    assert manifest.read_export_manifest(tmp_path)[export_path.name] == (sha256, export_path.stat().st_size,
+                                                                          export_path.stat().st_mtime_ns)
+    # so the hashes stage does not read the file again
+    assert manifest.read_hashes_file(manifest.write_hashes_file(tmp_path))[export_path.name][0] == sha256
+
+
+def test_export_queue_adds_manifest_entries(tmp_path, dm_writer):
+    export_queue = export.ExportQueue(2**30)
+    export_paths = [tmp_path / "00{0}_HAADF_16nm_test.dm4".format(i) for i in range(3)]
+    for export_path in export_paths:
+        export_queue.submit(DisplayItem(make_xdata()), export_path)
+    export_queue.close()
+    export_manifest = manifest.read_export_manifest(tmp_path)
+    for export_path in export_paths:
+        assert export_manifest[export_path.name][0] == manifest.hash_file(export_path)
+
+
+def test_export_queue_spill_keeps_no_reference_to_the_live_data(tmp_path, dm_writer, monkeypatch):
+    write_started, write_allowed = threading.Event(), threading.Event()
+    write_dm_hashed = export.write_dm_hashed
+
+    def blocking_write_dm_hashed(xdata, export_path):
+        write_started.set()
+        write_allowed.wait(10)
+        return write_dm_hashed(xdata, export_path)
+
+    monkeypatch.setattr(export, "write_dm_hashed", blocking_write_dm_hashed)
+    export_queue = export.ExportQueue(0, tmp_path / "scratch")
+    # the first export occupies the thread, the second is spilled while it waits
+    export_queue.submit(DisplayItem(make_xdata()), tmp_path / "000_HAADF_16nm_test.dm4")
+    write_started.wait(10)
+    xdata = make_xdata((4, 6, 100))
+    xdata_ref = weakref.ref(xdata)
+    export_path = tmp_path / "001_SI-EELS_16nm_test.dm4"
+    export_queue.submit(None, export_path, xdata)
+    export_queue.wait_for_snapshots()
+    assert list((tmp_path / "scratch").glob("*.npy"))
+    data = numpy.copy(xdata.data)
+    del xdata
+    gc.collect()
+    assert xdata_ref() is None
+    write_allowed.set()
+    export_queue.close()
+    assert not list((tmp_path / "scratch").glob("*.npy"))
+    assert manifest.read_export_manifest(tmp_path)[export_path.name][0] == manifest.hash_file(export_path)
+    dm3_image_utils = pytest.importorskip("nionswift_plugin.DM_IO.dm3_image_utils")
+    with open(export_path, "rb") as f:
+        exported_xdata = dm3_image_utils.load_image(f)
+    assert numpy.array_equal(exported_xdata.data, data)
+    assert exported_xdata.metadata["instrument"] == {"name": "sstem3"}
+
+
+def test_export_queue_copies_and_spills_outside_the_calling_thread(tmp_path, monkeypatch):
+    copy_threads, save_threads = list(), list()
+    snapshot_xdata, save = export.snapshot_xdata, numpy.save
+    monkeypatch.setattr(export, "snapshot_xdata", lambda *args: copy_threads.append(threading.current_thread()) or snapshot_xdata(*args))
+    monkeypatch.setattr(export.numpy, "save", lambda *args: save_threads.append(threading.current_thread()) or save(*args))
+    write_allowed = threading.Event()
+    monkeypatch.setattr(export, "write_dm_hashed", lambda xdata, export_path: write_allowed.wait(10) and None)
+    # room for one snapshot in memory, the others are spilled while the first is written
+    export_queue = export.ExportQueue(make_xdata().data.nbytes, tmp_path / "scratch")
+    for i in range(3):
+        export_queue.submit(DisplayItem(make_xdata()), tmp_path / "00{0}_HAADF_16nm_test.dm4".format(i))
+    export_queue.wait_for_snapshots()
+    write_allowed.set()
+    export_queue.close()
+    assert len(copy_threads) == 1 and len(save_threads) == 2
+    assert threading.current_thread() not in copy_threads + save_threads
+
+
+def test_export_queue_reports_failed_export(tmp_path, monkeypatch):
+    def failing_save_image(xdata, f, file_version):
+        f.write(b"x" * 100)
+        if not isinstance(f, export.PatchRecorder):
+            raise OSError("disk full")
+
+    monkeypatch.setattr(export, "get_dm_save_image", lambda: failing_save_image)
+    failures = list()
+    export_queue = export.ExportQueue(2**30, on_export_failed=lambda path, error: failures.append((path, str(error))))
+    export_path = tmp_path / "001_HAADF_16nm_test.dm3"
+    export_queue.submit(DisplayItem(make_xdata()), export_path)
+    export_queue.close()
+    assert failures == [(export_path, "disk full")]
+    assert list(tmp_path.iterdir()) == []
+    assert not export_queue.is_pending(export_path)
@@ -0,0 +1,100 @@
+# standard libraries
+import hashlib
+import os
+
+# local libraries
+from nionswift_plugin.superstem import manifest
+
+
+def make_tree(root):
+    (root / "session" / "sub").mkdir(parents=True)
+    (root / "session" / "a b.dm3").write_bytes(b"a" * 1000)
+    (root / "session" / "sub" / "c.dm4").write_bytes(b"c" * 10)
+    (root / "x_gsdata_").mkdir()
+    (root / "x_gsdata_" / "state").write_bytes(b"skip")
+    return root
+
+
+def test_hash_file_matches_hashlib(tmp_path):
+    file_path = tmp_path / "data.bin"
+    file_path.write_bytes(bytes(range(256)) * 10000)
+    assert manifest.hash_file(file_path, chunk_size=1000) == hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+
+def test_hashes_file_lists_all_files_but_gsdata(tmp_path):
+    root = make_tree(tmp_path)
+    hashes_file = manifest.write_hashes_file(root, "sstem3", workers=2)
+    assert hashes_file.name.startswith("hashes_sstem3_") and hashes_file.suffix == ".txt"
+    entries = manifest.read_hashes_file(hashes_file)
+    assert entries == {"session/a b.dm3": (hashlib.sha256(b"a" * 1000).hexdigest(), 1000),
+                       "session/sub/c.dm4": (hashlib.sha256(b"c" * 10).hexdigest(), 10)}
+    assert manifest.find_latest_hashes_file(root) == hashes_file
+
+
+def test_files_being_written_are_not_listed(tmp_path):
+    root = make_tree(tmp_path)
+    # an export and a transfer in progress
+    (root / "session" / "002_HAADF_16nm_b.dm3.part").write_bytes(b"half written")
+    (root / "session" / "sub" / "c.dm4.part.chunks").write_text("10 0 x\n")
+    entries = manifest.read_hashes_file(manifest.write_hashes_file(root))
+    assert sorted(entries) == ["session/a b.dm3", "session/sub/c.dm4"]
+
+
+def test_read_hashes_file_accepts_backslashes_and_skips_malformed_lines(tmp_path):
+    hashes_file = tmp_path / "hashes_sstem3_20240312-174501.txt"
+    hashes_file.write_text("session\\a b.dm3 {0} 12 \nbroken\nsession\\c.dm3 {0} size\n".format("ab" * 32))
+    assert manifest.read_hashes_file(hashes_file) == {"session/a b.dm3": ("ab" * 32, 12)}
+
+
+def test_update_reuses_export_manifest_entries(tmp_path):
+    root = make_tree(tmp_path)
+    file_path = root / "session" / "a b.dm3"
+    # a recorded hash is trusted while size and mtime are unchanged, so a wrong one shows it was not re-read
+    manifest.add_export_manifest_entry(file_path, "0" * 64)
+    entries = manifest.read_hashes_file(manifest.write_hashes_file(root))
+    assert entries["session/a b.dm3"] == ("0" * 64, 1000)
+    assert not any(key.endswith(manifest.EXPORT_MANIFEST_NAME) for key in entries)
+
+
+def make_checked_tree(root):
+    (root / "session").mkdir()
+    for i in range(10):
+        (root / "session" / "{0:03d}.dm3".format(i)).write_bytes(bytes([i]) * 100)
+    hashes_file = manifest.write_hashes_file(root)
+    # files written before the hashes file
+    os.utime(hashes_file, (hashes_file.stat().st_mtime + 10,) * 2)
+    return hashes_file
+
+
+def test_unchanged_tree_is_ok(tmp_path):
+    hashes_file = make_checked_tree(tmp_path)
+    report = manifest.verify_hashes_file(hashes_file)
+    assert report.ok and report.checked_count == 10 and report.hashed_count == 0 and not report.extra
+    report = manifest.verify_hashes_file(hashes_file, deep=True, workers=3)
+    assert report.ok and report.hashed_count == 10
+
+
+def test_missing_extra_and_resized_files_are_reported(tmp_path):
+    hashes_file = make_checked_tree(tmp_path)
+    (tmp_path / "session" / "000.dm3").unlink()
+    (tmp_path / "session" / "001.dm3").write_bytes(b"short")
+    (tmp_path / "session" / "new.dm3").write_bytes(b"new")
+    report = manifest.verify_hashes_file(hashes_file, check_mtime=False)
+    assert not report.ok
+    assert report.missing == ["session/000.dm3"]
+    assert report.corrupt == ["session/001.dm3"]
+    assert report.extra == ["session/new.dm3"]
+
+
+def test_same_size_corruption_is_found_by_mtime_or_deep_check(tmp_path):
+    hashes_file = make_checked_tree(tmp_path)
+    file_path = tmp_path / "session" / "005.dm3"
+    file_path.write_bytes(b"x" * 100)
+    # modified after the hashes file was written: re-hashed in the cheap pass
+    os.utime(file_path, (hashes_file.stat().st_mtime + 10,) * 2)
+    assert manifest.verify_hashes_file(hashes_file).corrupt == ["session/005.dm3"]
+    # modification time restored: only found by re-hashing
+    os.utime(file_path, (hashes_file.stat().st_mtime - 10,) * 2)
+    assert manifest.verify_hashes_file(hashes_file).ok
+    assert manifest.verify_hashes_file(hashes_file, sample_fraction=1.0).corrupt == ["session/005.dm3"]
+    assert manifest.verify_hashes_file(hashes_file, deep=True).corrupt == ["session/005.dm3"]
@@ -0,0 +1,57 @@
+# standard libraries
+import os
+
+# local libraries
+from nionswift_plugin.superstem import manifest_store
+
+
+A, B, C = "aa" * 32, "bb" * 32, "cc" * 32
+
+
+def write_hashes(directory, instrument, written, lines):
+    directory.mkdir(parents=True, exist_ok=True)
+    hashes_file = directory / "hashes_{0}_{1}.txt".format(instrument, written)
+    hashes_file.write_text("".join("{0} {1} {2}\n".format(*line) for line in lines))
+    return hashes_file
+
+
+def test_hashes_file_names():
+    assert manifest_store.parse_hashes_file_name("hashes_sstem3_20240312-174501.txt") == ("sstem3", 20240312174501)
+    assert manifest_store.parse_hashes_file_name("hashes_sstem3.txt") == (None, None)
+    assert manifest_store.format_seen(20240312174501) == "2024-03-12 17:45:01"
+
+
+def test_repeated_listings_only_move_last_seen(tmp_path):
+    write_hashes(tmp_path / "sstem3", "sstem3", "20240312-174501", [("s1\\a b.dm3", A, 100)])
+    write_hashes(tmp_path / "sstem3", "sstem3", "20240313-090000", [("s1\\a b.dm3", A, 100), ("s2\\c.dm3", C, 5)])
+    with manifest_store.ManifestStore(tmp_path / "store.sqlite") as store:
+        assert store.ingest([tmp_path]) == 2
+        assert store.lookup(A) == [{"instrument": "sstem3", "path": "s1/a b.dm3", "size": 100,
+                                    "first_seen": "2024-03-12 17:45:01", "last_seen": "2024-03-13 09:00:00"}]
+        assert store.lookup(B) == list()
+        totals = store.totals()
+    assert [(total["instrument"], total["files"], total["hashes_files"]) for total in totals] == [("sstem3", 2, 2)]
+
+
+def test_unchanged_hashes_files_are_skipped(tmp_path):
+    hashes_file = write_hashes(tmp_path / "sstem3", "sstem3", "20240312-174501", [("s1/a.dm3", A, 100)])
+    # GoodSync's own folder is not read
+    write_hashes(tmp_path / "sstem3" / "_gsdata_", "sstem3", "20240312-174501", [("s1/x.dm3", B, 1)])
+    with manifest_store.ManifestStore(tmp_path / "store.sqlite") as store:
+        assert store.ingest([tmp_path]) == 1
+        assert store.ingest([tmp_path]) == 0
+        hashes_file.write_text("s1/a.dm3 {0} 100\ns1/b.dm3 {1} 7\n".format(A, B))
+        os.utime(hashes_file, (1, 1))
+        assert store.ingest([tmp_path]) == 1
+        assert [location["path"] for location in store.lookup(B)] == ["s1/b.dm3"]
+
+
+def test_duplicates_largest_waste_first(tmp_path):
+    write_hashes(tmp_path / "sstem2", "sstem2", "20240301-120000", [("s1/a.dm3", A, 10), ("s1/c.dm3", C, 1000)])
+    write_hashes(tmp_path / "sstem3", "sstem3", "20240312-174501", [("s2/a.dm3", A, 10), ("s2/a copy.dm3", A, 10),
+                                                                     ("s2/c.dm3", C, 1000), ("s2/b.dm3", B, 5)])
+    with manifest_store.ManifestStore(tmp_path / "store.sqlite") as store:
+        store.ingest([tmp_path / "sstem2", tmp_path / "sstem3"])
+        duplicates = store.duplicates()
+    assert [(duplicate["sha256"], duplicate["copies"], duplicate["wasted_bytes"]) for duplicate in duplicates] == [(C, 2, 1000), (A, 3, 20)]
+    assert [location["instrument"] for location in duplicates[0]["locations"]] == ["sstem2", "sstem3"]
@@ -0,0 +1,76 @@
+# standard libraries
+import threading
+
+# third party libraries
+import pytest
+
+# local libraries
+from nionswift_plugin.superstem import persistent
+
+
+class UI:
+    """ the persistent string part of Swift's ui """
+
+    def __init__(self):
+        self.persistent_strings = dict()
+        self.write_count = 0
+
+    def get_persistent_string(self, key, default_value=None):
+        return self.persistent_strings.get(key, default_value)
+
+    def set_persistent_string(self, key, value):
+        self.persistent_strings[key] = value
+        self.write_count += 1
+
+
+class TaskQueue:
+    """ stands in for api.queue_task, tasks run when the test runs them, as on the UI thread """
+
+    def __init__(self):
+        self.tasks = list()
+        self.queued = threading.Event()
+
+    def queue_task(self, fn):
+        self.tasks.append(fn)
+        self.queued.set()
+
+    def run_pending_tasks(self):
+        tasks, self.tasks = self.tasks, list()
+        for task in tasks:
+            task()
+
+
+def test_burst_of_updates_is_written_once():
+    ui, task_queue = UI(), TaskQueue()
+    persistent_strings = persistent.PersistentStrings(lambda: ui, task_queue.queue_task, delay=0.01)
+    persistent_strings.set("export_directory", "E:/a")
+    persistent_strings.set("export_directory", "E:/b")
+    persistent_strings.set("export_filter", "E:/b")
+    # a value not yet written is returned from the cache
+    assert persistent_strings.get("export_directory") == "E:/b"
+    assert ui.write_count == 0
+    assert task_queue.queued.wait(10)
+    task_queue.run_pending_tasks()
+    assert ui.persistent_strings == {"export_directory": "E:/b", "export_filter": "E:/b"}
+    assert ui.write_count == 2
+    assert persistent_strings.pending_count == 0
+
+
+def test_unchanged_values_are_not_written():
+    ui, task_queue = UI(), TaskQueue()
+    ui.persistent_strings["sstem_current_project_dir"] = "D:/p_Raw"
+    persistent_strings = persistent.PersistentStrings(lambda: ui, task_queue.queue_task, delay=60)
+    persistent_strings.set("sstem_current_project_dir", "D:/p_Raw")
+    persistent_strings.set("sstem_last_project_dir", "D:/o_Raw")
+    persistent_strings.close()
+    assert ui.write_count == 1
+    assert ui.persistent_strings["sstem_last_project_dir"] == "D:/o_Raw"
+    # values written by Swift itself are read from it
+    ui.persistent_strings["sstem_current_project_dir"] = "D:/q_Raw"
+    assert persistent_strings.get("sstem_current_project_dir") == "D:/q_Raw"
+
+
+def test_unknown_keys_are_rejected():
+    persistent_strings = persistent.PersistentStrings(lambda: UI(), TaskQueue().queue_task)
+    with pytest.raises(KeyError):
+        persistent_strings.set("export_dir", "E:/a")
@@ -0,0 +1,83 @@
+# standard libraries
+import pathlib
+import struct
+import zlib
+
+# third party libraries
+import numpy
+import pytest
+
+# local libraries
+from nionswift_plugin.superstem import preview
+
+
+def decode_png(png):
+    """ returns the grey or RGB image of a PNG written by encode_png, checking its chunks """
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks = dict()
+    offset = 8
+    while offset < len(png):
+        length = struct.unpack(">I", png[offset:offset + 4])[0]
+        tag, data = png[offset + 4:offset + 8], png[offset + 8:offset + 8 + length]
+        assert struct.unpack(">I", png[offset + 8 + length:offset + 12 + length])[0] == zlib.crc32(tag + data)
+        chunks[tag] = data
+        offset += 12 + length
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    channels = 1 if color_type == 0 else 3
+    rows = numpy.frombuffer(zlib.decompress(chunks[b"IDAT"]), numpy.uint8).reshape(height, 1 + width * channels)
+    assert not rows[:, 0].any()
+    return rows[:, 1:].reshape((height, width) if channels == 1 else (height, width, 3))
+
+
+def test_preview_path():
+    assert preview.get_preview_path("E:/x/001_HAADF_16nm_overview.dm3") == pathlib.Path("E:/x/001_HAADF_16nm_overview.png")
+    assert preview.get_preview_path("E:/x/001_HAADF_16nm_overview.dm4", "jpeg").name == "001_HAADF_16nm_overview.jpg"
+
+
+def test_downsample_and_scale():
+    image = numpy.arange(1000 * 600, dtype=numpy.float32).reshape(1000, 600)
+    assert preview.downsample(image).shape == (250, 150)
+    assert preview.downsample(image[:200, :100]).shape == (200, 100)
+    assert preview.downsample(image[:1, :]).shape == (1, 200)
+    image[0, 0] = numpy.nan
+    scaled = preview.scale_to_uint8(image)
+    assert scaled.dtype == numpy.uint8 and scaled[-1, -1] == 255 and scaled[0, 1] == 0
+    assert not preview.scale_to_uint8(numpy.full((4, 4), numpy.nan)).any()
+
+
+@pytest.mark.parametrize("shape, kwargs, preview_shape", [
+    ((2048, 1024), dict(), (256, 128)),
+    ((1000,), dict(), (128, 256)),
+    ((64, 64, 500), dict(collection_dimension_count=2, datum_dimension_count=1), (64, 64)),
+    ((32, 48, 16, 16), dict(), (32, 48)),
+    ((5, 64, 64), dict(is_sequence=True, collection_dimension_count=0, datum_dimension_count=2), (64, 64)),
+    # the sum of a line scan of spectra is plotted like a spectrum
+    ((10, 500), dict(collection_dimension_count=1, datum_dimension_count=1), (128, 10)),
+])
+def test_make_preview_of_any_dimension(shape, kwargs, preview_shape):
+    data = numpy.random.default_rng(0).random(shape, numpy.float32)
+    image = preview.make_preview(data, **kwargs)
+    assert image.dtype == numpy.uint8
+    assert image.shape == preview_shape
+
+
+def test_encode_png():
+    image = numpy.random.default_rng(0).integers(0, 256, (20, 30), numpy.uint8)
+    assert numpy.array_equal(decode_png(preview.encode_png(image)), image)
+    rgb = numpy.random.default_rng(0).integers(0, 256, (20, 30, 3), numpy.uint8)
+    assert numpy.array_equal(decode_png(preview.encode_png(rgb)), rgb)
+
+
+def test_preview_writer(tmp_path):
+    DataAndMetadata = pytest.importorskip("nion.data.DataAndMetadata")
+    xdata = DataAndMetadata.new_data_and_metadata(numpy.random.default_rng(0).random((16, 16, 100), numpy.float32),
+                                                  data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1))
+    preview_writer = preview.PreviewWriter("png", max_size=64)
+    assert preview_writer.write(xdata, tmp_path / "001_SI-EELS_16nm_test.dm4") == tmp_path / "001_SI-EELS_16nm_test.png"
+    assert decode_png((tmp_path / "001_SI-EELS_16nm_test.png").read_bytes()).shape == (16, 16)
+    preview_writer.submit(xdata, tmp_path / "002_SI-EELS_16nm_test.dm4")
+    preview_writer.close()
+    assert (tmp_path / "002_SI-EELS_16nm_test.png").is_file()
+    assert not list(tmp_path.glob("*.part"))
+    with pytest.raises(ValueError):
+        preview.PreviewWriter("tiff")
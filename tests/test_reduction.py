@@ -0,0 +1,82 @@
+# standard libraries
+import json
+import pathlib
+import types
+
+# third party libraries
+import numpy
+import pytest
+
+# local libraries
+from nionswift_plugin.superstem import reduction
+
+
+def make_descriptor(is_sequence=False, collection_dimension_count=0, datum_dimension_count=2):
+    return types.SimpleNamespace(is_sequence=is_sequence, collection_dimension_count=collection_dimension_count,
+                                 datum_dimension_count=datum_dimension_count)
+
+
+def test_axes_of_images_spectrum_images_and_sequences():
+    assert reduction.get_axes(make_descriptor()) == ((0, 1), (), (0, 1))
+    assert reduction.get_axes(make_descriptor(False, 2, 1)) == ((0, 1), (2,), (0, 1))
+    assert reduction.get_axes(make_descriptor(True, 0, 1)) == ((), (1,), ())
+
+
+def test_binning_sums_blocks_and_keeps_integer_types_that_fit():
+    data = numpy.arange(5 * 4, dtype=numpy.uint16).reshape(5, 4)
+    binned = reduction.bin_axes(data, (0, 1), 2)
+    assert binned.shape == (2, 2) and binned.dtype == numpy.uint16
+    assert binned[0, 0] == 0 + 1 + 4 + 5
+    # sums that overflow uint16 are returned as uint32
+    assert reduction.bin_axes(numpy.full((4, 4), 60000, numpy.uint16), (0, 1), 2).dtype == numpy.uint32
+    assert reduction.bin_axes(data, (0, 1), 1) is data
+
+
+def test_only_float64_is_downcast():
+    DataAndMetadata = pytest.importorskip("nion.data.DataAndMetadata")
+    for dtype in (numpy.float32, numpy.uint16):
+        xdata = DataAndMetadata.new_data_and_metadata(numpy.ones((8, 8), dtype))
+        assert reduction.reduce_xdata(xdata, {"dtype": "float32"}) == (xdata, None)
+    xdata = DataAndMetadata.new_data_and_metadata(numpy.ones((8, 8), numpy.float64))
+    assert reduction.reduce_xdata(xdata, {"dtype": "int8"}) == (xdata, None)
+    reduced_xdata, description = reduction.reduce_xdata(xdata, {"dtype": "float32"}, profile_name="HAADF")
+    assert reduced_xdata.data.dtype == numpy.float32
+    assert description["dtype"] == "float32" and description["original_dtype"] == "float64"
+
+
+def test_float16_downcast_clamps_values_out_of_range():
+    data = numpy.array([1.5, -1e6, 7e4, 65504.0, numpy.nan])
+    downcast_data, clamped_count = reduction.downcast(data, "float16")
+    assert downcast_data.dtype == numpy.float16 and clamped_count == 2
+    assert downcast_data.tolist()[:4] == [1.5, -65504.0, 65504.0, 65504.0]
+    assert numpy.isnan(downcast_data[4])
+
+
+def test_float16_is_opt_in_and_recorded():
+    DataAndMetadata = pytest.importorskip("nion.data.DataAndMetadata")
+    xdata = DataAndMetadata.new_data_and_metadata(numpy.array([1.5, -1e6, 7e4]))
+    reduced_xdata, description = reduction.reduce_xdata(xdata, {"dtype": "float16"})
+    assert reduced_xdata.data.dtype == numpy.float16
+    assert description["dtype"] == "float16" and description["clamped"] == 2
+
+
+def test_spectrum_image_is_binned_and_cropped_with_calibrations():
+    Calibration = pytest.importorskip("nion.data.Calibration")
+    DataAndMetadata = pytest.importorskip("nion.data.DataAndMetadata")
+    data = numpy.ones((20, 20, 100), numpy.float32)
+    calibrations = [Calibration.Calibration(0, 1, "nm"), Calibration.Calibration(0, 1, "nm"), Calibration.Calibration(100, 0.5, "eV")]
+    xdata = DataAndMetadata.new_data_and_metadata(data, dimensional_calibrations=calibrations,
+                                                  data_descriptor=DataAndMetadata.DataDescriptor(False, 2, 1))
+    profile = {"bin_energy": 2, "crop": "roi"}
+    reduced_xdata, description = reduction.reduce_xdata(xdata, profile, (0.25, 0.5, 0.5, 0.25), "SI-EELS")
+    assert reduced_xdata.data.shape == (10, 5, 50)
+    assert reduced_xdata.data[0, 0, 0] == 2
+    assert reduced_xdata.dimensional_calibrations[1].offset == 10
+    assert reduced_xdata.dimensional_calibrations[2].scale == 1
+    assert reduced_xdata.metadata[reduction.METADATA_KEY]["profile"] == "SI-EELS"
+    assert description["crop"] == [5, 10, 10, 5]
+
+
+def test_shipped_config_has_no_reduction_profiles():
+    with open(pathlib.Path(__file__).parents[1] / "superstem_customisation.json") as f:
+        assert json.load(f)["export_reduction_profiles"] == dict()
@@ -0,0 +1,63 @@
+# standard libraries
+import csv
+import json
+
+# third party libraries
+import numpy
+import pytest
+
+# local libraries
+from nionswift_plugin.superstem import export
+from nionswift_plugin.superstem import report
+
+
+def make_export_dir(tmp_path):
+    export_dir = tmp_path / "2024_03_12_ABC_S1234_area"
+    (export_dir / "HAADF").mkdir(parents=True)
+    (export_dir / "002_HAADF_16nm_b.dm3").write_bytes(b"not a DM file")
+    (export_dir / "002_HAADF_16nm_b.png").write_bytes(b"preview")
+    (export_dir / "HAADF" / "001_HAADF_16nm_a.dm4").write_bytes(b"not a DM file")
+    return export_dir
+
+
+def test_find_exports_in_directory_and_shards(tmp_path):
+    export_dir = make_export_dir(tmp_path)
+    assert report.find_exports(export_dir) == [export_dir / "HAADF" / "001_HAADF_16nm_a.dm4",
+                                               export_dir / "002_HAADF_16nm_b.dm3"]
+
+
+def test_contact_sheet_layout():
+    thumbnails = [numpy.full((8, 16), 255, numpy.uint8), None, numpy.full((40, 40), 128, numpy.uint8)]
+    sheet = report.make_contact_sheet(thumbnails, ["a", "b", "c"], thumbnail_size=40, columns=2)
+    assert sheet.shape == (2 * (40 + report.LABEL_HEIGHT), 80)
+    # the small thumbnail is enlarged by 2 and centred
+    assert sheet[12, 4] == 255 and sheet[11, 4] == report.BACKGROUND
+    assert sheet[40 + report.LABEL_HEIGHT + 20, 20] == 128
+
+
+def test_report_of_unreadable_files_lists_the_errors(tmp_path):
+    export_dir = make_export_dir(tmp_path)
+    sheet_path, csv_path, json_path = report.generate_report(export_dir, workers=2, processes=False)
+    assert sheet_path.name == "2024_03_12_ABC_S1234_area_report.png"
+    with open(csv_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["file"] for row in rows] == ["001_HAADF_16nm_a.dm4", "002_HAADF_16nm_b.dm3"]
+    assert all(row["error"] for row in rows)
+    assert rows[0]["detector"] == "HAADF" and rows[0]["fov_nm"] == "16.0"
+    summary = json.loads(json_path.read_text())
+    assert summary["item_count"] == 2
+    assert summary["session"]["microscopist"] == "ABC"
+
+
+def test_report_of_dm_files(tmp_path):
+    if export.get_dm_save_image() is None:
+        pytest.skip("reading DM files needs the DM plugin of nionswift-io")
+    DataAndMetadata = pytest.importorskip("nion.data.DataAndMetadata")
+    export_dir = tmp_path / "2024_03_12_ABC_S1234_area"
+    export_dir.mkdir()
+    data = numpy.random.default_rng(0).random((64, 64), numpy.float32)
+    export.write_dm_hashed(DataAndMetadata.new_data_and_metadata(data), export_dir / "001_HAADF_16nm_a.dm3")
+    sheet_path, csv_path, json_path = report.generate_report(export_dir, workers=1, thumbnail_size=32, processes=False)
+    items = json.loads(json_path.read_text())["items"]
+    assert items[0]["shape"] == "64x64" and items[0]["dtype"] == "float32" and items[0]["error"] is None
+    assert sheet_path.is_file()
@@ -0,0 +1,82 @@
+# standard libraries
+import datetime
+import pathlib
+import sys
+import types
+
+# local libraries
+from nionswift_plugin.superstem import session
+
+
+class Listener:
+    def __init__(self, listeners, fn):
+        self.listeners = listeners
+        self.fn = fn
+        listeners.append(fn)
+
+    def close(self):
+        self.listeners.remove(self.fn)
+
+
+class SessionMetadataModel:
+    """ Swift's session metadata model, as far as the observer uses it """
+
+    def __init__(self):
+        self.listeners = list()
+        self.property_changed_event = types.SimpleNamespace(listen=lambda fn: Listener(self.listeners, fn))
+
+    def notify(self, name):
+        for fn in list(self.listeners):
+            fn(name)
+
+
+def install_application_data(monkeypatch, model):
+    """ makes "from nion.swift.model import ApplicationData" return a module with get_session_metadata_model """
+    application_data = types.ModuleType("nion.swift.model.ApplicationData")
+    application_data.get_session_metadata_model = lambda: model
+    model_package = types.ModuleType("nion.swift.model")
+    model_package.ApplicationData = application_data
+    for name, module in [("nion", types.ModuleType("nion")), ("nion.swift", types.ModuleType("nion.swift")),
+                         ("nion.swift.model", model_package), ("nion.swift.model.ApplicationData", application_data)]:
+        monkeypatch.setitem(sys.modules, name, module)
+
+
+def make_library_values():
+    return {"stem.session.microscopist": "dmh", "stem.session.sample": "1234",
+            "stem.session.sample_area": "area1", "stem.session.task": "EELS"}
+
+
+def test_session_string():
+    assert session.get_session_string({"microscopist": "dmh", "sample": "1234", "sample_area": "area1"}) == "DMH_S1234_area1"
+
+
+def test_observer_without_session_model_reads_the_fields_again(monkeypatch):
+    monkeypatch.setitem(sys.modules, "nion.swift.model", None)
+    library_values = make_library_values()
+    observer = session.SessionMetadataObserver(library_values.get)
+    observer.start()
+    assert not observer.is_observing
+    library_values["stem.session.sample"] = "5678"
+    export_dir_path = observer.get_export_dir_path("E:/2024", datetime.datetime(2024, 3, 12))
+    assert export_dir_path == pathlib.Path("E:/2024/2024_03_12_DMH_S5678_area1")
+
+
+def test_observer_follows_changed_fields(monkeypatch):
+    model = SessionMetadataModel()
+    install_application_data(monkeypatch, model)
+    library_values = make_library_values()
+    changes = list()
+    observer = session.SessionMetadataObserver(library_values.get, lambda observer: changes.append(observer.session_string))
+    observer.start()
+    assert observer.is_observing
+    library_values["stem.session.sample_area"] = "area2"
+    model.notify("sample_area")
+    assert changes == ["DMH_S1234_area2"]
+    # the task is not part of the session string, other properties are ignored
+    library_values["stem.session.task"] = "imaging"
+    model.notify("task")
+    model.notify("site")
+    assert changes == ["DMH_S1234_area2"]
+    assert observer.snapshot["task"] == "imaging"
+    observer.close()
+    assert not observer.is_observing and model.listeners == list()
@@ -0,0 +1,46 @@
+# standard libraries
+import pathlib
+
+# local libraries
+from nionswift_plugin.superstem import shard
+
+
+def test_shard_names():
+    assert shard.get_shard_name("detector", "SI-EELS", "12") == "SI-EELS"
+    assert shard.get_shard_name("detector", "MAADF / HAADF", "12") == "MAADF_HAADF"
+    assert shard.get_shard_name("no", "HAADF", "12") == "000-099"
+    assert shard.get_shard_name("no", "HAADF", "1234", no_range=1000) == "1000-1999"
+    assert shard.get_shard_name("no", "HAADF", "12a") is None
+    assert shard.get_shard_name(None, "HAADF", "12") is None
+
+
+def test_only_dm_files_are_counted(tmp_path):
+    for i in range(3):
+        (tmp_path / "{0:03d}_HAADF_16nm_a.dm3".format(i)).write_bytes(b"")
+        (tmp_path / "{0:03d}_HAADF_16nm_a.png".format(i)).write_bytes(b"")
+    (tmp_path / "003_SI-EELS_16nm_a.DM4").write_bytes(b"")
+    (tmp_path / "hashes_sstem3_20240312-174501.txt").write_text("")
+    (tmp_path / "HAADF.dm3").mkdir()
+    assert shard.count_files(tmp_path) == 4
+    assert shard.count_files(tmp_path / "missing") == 0
+
+
+def test_exports_go_into_subfolders_past_the_threshold(tmp_path):
+    layout = shard.ExportLayout("detector", threshold=2)
+    (tmp_path / "001_HAADF_16nm_a.png").write_bytes(b"")
+    export_path = layout.get_export_path(tmp_path, "001_HAADF_16nm_a.dm3", "HAADF", "1")
+    assert export_path == tmp_path / "001_HAADF_16nm_a.dm3"
+    layout.add(export_path)
+    layout.add(tmp_path / "002_HAADF_16nm_b.dm3")
+    # exports into a subfolder are not counted
+    layout.add(tmp_path / "HAADF" / "003_HAADF_16nm_c.dm3")
+    assert layout.get_export_path(tmp_path, "003_HAADF_16nm_c.dm3", "HAADF", "3") == tmp_path / "HAADF" / "003_HAADF_16nm_c.dm3"
+    assert layout.get_candidate_paths(tmp_path, "003_HAADF_16nm_c.dm3", "HAADF", "3") == [
+        tmp_path / "003_HAADF_16nm_c.dm3", tmp_path / "HAADF" / "003_HAADF_16nm_c.dm3"]
+
+
+def test_without_shard_by_exports_stay_in_the_directory():
+    layout = shard.ExportLayout(threshold=0)
+    directory = pathlib.Path("E:/2024_03_12_ABC_S1234_area")
+    assert layout.get_export_path(directory, "001_HAADF_16nm_a.dm3", "HAADF", "1") == directory / "001_HAADF_16nm_a.dm3"
+    assert layout.get_candidate_paths(directory, "001_HAADF_16nm_a.dm3", "HAADF", "1") == [directory / "001_HAADF_16nm_a.dm3"]
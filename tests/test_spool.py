@@ -0,0 +1,79 @@
+# standard libraries
+import hashlib
+import json
+import time
+
+# local libraries
+from nionswift_plugin.superstem import manifest
+from nionswift_plugin.superstem import spool
+
+
+def wait_until(condition, timeout=10):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+def spool_file(export_spool, export_path, content):
+    spool_path = export_spool.get_spool_path(export_path)
+    spool_path.write_bytes(content)
+    export_spool.submit(spool_path, export_path, hashlib.sha256(content).hexdigest())
+    return spool_path
+
+
+def test_spooled_file_is_moved_and_added_to_the_manifest(tmp_path):
+    export_spool = spool.ExportSpool(tmp_path / "spool")
+    export_path = tmp_path / "export" / "001_HAADF_16nm_test.dm3"
+    spool_file(export_spool, export_path, b"dm3 data")
+    assert wait_until(lambda: export_spool.pending_count == 0)
+    export_spool.close()
+    assert export_path.read_bytes() == b"dm3 data"
+    assert manifest.read_export_manifest(export_path.parent)[export_path.name][0] == hashlib.sha256(b"dm3 data").hexdigest()
+    assert list((tmp_path / "spool").iterdir()) == list()
+
+
+def test_failed_move_is_retried(tmp_path, monkeypatch):
+    copy_hashed = spool.copy_hashed
+    attempts = list()
+
+    def unreachable_copy_hashed(source_path, destination_path):
+        attempts.append(destination_path)
+        if len(attempts) < 3:
+            raise OSError("share unreachable")
+        return copy_hashed(source_path, destination_path)
+
+    monkeypatch.setattr(spool, "copy_hashed", unreachable_copy_hashed)
+    export_spool = spool.ExportSpool(tmp_path / "spool", initial_delay=0.05, max_delay=0.1)
+    export_path = tmp_path / "export" / "001_HAADF_16nm_test.dm3"
+    spool_file(export_spool, export_path, b"dm3 data")
+    assert export_spool.is_pending(export_path)
+    assert wait_until(lambda: not export_spool.is_pending(export_path))
+    export_spool.close()
+    assert len(attempts) == 3
+    assert export_path.read_bytes() == b"dm3 data"
+
+
+def test_files_left_in_the_spool_are_moved_after_restart(tmp_path):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    export_path = tmp_path / "export" / "001_HAADF_16nm_test.dm3"
+    (spool_dir / "abc_001_HAADF_16nm_test.dm3").write_bytes(b"dm3 data")
+    with open(spool_dir / "abc_001_HAADF_16nm_test.dm3.json", "w") as f:
+        json.dump({"destination": str(export_path), "sha256": None}, f)
+    export_spool = spool.ExportSpool(spool_dir)
+    assert wait_until(lambda: export_spool.pending_count == 0)
+    export_spool.close()
+    assert export_path.read_bytes() == b"dm3 data"
+
+
+def test_existing_export_is_never_overwritten(tmp_path):
+    export_path = tmp_path / "export" / "001_HAADF_16nm_test.dm3"
+    export_path.parent.mkdir()
+    export_path.write_bytes(b"other data")
+    export_spool = spool.ExportSpool(tmp_path / "spool")
+    spool_path = spool_file(export_spool, export_path, b"dm3 data")
+    assert wait_until(lambda: export_spool.pending_count == 0)
+    export_spool.close()
+    assert export_path.read_bytes() == b"other data"
+    assert spool_path.is_file()
@@ -0,0 +1,105 @@
+# standard libraries
+import threading
+import time
+import zipfile
+
+# local libraries
+from nionswift_plugin.superstem import archive
+from nionswift_plugin.superstem import staging
+
+
+def get_staging_area(project_dir, tmp_path):
+    return staging.get_staging_area(project_dir, project_dir.name[:-len("_Raw")], tmp_path / "staging",
+                                    compression=zipfile.ZIP_DEFLATED)
+
+
+def test_finalize_assembles_archive_from_staged_files(make_project, tmp_path):
+    project_dir = make_project()
+    staging_area = get_staging_area(project_dir, tmp_path)
+    assert staging_area.scan() == 4
+    assert staging_area.has_staged_files()
+    # a file changed after staging is staged again when finalising
+    (project_dir / "Nion Swift Data 13" / "extra.txt").write_text("added later")
+    archive_path = tmp_path / "project.zip"
+    staging_area.finalize(archive_path)
+    assert archive.verify_archive(archive_path)
+    with zipfile.ZipFile(archive_path) as zf:
+        for file_path in project_dir.rglob("*"):
+            if file_path.is_file():
+                assert zf.read(file_path.relative_to(project_dir.parent).as_posix()) == file_path.read_bytes()
+    staging_area.remove()
+    assert not staging_area.staging_dir.exists()
+    assert not staging_area.has_staged_files()
+    assert list((tmp_path / "staging").iterdir()) == list()
+
+
+def test_scan_waits_until_files_are_stable(make_project, tmp_path):
+    staging_area = get_staging_area(make_project(), tmp_path)
+    assert staging_area.scan(stable_seconds=0) == 0
+    assert staging_area.scan(stable_seconds=0) == 4
+    assert staging_area.scan(stable_seconds=0) == 0
+
+
+def test_scan_stops_after_the_file_being_staged(make_project, tmp_path, monkeypatch):
+    staging_area = get_staging_area(make_project(), tmp_path)
+    stop_event = threading.Event()
+    write_member = archive.write_member
+
+    def write_member_and_stop(*args, **kwargs):
+        stop_event.set()
+        return write_member(*args, **kwargs)
+
+    monkeypatch.setattr(archive, "write_member", write_member_and_stop)
+    assert staging_area.scan(stop_event=stop_event) == 1
+    assert staging_area.staged_count == 1
+
+
+def test_staging_areas_of_one_project_share_the_lock_and_state(make_project, tmp_path):
+    project_dir = make_project()
+    staging_area = get_staging_area(project_dir, tmp_path)
+    other_staging_area = get_staging_area(project_dir, tmp_path)
+    lock = staging.StagingLock(tmp_path / "staging" / "2024_03_12_ABC_S1234_area.lock")
+    assert lock.acquire()
+    assert not staging.StagingLock(lock.lock_path).acquire(blocking=False)
+    assert staging_area.scan(blocking=False) == 0
+    lock.release()
+    assert staging_area.scan() == 4
+    # the other instance rereads the state when it takes the lock
+    assert other_staging_area.scan() == 0
+    assert other_staging_area.staged_count == 4
+    other_staging_area.remove()
+    assert staging_area.scan() == 4
+
+
+def test_session_archiver_stop_waits_for_the_scan(make_project, tmp_path, monkeypatch):
+    staging_area = get_staging_area(make_project(), tmp_path)
+    scan_started, scans_finished = threading.Event(), list()
+
+    def slow_scan(stable_seconds=None, stop_event=None, blocking=True):
+        scan_started.set()
+        time.sleep(0.2)
+        scans_finished.append(stop_event.is_set())
+
+    monkeypatch.setattr(staging_area, "scan", slow_scan)
+    session_archiver = staging.SessionArchiver(staging_area, interval=0.01)
+    session_archiver.start()
+    assert scan_started.wait(10)
+    session_archiver.stop()
+    assert scans_finished and scans_finished[-1]
+
+
+def test_lock_file_removed_by_its_holder_is_not_locked_again(tmp_path):
+    lock, waiting_lock = staging.StagingLock(tmp_path / "a.lock"), staging.StagingLock(tmp_path / "a.lock")
+    assert lock.acquire()
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: waiting_lock.acquire() and acquired.set())
+    thread.start()
+    time.sleep(0.2)
+    lock.unlink()
+    lock.release()
+    thread.join(10)
+    assert acquired.is_set()
+    # the waiting lock holds a new lock file, so a third one cannot take it
+    assert (tmp_path / "a.lock").is_file()
+    assert not staging.StagingLock(tmp_path / "a.lock").acquire(blocking=False)
+    waiting_lock.release()
@@ -0,0 +1,30 @@
+# standard libraries
+import threading
+import time
+
+# local libraries
+from nionswift_plugin.superstem import throttle
+
+
+def test_from_megabytes():
+    assert throttle.Throttle.from_megabytes(None).max_bytes_per_second is None
+    assert throttle.Throttle.from_megabytes(0.5).max_bytes_per_second == 512 * 1024
+
+
+def test_unlimited_throttle_does_not_sleep():
+    job_throttle = throttle.Throttle()
+    start = time.monotonic()
+    job_throttle.consume(2**40)
+    assert time.monotonic() - start < 0.1
+
+
+def test_limit_applies_to_all_threads_of_a_job():
+    job_throttle = throttle.Throttle(1000000)
+    start = time.monotonic()
+    threads = [threading.Thread(target=job_throttle.consume, args=(50000,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 200 kB at 1 MB/s
+    assert time.monotonic() - start >= 0.19
@@ -0,0 +1,102 @@
+# standard libraries
+import os
+
+# third party libraries
+import numpy
+
+# local libraries
+from nionswift_plugin.superstem import manifest
+from nionswift_plugin.superstem import transfer
+
+
+CHUNK_SIZE = 1000
+
+
+def make_source(root):
+    (root / "session" / "sub").mkdir(parents=True)
+    (root / "session" / "large.dm4").write_bytes(numpy.random.default_rng(0).bytes(10 * CHUNK_SIZE + 123))
+    (root / "session" / "sub" / "small.dm3").write_bytes(b"small")
+    (root / "session" / "empty.txt").write_bytes(b"")
+    return manifest.write_hashes_file(root)
+
+
+def assert_same_files(source_root, destination_root):
+    for key in manifest.read_hashes_file(manifest.find_latest_hashes_file(source_root)):
+        assert (destination_root / key).read_bytes() == (source_root / key).read_bytes()
+
+
+def test_transfer_copies_and_then_skips(tmp_path):
+    source_root, destination_root = tmp_path / "New_Data", tmp_path / "upload"
+    hashes_file = make_source(source_root)
+    report = transfer.transfer_directory(source_root, destination_root, workers=3, chunk_size=CHUNK_SIZE)
+    assert report.ok
+    assert sorted(report.copied) == ["session/empty.txt", "session/large.dm4", "session/sub/small.dm3"]
+    assert_same_files(source_root, destination_root)
+    # the hashes file arrives last, once the files it lists are there
+    assert (destination_root / hashes_file.name).read_bytes() == hashes_file.read_bytes()
+    assert not list(destination_root.rglob("*.part*"))
+    report = transfer.transfer_directory(source_root, destination_root, chunk_size=CHUNK_SIZE)
+    assert report.ok and not report.copied and len(report.skipped) == 3
+
+
+def test_interrupted_copy_resumes_at_the_missing_chunks(tmp_path, monkeypatch):
+    source_root, destination_root = tmp_path / "New_Data", tmp_path / "upload"
+    hashes_file = make_source(source_root)
+    sha256, file_size = manifest.read_hashes_file(hashes_file)["session/large.dm4"]
+    file_transfer = transfer.FileTransfer(source_root / "session" / "large.dm4", destination_root / "session" / "large.dm4",
+                                          sha256, file_size, CHUNK_SIZE)
+    assert file_transfer.prepare() == list(range(11))
+    for index in range(0, 11, 2):
+        file_transfer.copy_chunk(index)
+    copied_chunks = list()
+    copy_chunk = transfer.FileTransfer.copy_chunk
+
+    def recording_copy_chunk(self, index, throttle=None):
+        if self.source_path.name == "large.dm4":
+            copied_chunks.append(index)
+        return copy_chunk(self, index, throttle)
+
+    monkeypatch.setattr(transfer.FileTransfer, "copy_chunk", recording_copy_chunk)
+    report = transfer.transfer_directory(source_root, destination_root, workers=2, chunk_size=CHUNK_SIZE)
+    assert report.ok
+    assert sorted(copied_chunks) == [1, 3, 5, 7, 9]
+    assert_same_files(source_root, destination_root)
+
+
+def test_changed_and_missing_files_fail(tmp_path):
+    source_root, destination_root = tmp_path / "New_Data", tmp_path / "upload"
+    hashes_file = make_source(source_root)
+    (source_root / "session" / "sub" / "small.dm3").write_bytes(b"changed")
+    (source_root / "session" / "empty.txt").unlink()
+    report = transfer.transfer_directory(source_root, destination_root, chunk_size=CHUNK_SIZE)
+    assert report.failed == ["session/empty.txt", "session/sub/small.dm3"]
+    assert report.copied == ["session/large.dm4"]
+    # the hashes file is not copied while files are missing
+    assert not (destination_root / hashes_file.name).exists()
+
+
+def test_copy_not_matching_the_manifest_is_not_renamed(tmp_path):
+    source_root, destination_root = tmp_path / "New_Data", tmp_path / "upload"
+    hashes_file = make_source(source_root)
+    # same size, different content
+    (source_root / "session" / "sub" / "small.dm3").write_bytes(b"SMALL")
+    report = transfer.transfer_directory(source_root, destination_root, hashes_file, chunk_size=CHUNK_SIZE)
+    assert report.failed == ["session/sub/small.dm3"]
+    assert not (destination_root / "session" / "sub" / "small.dm3").exists()
+    assert not (destination_root / "session" / "sub" / "small.dm3.part").exists()
+
+
+def test_same_size_file_changed_since_the_copy_is_copied_again(tmp_path):
+    source_root, destination_root = tmp_path / "New_Data", tmp_path / "upload"
+    make_source(source_root)
+    assert transfer.transfer_directory(source_root, destination_root, chunk_size=CHUNK_SIZE).ok
+    # corrected and exported again with the same size, a minute later
+    small_path = source_root / "session" / "sub" / "small.dm3"
+    small_path.write_bytes(b"SMALL")
+    os.utime(small_path, (small_path.stat().st_atime, small_path.stat().st_mtime + 60))
+    for hashes_file in source_root.glob("hashes_*.txt"):
+        hashes_file.unlink()
+    manifest.write_hashes_file(source_root)
+    report = transfer.transfer_directory(source_root, destination_root, chunk_size=CHUNK_SIZE)
+    assert report.ok and report.copied == ["session/sub/small.dm3"]
+    assert (destination_root / "session" / "sub" / "small.dm3").read_bytes() == b"SMALL"
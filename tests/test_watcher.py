@@ -0,0 +1,119 @@
+# standard libraries
+import os
+import time
+
+# local libraries
+from nionswift_plugin.superstem import manifest
+from nionswift_plugin.superstem import watcher
+
+
+def make_new_data(root):
+    (root / "session").mkdir(parents=True)
+    (root / "session" / "001_HAADF_16nm_test.dm3").write_bytes(b"a" * 1000)
+    (root / "session" / "002_HAADF_16nm_test.dm4.part").write_bytes(b"partial")
+    (root / "hashes_sstem3_20240312-174501.txt").write_text("")
+    (root / "x_gsdata_").mkdir()
+    (root / "x_gsdata_" / "state").write_bytes(b"skip")
+    return root
+
+
+def set_age(file_path, seconds):
+    mtime = time.time() - seconds
+    os.utime(file_path, (mtime, mtime))
+
+
+def test_only_data_files_are_watched(tmp_path):
+    root = make_new_data(tmp_path / "New_Data")
+    manifest_watcher = watcher.ManifestWatcher(root, stable_seconds=0)
+    manifest_watcher.scan()
+    assert manifest_watcher.pending_count == 1
+    assert manifest_watcher.hash_stable_files() == 1
+    entries = manifest.read_export_manifest(root / "session")
+    assert list(entries) == ["001_HAADF_16nm_test.dm3"]
+    assert entries["001_HAADF_16nm_test.dm3"][0] == manifest.hash_file(root / "session" / "001_HAADF_16nm_test.dm3")
+    # hashed files are not queued again
+    manifest_watcher.scan()
+    assert manifest_watcher.pending_count == 0
+
+
+def test_files_are_hashed_once_stable(tmp_path):
+    root = make_new_data(tmp_path / "New_Data")
+    file_path = root / "session" / "001_HAADF_16nm_test.dm3"
+    manifest_watcher = watcher.ManifestWatcher(root, stable_seconds=60)
+    manifest_watcher.scan()
+    assert manifest_watcher.hash_stable_files() == 0
+    assert manifest_watcher.pending_count == 1
+    # the change of the mtime is seen by the next scan or change notification
+    set_age(file_path, 120)
+    manifest_watcher.scan()
+    assert manifest_watcher.hash_stable_files() == 1
+    # a changed file is hashed again
+    file_path.write_bytes(b"b" * 1000)
+    set_age(file_path, 90)
+    manifest_watcher.check_file(file_path)
+    assert manifest_watcher.hash_stable_files() == 1
+    assert manifest.read_export_manifest(root / "session")[file_path.name][0] == manifest.hash_file(file_path)
+
+
+def test_hashes_file_reads_no_data_hashed_by_the_watcher(tmp_path, monkeypatch):
+    root = make_new_data(tmp_path / "New_Data")
+    (root / "session" / "002_HAADF_16nm_test.dm4.part").unlink()
+    (root / "hashes_sstem3_20240312-174501.txt").unlink()
+    manifest_watcher = watcher.ManifestWatcher(root, stable_seconds=0)
+    manifest_watcher.scan()
+    manifest_watcher.hash_stable_files()
+    hashed_paths = list()
+    hash_file = manifest.hash_file
+
+    def recording_hash_file(file_path, *args, **kwargs):
+        hashed_paths.append(file_path)
+        return hash_file(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(manifest, "hash_file", recording_hash_file)
+    hashes_file = manifest_watcher.write_hashes_file()
+    assert hashed_paths == list()
+    assert list(manifest.read_hashes_file(hashes_file)) == ["session/001_HAADF_16nm_test.dm3"]
+
+
+def test_polling_thread_hashes_new_files(tmp_path):
+    root = make_new_data(tmp_path / "New_Data")
+    manifest_watcher = watcher.ManifestWatcher(root, stable_seconds=0, poll_interval=0.05)
+    manifest_watcher.start()
+    try:
+        end = time.monotonic() + 10
+        while not manifest.read_export_manifest(root / "session") and time.monotonic() < end:
+            time.sleep(0.05)
+    finally:
+        manifest_watcher.stop()
+    assert "001_HAADF_16nm_test.dm3" in manifest.read_export_manifest(root / "session")
+
+
+def test_poll_only_lists_directories_that_changed(tmp_path, monkeypatch):
+    root = make_new_data(tmp_path / "New_Data")
+    manifest_watcher = watcher.ManifestWatcher(root, stable_seconds=0)
+    # New_Data and session, not the GoodSync folder
+    assert manifest_watcher.poll() == 2
+    assert manifest_watcher.hash_stable_files() == 1
+    read_directories = list()
+    read_export_manifest = manifest.read_export_manifest
+
+    def recording_read_export_manifest(directory):
+        read_directories.append(directory)
+        return read_export_manifest(directory)
+
+    monkeypatch.setattr(manifest, "read_export_manifest", recording_read_export_manifest)
+    session_path = root / "session"
+    # the running manifest written by the first hash changed the directory once
+    manifest_watcher.poll()
+    assert manifest_watcher.poll() == 0
+    read_directories.clear()
+    (session_path / "003_HAADF_16nm_test.dm3").write_bytes(b"c" * 10)
+    os.utime(session_path, ns=(time.time_ns(), session_path.stat().st_mtime_ns + 1000000000))
+    assert manifest_watcher.poll() == 1
+    # the running manifest of the changed directory is read again
+    assert read_directories == [session_path]
+    assert manifest_watcher.pending_count == 1
+    (session_path / "003_HAADF_16nm_test.dm3").unlink()
+    os.utime(session_path, ns=(time.time_ns(), session_path.stat().st_mtime_ns + 1000000000))
+    assert manifest_watcher.poll() == 1
+    assert manifest_watcher.pending_count == 0